@@ -1,7 +1,13 @@
 import streamlit as st
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
+
+from dataAccess.warmup import start_warmup
+from pageUtils.snapshot import active_snapshot
+
+# Warm the page cache in the background when the app starts, unless the pages
+# are served from a snapshot. The warm-up thread also switches pandas to
+# copy-on-write, so the cache can share its frames between sessions.
+if active_snapshot() is None:
+    start_warmup()
 
 # Set the title of the Streamlit app
 st.title("Enhancing Taxi Services Through Big Data Analytics & Predictive Modeling")
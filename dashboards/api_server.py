@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from dataAccess.aggregates import AGGREGATES, ParameterError, aggregate_etag, load_aggregate
+from dataAccess.concurrent_queries import read_connection
+from dataAccess.connection import DB_PATH
+
+# Local HTTP/JSON API serving the aggregates of the dashboards to other services,
+# see dataAccess/aggregates.py. Run it from the dashboards directory, next to the
+# Streamlit app:
+#
+#     python api_server.py --port 8502
+#     curl 'http://127.0.0.1:8502/hourly-demand?date=2023-09-30&taxi_type=yellow'
+#
+# GET / lists the aggregates and their parameters. Every response carries the
+# ETag of the aggregate's dataset version, and a request whose If-None-Match
+# matches it gets 304 Not Modified without the aggregate being computed. Results
+# are paged with offset and limit; the body has the total number of rows and the
+# URL of the next page, also sent as a Link header.
+
+DEFAULT_PORT = 8502
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+
+def page_etag(tag, offset, limit):
+    # Pages of one result are separate representations
+    return f'"{tag.strip(chr(34))}-{offset}-{limit}"'
+
+
+def etag_matches(header, tag):
+    if header is None:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [candidate.strip().removeprefix('W/') for candidate in header.split(',')]
+    return tag in candidates
+
+
+def page_bounds(query):
+    try:
+        offset = int(query.get('offset', ['0'])[-1])
+        limit = int(query.get('limit', [str(DEFAULT_LIMIT)])[-1])
+    except ValueError:
+        raise ParameterError('offset and limit must be integers') from None
+    if offset < 0 or not 1 <= limit <= MAX_LIMIT:
+        raise ParameterError(f'offset must be 0 or more and limit between 1 and {MAX_LIMIT}')
+    return offset, limit
+
+
+def next_page(path, query, offset, limit, total):
+    if offset + limit >= total:
+        return None
+    query = {name: values[-1] for name, values in query.items()}
+    query.update(offset=offset + limit, limit=limit)
+    return f'{path}?{urlencode(query)}'
+
+
+class AggregateHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        name = url.path.strip('/')
+        if not name:
+            self.send_json(HTTPStatus.OK, {
+                name: {'path': f'/{name}', 'description': description}
+                for name, (_, _, _, description) in AGGREGATES.items()
+            })
+            return
+        if name not in AGGREGATES:
+            self.send_json(HTTPStatus.NOT_FOUND, {'error': f'no aggregate {name}', 'aggregates': list(AGGREGATES)})
+            return
+
+        query = parse_qs(url.query)
+        try:
+            params = AGGREGATES[name][0](query)
+            offset, limit = page_bounds(query)
+        except ParameterError as e:
+            self.send_json(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+            return
+
+        # Conditional requests are answered from the dataset version alone
+        db_path = self.server.db_path
+        tag = page_etag(aggregate_etag(name, params, db_path), offset, limit)
+        if etag_matches(self.headers.get('If-None-Match'), tag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', tag)
+            self.end_headers()
+            return
+
+        try:
+            tag, df = load_aggregate(name, params, lambda: read_connection(db_path), db_path)
+        except Exception as e:
+            # A missing table or a locked database, answered instead of dropping the connection
+            self.log_error('%s failed: %r', name, e)
+            self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f'{name} could not be computed: {e}'})
+            return
+        tag = page_etag(tag, offset, limit)
+        next_url = next_page(url.path, query, offset, limit, len(df))
+        body = {
+            'aggregate': name,
+            'parameters': params,
+            'total': len(df),
+            'offset': offset,
+            'limit': limit,
+            'next': next_url,
+            'data': json.loads(df.iloc[offset:offset + limit].to_json(orient='records', date_format='iso')),
+        }
+        headers = {'ETag': tag, 'Cache-Control': 'no-cache'}
+        if next_url:
+            headers['Link'] = f'<{next_url}>; rel="next"'
+        self.send_json(HTTPStatus.OK, body, headers)
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the dashboard aggregates as JSON over HTTP.')
+    parser.add_argument('--db', default=DB_PATH, help='SQLite database of the dashboards')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on')
+    args = parser.parse_args()
+
+    # The data files are relative to the dashboards directory
+    db_path = os.path.abspath(args.db)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    server = ThreadingHTTPServer((args.host, args.port), AggregateHandler)
+    server.daemon_threads = True
+    server.db_path = db_path
+    print(f'Serving the aggregates of {args.db} on http://{args.host}:{args.port}/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""Load test of the dashboards with concurrent simulated sessions.
+
+Run from the dashboards directory, for example:
+
+    python benchmarks/load_test.py --sessions 8 --rounds 3
+    python benchmarks/load_test.py --sessions 8 --unshared --output load_unshared.json
+
+Every session is a thread that clicks through pages 1 to 7 in order, `rounds`
+times, each page view a complete run of the page script in Streamlit's headless
+test runner. All sessions run in this one process, as they do in a Streamlit
+server, so they share the process-wide page cache. --unshared clears the cache
+before every page view, which is what each session costs when nothing is shared.
+Reports page views per second, latency percentiles per page and overall, and the
+resident memory of the process before and at its peak. Results are written as
+JSON so two runs can be compared.
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import threading
+import time
+
+DASHBOARDS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_OUTPUT = 'benchmarks/results/load_test.json'
+
+sys.path.insert(0, DASHBOARDS_DIR)
+
+from dataAccess.cache import clear_cache
+from dataAccess.memory import memory_usage
+
+from run_benchmarks import git_revision, percentile
+
+
+def page_files(selected=None):
+    pages = sorted(glob.glob(os.path.join(DASHBOARDS_DIR, 'pages', '*.py')))
+    if selected:
+        pages = [page for page in pages if os.path.basename(page).split('_')[0] in selected]
+    return pages
+
+
+def page_label(page_file):
+    return os.path.basename(page_file).split('_')[0]
+
+
+def resident_memory():
+    # Current resident set size in bytes, from /proc on Linux
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+
+def peak_resident_memory():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def share_test_runtime():
+    # The test runner installs a mock runtime for every run and removes it when the
+    # run ends, under the scripts of the other sessions still running. Keep handing
+    # out the last one installed, as a server keeps one runtime for all sessions.
+    from streamlit.runtime import Runtime
+
+    installed = []
+
+    def current(cls):
+        if cls._instance is not None:
+            installed[:] = [cls._instance]
+        return cls._instance or (installed[0] if installed else None)
+
+    def instance(cls):
+        runtime = current(cls)
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: current(cls) is not None)
+
+
+def view_page(page_file, unshared):
+    from streamlit.testing.v1 import AppTest
+
+    if unshared:
+        clear_cache()
+    start = time.perf_counter()
+    at = AppTest.from_file(page_file, default_timeout=600)
+    at.run()
+    return (time.perf_counter() - start) * 1000, bool(at.exception)
+
+
+def run_session(session, pages, rounds, unshared, views, lock):
+    for _ in range(rounds):
+        for page_file in pages:
+            try:
+                elapsed, failed = view_page(page_file, unshared)
+            except Exception:
+                elapsed, failed = None, True
+            with lock:
+                views.append({'session': session, 'page': page_label(page_file), 'ms': elapsed, 'failed': failed})
+
+
+def latency_summary(samples):
+    return {
+        'views': len(samples),
+        'mean_ms': statistics.fmean(samples),
+        'p50_ms': percentile(samples, 50),
+        'p90_ms': percentile(samples, 90),
+        'p99_ms': percentile(samples, 99),
+    }
+
+
+def run_load_test(sessions, rounds, pages, unshared):
+    os.chdir(DASHBOARDS_DIR)
+    share_test_runtime()
+    memory_before = resident_memory()
+    views = []
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=run_session, args=(session, pages, rounds, unshared, views, lock), name=f'session-{session}')
+        for session in range(sessions)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    completed = [view['ms'] for view in views if not view['failed']]
+    by_page = {}
+    for view in views:
+        if not view['failed']:
+            by_page.setdefault(view['page'], []).append(view['ms'])
+    return {
+        'sessions': sessions,
+        'rounds': rounds,
+        'shared': not unshared,
+        'elapsed_s': elapsed,
+        'views': len(views),
+        'failed_views': sum(view['failed'] for view in views),
+        'views_per_second': len(completed) / elapsed,
+        'latency': latency_summary(completed) if completed else None,
+        'pages': {page: latency_summary(samples) for page, samples in sorted(by_page.items())},
+        'rss_before_bytes': memory_before,
+        'rss_after_bytes': resident_memory(),
+        'peak_rss_bytes': peak_resident_memory(),
+        'cache_memory': memory_usage().to_dict(orient='records'),
+    }
+
+
+def print_report(result):
+    mode = 'shared cache' if result['shared'] else 'unshared'
+    print(f"{result['sessions']} sessions x {result['rounds']} rounds, {mode}: {result['views']} page views "
+          f"in {result['elapsed_s']:.1f} s, {result['views_per_second']:.2f} views/s, {result['failed_views']} failed")
+    for page, summary in result['pages'].items():
+        print(f"  page {page}  p50 {summary['p50_ms']:9.0f} ms  p99 {summary['p99_ms']:9.0f} ms")
+    if result['latency']:
+        print(f"  all     p50 {result['latency']['p50_ms']:9.0f} ms  p99 {result['latency']['p99_ms']:9.0f} ms")
+    if result['rss_before_bytes']:
+        print(f"  resident memory {result['rss_before_bytes'] / 2 ** 20:.0f} MiB before, "
+              f"peak {result['peak_rss_bytes'] / 2 ** 20:.0f} MiB")
+    for usage in result['cache_memory']:
+        print(f"  cached {usage['category']:<10} {usage['entries']:4d} entries {usage['bytes'] / 2 ** 20:8.1f} MiB, "
+              f"{usage['evictions']} evicted")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the dashboards with concurrent simulated sessions.')
+    parser.add_argument('--sessions', type=int, default=4, help='concurrent sessions')
+    parser.add_argument('--rounds', type=int, default=2, help='times each session clicks through the pages')
+    parser.add_argument('--pages', help='comma separated page numbers, all pages by default')
+    parser.add_argument('--unshared', action='store_true', help='clear the page cache before every page view')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='JSON file for the results')
+    args = parser.parse_args()
+
+    pages = page_files(args.pages.split(',') if args.pages else None)
+    result = run_load_test(args.sessions, args.rounds, pages, args.unshared)
+    print_report(result)
+
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'result': result,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""Headless benchmarks for the data functions behind every dashboard page.
+
+Run from the dashboards directory, for example:
+
+    python benchmarks/run_benchmarks.py --db nyc_taxi_database.db --repeat 20
+    python benchmarks/run_benchmarks.py --build-scales 1,4,16 --output bench.json
+    python benchmarks/run_benchmarks.py --db nyc_taxi_database.db --compare bench.json
+
+Each function is timed on one connection per database, without any Streamlit rendering.
+Results (latency percentiles and peak traced memory per function and database)
+are written as JSON so two runs can be compared.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataAccess import customer_queries, geospatial_queries, prediction_data, revenue_queries, vendor_data
+from dataAccess.connection import connect_to_database
+from dataAccess.frames import compact_frame
+from dataAccess.zones import load_shapefile, load_zone_lookup
+from dataLoader.generate_synthetic_trips import write_trips_sqlite
+
+GREEN_TRIPDATA_FILEPATH = 'data/dataFiles/green_tripdata_2023-09.parquet'
+DEFAULT_OUTPUT = 'benchmarks/results/bench.json'
+DEFAULT_SCALE_DIR = 'benchmarks/databases'
+
+
+def build_scaled_database(scale, db_path):
+    # Tile the shipped green month `scale` times. The yellow file is not shipped,
+    # so yellow_tripdata gets the same number of synthetic trips.
+    green_trip_df = pd.read_parquet(GREEN_TRIPDATA_FILEPATH)
+    taxi_zone_df = load_zone_lookup()
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    connection = sqlite3.connect(db_path)
+    taxi_zone_df.to_sql('taxi_zone_lookup', connection, index=False)
+    for _ in range(scale):
+        green_trip_df.to_sql('green_tripdata', connection, index=False, if_exists='append')
+    write_trips_sqlite('yellow', scale * len(green_trip_df), connection, taxi_zone_df=taxi_zone_df)
+    connection.commit()
+    connection.close()
+    return db_path
+
+
+def count_trip_rows(connection):
+    rows = 0
+    for table_name in ('yellow_tripdata', 'green_tripdata'):
+        try:
+            rows += connection.execute(f'SELECT COUNT(*) FROM {table_name}').fetchone()[0]
+        except sqlite3.OperationalError:
+            pass
+    return rows
+
+
+def prediction_frame(connection, filepath, kind):
+    # Use the notebook output when it exists, otherwise derive a frame with the
+    # same columns from the green trips so pages 6 and 7 can still be measured
+    if os.path.exists(filepath):
+        return prediction_data.load_predictions(filepath)
+
+    df = pd.read_sql_query('''
+        SELECT
+            PULocationID,
+            DOLocationID,
+            trip_distance,
+            total_amount,
+            lpep_pickup_datetime,
+            lpep_dropoff_datetime
+        FROM green_tripdata
+    ''', connection)
+    pickup = pd.to_datetime(df.pop('lpep_pickup_datetime'))
+    dropoff = pd.to_datetime(df.pop('lpep_dropoff_datetime'))
+    df['day_of_the_month'] = pickup.dt.day
+    df['hour_of_day'] = pickup.dt.hour
+    if kind == 'fare':
+        df['prediction'] = df.pop('total_amount')
+    else:
+        df.pop('total_amount')
+        df['prediction'] = (dropoff - pickup).dt.total_seconds() / 60
+    return compact_frame(df, float32_columns=('prediction',))
+
+
+def benchmark_functions():
+    # (page, name, callable taking the shared context)
+    return [
+        ('1', 'load_pickup_times', lambda ctx: geospatial_queries.load_pickup_times(ctx['connection'])),
+        ('1', 'hourly_demand', lambda ctx: geospatial_queries.hourly_demand(ctx['pickup_times'])),
+        ('1', 'get_top_taxi_locations', lambda ctx: geospatial_queries.load_top_taxi_locations(ctx['connection'])),
+        ('2', 'get_taxi_revenues', lambda ctx: revenue_queries.load_taxi_revenues(ctx['connection'])),
+        ('2', 'get_revenue_vary', lambda ctx: revenue_queries.load_revenue_vary(ctx['connection'])),
+        ('2', 'get_revenue_by_trip_type', lambda ctx: revenue_queries.load_revenue_by_trip_type(ctx['connection'])),
+        ('3', 'passenger_count_trends', lambda ctx: customer_queries.load_passenger_count_trends(ctx['connection'])),
+        ('3', 'ride_sharing_preference_map', lambda ctx: customer_queries.load_ride_sharing_preference(ctx['connection'], ctx['gdf'])),
+        ('3', 'payment_type_distribution', lambda ctx: customer_queries.load_payment_type_distribution(ctx['connection'])),
+        ('3', 'payment_type_by_location', lambda ctx: customer_queries.load_payment_type_by_location(ctx['connection'])),
+        ('3', 'spending_patterns_map', lambda ctx: customer_queries.load_spending_patterns(ctx['connection'], ctx['gdf'])),
+        ('4', 'dominant_service', lambda ctx: vendor_data.dominant_service(ctx['taxi_pref'])),
+        ('4', 'rides_by_service_and_borough', lambda ctx: vendor_data.rides_by_service_and_borough(ctx['taxi_pref'])),
+        ('5', 'plot_predicted_demand_by_borough', lambda ctx: prediction_data.load_predicted_demand_by_borough(ctx['connection'])),
+        ('6', 'taxi_fare_prediction_app', lambda ctx: prediction_data.lookup_mean_prediction(
+            prediction_data.merge_zone_names(ctx['fare_predictions'], ctx['lookup_df']), 'Bay Ridge', 'JFK Airport', 17)),
+        ('6', 'plot_heatmap', lambda ctx: prediction_data.fare_heatmap(ctx['fare_predictions'], ctx['lookup_df'], 0.2)),
+        ('7', 'taxi_trip_duration_prediction_app', lambda ctx: prediction_data.lookup_mean_prediction(
+            prediction_data.merge_zone_names(ctx['duration_predictions'], ctx['lookup_df']), 'Bay Ridge', 'JFK Airport')),
+        ('7', 'plot_heatmap_duration', lambda ctx: prediction_data.trip_duration_heatmap(ctx['duration_predictions'], ctx['lookup_df'], 5)),
+    ]
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def time_function(function, ctx, repeat):
+    # One untimed warm-up run, then `repeat` timed runs
+    function(ctx)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(ctx)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    # Peak memory is traced in a separate run, tracing slows the timed runs down
+    tracemalloc.start()
+    function(ctx)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'repeat': repeat,
+        'mean_ms': statistics.fmean(samples),
+        'min_ms': min(samples),
+        'p50_ms': percentile(samples, 50),
+        'p90_ms': percentile(samples, 90),
+        'p99_ms': percentile(samples, 99),
+        'peak_memory_bytes': peak,
+    }
+
+
+def benchmark_database(db_path, repeat, selected=None):
+    connection = connect_to_database(db_path)
+    ctx = {
+        'connection': connection,
+        'gdf': load_shapefile(),
+        'lookup_df': load_zone_lookup(),
+        'taxi_pref': vendor_data.load_taxi_pref(),
+    }
+    ctx['pickup_times'] = geospatial_queries.load_pickup_times(connection)
+    ctx['fare_predictions'] = prediction_frame(connection, prediction_data.FARE_PREDICTION_CSV, 'fare')
+    ctx['duration_predictions'] = prediction_frame(connection, prediction_data.TRIP_DURATION_PREDICTION_CSV, 'duration')
+    trip_rows = count_trip_rows(connection)
+
+    results = []
+    for page, name, function in benchmark_functions():
+        if selected and name not in selected:
+            continue
+        result = {'database': db_path, 'trip_rows': trip_rows, 'page': page, 'function': name}
+        try:
+            result.update(time_function(function, ctx, repeat))
+        except Exception as e:
+            # Missing tables (e.g. location_prediction) are reported, not fatal
+            message = str(e).strip().splitlines()[-1].strip("': ")
+            result['error'] = f'{type(e).__name__}: {message}'
+        results.append(result)
+        print(format_result(result))
+
+    connection.close()
+    return results
+
+
+def format_result(result):
+    label = f"{os.path.basename(result['database']):<28} page {result['page']}  {result['function']:<34}"
+    if 'error' in result:
+        return f"{label} skipped ({result['error']})"
+    return (f"{label} p50 {result['p50_ms']:9.2f} ms  p99 {result['p99_ms']:9.2f} ms  "
+            f"peak {result['peak_memory_bytes'] / 2 ** 20:8.1f} MiB")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r['trip_rows'], r['function']): r for r in baseline['results'] if 'error' not in r}
+
+    print(f"\nComparison with {baseline_path} (ratio < 1 is faster):")
+    for result in results:
+        before = previous.get((result['trip_rows'], result['function']))
+        if before is None or 'error' in result:
+            continue
+        print(f"{result['trip_rows']:>12} rows  {result['function']:<34} "
+              f"p50 x{result['p50_ms'] / before['p50_ms']:.2f}  "
+              f"p99 x{result['p99_ms'] / before['p99_ms']:.2f}  "
+              f"peak x{result['peak_memory_bytes'] / max(before['peak_memory_bytes'], 1):.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard data functions without Streamlit.')
+    parser.add_argument('--db', action='append', default=[], help='SQLite database to benchmark (repeatable)')
+    parser.add_argument('--build-scales', help='comma separated multiples of the shipped green month to build, e.g. 1,4,16')
+    parser.add_argument('--scale-dir', default=DEFAULT_SCALE_DIR, help='where --build-scales writes its databases')
+    parser.add_argument('--repeat', type=int, default=10, help='timed runs per function')
+    parser.add_argument('--function', action='append', help='only run the named function (repeatable)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='JSON results file')
+    parser.add_argument('--compare', help='previous JSON results file to compare against')
+    args = parser.parse_args()
+
+    databases = list(args.db)
+    if args.build_scales:
+        os.makedirs(args.scale_dir, exist_ok=True)
+        for scale in (int(s) for s in args.build_scales.split(',')):
+            db_path = os.path.join(args.scale_dir, f'scale_{scale}.db')
+            print(f'Building {db_path}')
+            databases.append(build_scaled_database(scale, db_path))
+    if not databases:
+        parser.error('pass --db and/or --build-scales')
+
+    results = []
+    for db_path in databases:
+        results.extend(benchmark_database(db_path, args.repeat, args.function))
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'results': results,
+        }, f, indent=2)
+    print(f'\nWrote {args.output}')
+
+    if args.compare:
+        compare_results(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Cold start times of Home.py and the dashboard pages.
+
+Run from the dashboards directory, for example:
+
+    python benchmarks/startup_time.py --repeat 5
+    python benchmarks/startup_time.py --first-run --output startup.json
+    python benchmarks/startup_time.py --compare benchmarks/results/startup_before.json
+
+Every measurement runs in a fresh Python process, so nothing is already imported.
+import_ms is the time to execute the top-level imports of the page after
+Streamlit itself is loaded. heavy_modules lists the plotting and geospatial
+packages those imports pulled in. With --first-run, first_run_ms is the time of
+a complete first run of the page in Streamlit's headless test runner, data
+loading included. Results are written as JSON so two runs can be compared.
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+DASHBOARDS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_OUTPUT = 'benchmarks/results/startup.json'
+
+# Modules that should only be loaded by the sections that draw with them. Streamlit
+# itself imports plotly.graph_objects, but not plotly.express.
+HEAVY_MODULES = (
+    'pandas', 'geopandas', 'shapely', 'pyproj', 'folium', 'streamlit_folium',
+    'plotly.express', 'matplotlib.pyplot',
+)
+
+IMPORT_PROBE = '''
+import ast, json, sys, time
+sys.path.insert(0, {dashboards!r})
+import streamlit
+with open({page!r}) as f:
+    tree = ast.parse(f.read())
+imports = ast.Module([node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))], [])
+start = time.perf_counter()
+exec(compile(imports, {page!r}, 'exec'), {{'__name__': '__startup_probe__'}})
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{'import_ms': elapsed, 'heavy_modules': sorted(set(sys.modules) & set({heavy!r}))}}))
+'''
+
+FIRST_RUN_PROBE = '''
+import json, sys, time
+sys.path.insert(0, {dashboards!r})
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+at = AppTest.from_file({page!r}, default_timeout=600)
+at.run()
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{'first_run_ms': elapsed, 'failed': bool(at.exception)}}))
+'''
+
+
+def page_files():
+    return ['Home.py'] + sorted(glob.glob('pages/*.py'))
+
+
+def run_probe(template, page):
+    code = template.format(dashboards=DASHBOARDS_DIR, page=os.path.abspath(page), heavy=HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=DASHBOARDS_DIR, text=True, stderr=subprocess.DEVNULL)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_page(page, repeat, first_run):
+    probes = [run_probe(IMPORT_PROBE, page) for _ in range(repeat)]
+    result = {
+        'page': page,
+        'import_ms': statistics.median(p['import_ms'] for p in probes),
+        'heavy_modules': probes[0]['heavy_modules'],
+    }
+    if first_run:
+        run = run_probe(FIRST_RUN_PROBE, page)
+        result['first_run_ms'] = run['first_run_ms']
+        result['failed'] = run['failed']
+    return result
+
+
+def compare_results(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {r['page']: r for r in baseline['results']}
+
+    print(f"\nComparison with {baseline_path} (ratio < 1 is faster):")
+    for result in results:
+        before = previous.get(result['page'])
+        if before is None:
+            continue
+        line = f"{result['page']:<52} imports x{result['import_ms'] / before['import_ms']:.2f}"
+        if 'first_run_ms' in result and 'first_run_ms' in before:
+            line += f"  first run x{result['first_run_ms'] / before['first_run_ms']:.2f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the cold start time of every dashboard page.')
+    parser.add_argument('--page', action='append', help='only measure this page file (repeatable)')
+    parser.add_argument('--repeat', type=int, default=3, help='fresh processes per page for the import time')
+    parser.add_argument('--first-run', action='store_true', help='also time a complete first run of each page')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='JSON results file')
+    parser.add_argument('--compare', help='previous JSON results file to compare against')
+    args = parser.parse_args()
+
+    results = []
+    for page in args.page or page_files():
+        result = measure_page(page, args.repeat, args.first_run)
+        results.append(result)
+        line = f"{page:<52} imports {result['import_ms']:8.0f} ms"
+        if args.first_run:
+            line += f"  first run {result['first_run_ms']:8.0f} ms"
+        print(f"{line}  heavy: {', '.join(result['heavy_modules']) or '-'}")
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'results': results,
+        }, f, indent=2)
+    print(f'\nWrote {args.output}')
+
+    if args.compare:
+        compare_results(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
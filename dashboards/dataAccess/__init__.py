@@ -0,0 +1,3 @@
+# Data access layer shared by the dashboard pages, the loaders and the benchmarks.
+# Every function in here returns plain DataFrames and never touches Streamlit,
+# so it can be called headless.
@@ -0,0 +1,204 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from dataAccess.cache import source_version
+from dataAccess.demand_cube import DEMAND_CUBE_DIR, MANIFEST as CUBE_MANIFEST
+from dataAccess.geospatial_queries import cube_hourly_demand, hourly_demand, load_pickup_times
+from dataAccess.memory import budget
+from dataAccess.od_matrix import MANIFEST, OD_MATRIX_DIR
+from dataAccess.partitions import day_range, month_range, timestamp_literal
+from dataAccess.prediction_data import FARE_PREDICTION_CSV, load_predictions
+from dataAccess.revenue_queries import load_revenue_by_zone
+from dataAccess.vendor_data import TAXI_STATS_CSV, load_taxi_data
+
+# The aggregates the dashboards compute, for other services through api_server.py.
+# Every aggregate is a function of a read-only connection and its parsed query
+# parameters returning one DataFrame, and names the files it is computed from.
+# Their modification times and sizes are the dataset version: the version, the
+# aggregate and its parameters make the ETag, so a client polling with
+# If-None-Match gets a 304 after a few stat calls, without any query being run.
+# Results are kept per aggregate and parameters until the version changes, so the
+# pages of a large result are sliced from one computation. They are charged to the
+# memory budget of dataAccess/memory.py, which can drop them earlier.
+
+DATABASE = 'database'
+MAX_RESULTS = 64
+
+_results = OrderedDict()
+_lock = threading.Lock()
+
+
+class ParameterError(ValueError):
+    pass
+
+
+def _one(query, name, default=None):
+    # Last value of a parameter in a parse_qs dict
+    values = query.get(name)
+    return values[-1] if values else default
+
+
+def _integer(query, name, low, high, default=None):
+    value = _one(query, name)
+    if value is None:
+        if default is None:
+            raise ParameterError(f'{name} is required')
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ParameterError(f'{name} must be an integer') from None
+    if not low <= number <= high:
+        raise ParameterError(f'{name} must be between {low} and {high}')
+    return number
+
+
+def _timestamp(value, name):
+    try:
+        return pd.Timestamp(value)
+    except ValueError:
+        raise ParameterError(f'{name} is not a date: {value}') from None
+
+
+def _month(query):
+    month = _one(query, 'month', '2023-09')
+    try:
+        return pd.Period(month, freq='M').strftime('%Y-%m')
+    except ValueError:
+        raise ParameterError(f'month is not a month: {month}') from None
+
+
+def hourly_demand_params(query):
+    # One of date, month or start and end (exclusive), September 2023 by default
+    if _one(query, 'date'):
+        start, end = day_range(_timestamp(_one(query, 'date'), 'date'))
+    elif _one(query, 'start') or _one(query, 'end'):
+        if not (_one(query, 'start') and _one(query, 'end')):
+            raise ParameterError('start and end go together')
+        start = timestamp_literal(_timestamp(_one(query, 'start'), 'start'))
+        end = timestamp_literal(_timestamp(_one(query, 'end'), 'end'))
+    else:
+        start, end = month_range(_month(query))
+    taxi_types = sorted(set(_one(query, 'taxi_type', 'yellow,green').split(',')))
+    unknown = set(taxi_types) - {'yellow', 'green'}
+    if unknown:
+        raise ParameterError(f"unknown taxi_type {', '.join(sorted(unknown))}")
+    return {'start': start, 'end': end, 'taxi_types': tuple(taxi_types)}
+
+
+def load_hourly_demand(connection, start, end, taxi_types):
+    # Trips per pickup hour and taxi type, as on the geospatial page
+    demand = cube_hourly_demand(connection, start, end, taxi_types)
+    if demand is None:
+        df = load_pickup_times(connection, start=start, end=end)
+        demand = hourly_demand(df[df['taxi_type'].isin(taxi_types)])
+    return demand.rename(columns={'Number of Trips': 'trips'}).astype({'taxi_type': str})
+
+
+def revenue_by_zone_params(query):
+    return {'month': _month(query)}
+
+
+def vendor_stats_params(query):
+    return {'borough': _one(query, 'borough'), 'service': _one(query, 'service')}
+
+
+def load_vendor_stats(connection, borough, service):
+    # Averages per borough and service of dataLoader/create_taxi_stats_table.py
+    df = load_taxi_data()
+    if borough:
+        df = df[df['Borough'].astype(str).str.lower() == borough.lower()]
+    if service:
+        df = df[df['Service'].astype(str).str.lower() == service.lower()]
+    return df.astype({'Borough': str, 'Service': str}).reset_index(drop=True)
+
+
+def fare_params(query):
+    hour = _one(query, 'hour')
+    return {
+        'pickup': _integer(query, 'pickup', 1, 265),
+        'dropoff': _integer(query, 'dropoff', 1, 265),
+        'hour': None if hour is None else _integer(query, 'hour', 0, 23),
+    }
+
+
+def load_fare(connection, pickup, dropoff, hour):
+    # Mean predicted fare of a pickup and drop-off zone pair per hour of the day,
+    # the figure of the fare prediction page
+    df = load_predictions(FARE_PREDICTION_CSV)
+    mask = (df['PULocationID'] == pickup) & (df['DOLocationID'] == dropoff)
+    if hour is not None:
+        mask &= df['hour_of_day'] == hour
+    fares = df[mask].groupby('hour_of_day')['prediction'].agg(['mean', 'size'])
+    return pd.DataFrame({
+        'hour': fares.index.astype('int64'),
+        'fare': fares['mean'].astype('float64').round(2),
+        'predictions': fares['size'].astype('int64'),
+    }).reset_index(drop=True)
+
+
+# Path: (parameter parser, loader, source files, description)
+AGGREGATES = {
+    'hourly-demand': (hourly_demand_params, load_hourly_demand, (DATABASE, os.path.join(DEMAND_CUBE_DIR, CUBE_MANIFEST)),
+                      'Trips per pickup hour and taxi type. date=YYYY-MM-DD, month=YYYY-MM or start and end, taxi_type=yellow,green'),
+    'revenue-by-zone': (revenue_by_zone_params, load_revenue_by_zone,
+                        (DATABASE, os.path.join(OD_MATRIX_DIR, MANIFEST), os.path.join(DEMAND_CUBE_DIR, CUBE_MANIFEST)),
+                        'Revenue of every zone counted at pickup and drop-off, highest first. month=YYYY-MM'),
+    'vendor-stats': (vendor_stats_params, load_vendor_stats, (TAXI_STATS_CSV,),
+                     'Average fare, distance and time per borough and service. borough, service'),
+    'fare': (fare_params, load_fare, (FARE_PREDICTION_CSV,),
+             'Mean predicted fare of a zone pair per hour. pickup and dropoff LocationIDs, hour'),
+}
+
+
+def dataset_version(sources, db_path):
+    # Modification time and size of every source, None for a missing file
+    paths = [db_path if source == DATABASE else source for source in sources]
+    return tuple(source_version(path) if os.path.exists(path) else None for path in paths)
+
+
+def etag(name, params, version):
+    digest = hashlib.sha1(repr((name, sorted(params.items()), version)).encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def aggregate_etag(name, params, db_path):
+    _, _, sources, _ = AGGREGATES[name]
+    return etag(name, params, dataset_version(sources, db_path))
+
+
+def load_aggregate(name, params, connect, db_path):
+    # (ETag, DataFrame) of an aggregate, computed on a connection from connect()
+    # unless the last result for these parameters is still current
+    _, loader, sources, _ = AGGREGATES[name]
+    tag = etag(name, params, dataset_version(sources, db_path))
+    key = (name, tuple(sorted(params.items())))
+    with _lock:
+        entry = _results.get(key)
+        if entry is not None and entry[0] == tag:
+            _results.move_to_end(key)
+            budget.touch('api', key)
+            return entry
+    connection = connect()
+    start = time.perf_counter()
+    try:
+        entry = (tag, loader(connection, **params))
+    finally:
+        connection.close()
+    if budget.charge('api', key, entry[1], time.perf_counter() - start, lambda: _evict(key, entry)):
+        with _lock:
+            _results[key] = entry
+            while len(_results) > MAX_RESULTS:
+                budget.release('api', _results.popitem(last=False)[0])
+    return entry
+
+
+def _evict(key, entry):
+    with _lock:
+        if _results.get(key) is entry:
+            del _results[key]
@@ -0,0 +1,118 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from dataAccess.connection import run_query
+
+# Approximate answers from the stratified samples built by dataLoader/build_trip_samples.py.
+# Every (service, month, pickup zone) stratum keeps a random ordering of its trips;
+# a row belongs to the sample at rate r when its inclusion_rate is below r, which
+# gives each stratum max(min_rows, ceil(r * N)) rows. Totals are estimated per
+# stratum and added up, with the usual stratified variance, so every count, sum
+# or average comes with a 95% confidence interval.
+
+SAMPLE_TABLE = 'trip_samples'
+SAMPLE_INFO_TABLE = 'trip_sample_info'
+STRATUM_COLUMNS = ['service', 'month', 'PULocationID']
+
+# Two-sided 95% normal quantile
+Z_95 = 1.959964
+
+
+def sample_info(connection):
+    # Build parameters of the samples, or None when they have not been built
+    try:
+        row = connection.execute(f'SELECT max_rate, min_rows FROM {SAMPLE_INFO_TABLE}').fetchone()
+    except sqlite3.OperationalError:
+        return None
+    if row is None:
+        return None
+    return {'max_rate': row[0], 'min_rows': row[1]}
+
+
+def load_samples(connection, services, months, rate):
+    # Sample rows of the given services and months at `rate`, with the size of their
+    # stratum in the data (population_rows) and in the sample (sample_rows)
+    services, months = list(services), list(months)
+    if not services or not months:
+        return pd.DataFrame(columns=STRATUM_COLUMNS + ['DOLocationID', 'pickup_datetime', 'total_amount', 'population_rows', 'sample_rows'])
+
+    placeholders = lambda values: ', '.join('?' * len(values))
+    query = f'''
+        SELECT service, month, PULocationID, DOLocationID, pickup_datetime, total_amount, population_rows
+        FROM {SAMPLE_TABLE}
+        WHERE service IN ({placeholders(services)})
+          AND month IN ({placeholders(months)})
+          AND inclusion_rate < ?
+    '''
+    df = run_query(connection, query, services + months + [rate], name='trip_samples')
+    df['sample_rows'] = df.groupby(STRATUM_COLUMNS, dropna=False)['service'].transform('size')
+    df['pickup_datetime'] = pd.to_datetime(df['pickup_datetime'], format='ISO8601')
+    return df
+
+
+def _strata(samples):
+    return samples.groupby(STRATUM_COLUMNS, dropna=False)[['population_rows', 'sample_rows']].first()
+
+
+def _stratum_terms(contributions, strata, value):
+    # Per (stratum, group): sum and sum of squares of the per-row contributions.
+    # Rows of the stratum that do not contribute to the group count as zeros.
+    per_row = contributions.groupby(STRATUM_COLUMNS + ['row', 'group'], dropna=False)[value].sum()
+    terms = pd.DataFrame({'total': per_row, 'squares': per_row ** 2})
+    terms = terms.groupby(level=STRATUM_COLUMNS + ['group'], dropna=False).sum()
+    return terms.join(strata, on=STRATUM_COLUMNS)
+
+
+def _variance(terms, total, squares):
+    # N^2 (1 - n/N) s^2 / n for each stratum, s^2 being the sample variance within it
+    n = terms['sample_rows']
+    N = terms['population_rows']
+    s2 = ((squares - total ** 2 / n) / (n - 1)).where(n > 1, 0.0).clip(lower=0)
+    return N ** 2 * (1 - n / N) * s2 / n
+
+
+def estimate_totals(contributions, samples, value='value'):
+    # contributions: one row per (sample row, group) with the row's contribution
+    # `value` to the group, plus the stratum columns and a 'row' id.
+    # Returns the estimated total per group with its 95% margin.
+    terms = _stratum_terms(contributions, _strata(samples), value)
+    terms['estimate'] = terms['population_rows'] * terms['total'] / terms['sample_rows']
+    terms['variance'] = _variance(terms, terms['total'], terms['squares'])
+    result = terms.groupby(level='group', dropna=False)[['estimate', 'variance']].sum()
+    result['margin'] = Z_95 * np.sqrt(result.pop('variance'))
+    return result.reset_index()
+
+
+def estimate_means(contributions, samples, value='value'):
+    # Mean of `value` over the rows of each group, as the ratio of the estimated
+    # sum to the estimated count, with the linearized variance of the ratio
+    per_row = contributions.groupby(STRATUM_COLUMNS + ['row', 'group'], dropna=False)[value].agg(['sum', 'size'])
+    per_row.columns = ['y', 'x']
+    per_row['yy'] = per_row['y'] ** 2
+    per_row['xy'] = per_row['x'] * per_row['y']
+    per_row['xx'] = per_row['x'] ** 2
+    terms = per_row.groupby(level=STRATUM_COLUMNS + ['group'], dropna=False).sum().join(_strata(samples), on=STRATUM_COLUMNS)
+
+    weight = terms['population_rows'] / terms['sample_rows']
+    totals = pd.DataFrame({'y': weight * terms['y'], 'x': weight * terms['x']}).groupby(level='group', dropna=False).sum()
+    ratio = totals['y'] / totals['x']
+
+    # Residuals y - R x within each stratum
+    r = ratio.reindex(terms.index.get_level_values('group')).to_numpy()
+    residual_total = terms['y'] - r * terms['x']
+    residual_squares = terms['yy'] - 2 * r * terms['xy'] + r ** 2 * terms['xx']
+    variance = _variance(terms, residual_total, residual_squares).groupby(level='group', dropna=False).sum()
+
+    result = pd.DataFrame({'estimate': ratio, 'margin': Z_95 * np.sqrt(variance) / totals['x']})
+    return result.reset_index()
+
+
+def months_in_range(start, end):
+    # 'YYYY-MM' strata overlapping [start, end)
+    start = pd.Timestamp(start)
+    last = pd.Timestamp(end) - pd.Timedelta(microseconds=1)
+    if last < start:
+        return []
+    return [str(period) for period in pd.period_range(start, last, freq='M')]
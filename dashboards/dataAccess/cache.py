@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+from dataAccess.concurrent_queries import database_path
+from dataAccess.memory import budget
+
+# Process-wide cache for the data the pages load. Streamlit serves every session
+# from the same process, so a result computed once (by a visitor or by the
+# warm-up thread in dataAccess/warmup.py) is reused by all later page runs.
+# Entries are keyed by loader, arguments and source file, and stamped with the
+# source file's version: an ingest rewrites the database file, which changes the
+# version and makes the next call reload.
+#
+# The cached frames, GeoDataFrames included, are shared read-only by every
+# session. With pandas' copy-on-write mode, which the app's warm-up thread
+# switches on through enable_copy_on_write, callers get shallow copies that share
+# the column buffers of the cached frame, so memory does not grow with the number
+# of sessions, and a column is only copied when a page modifies it. Without it
+# they get deep copies. Either way no page can change what another one sees.
+#
+# Every entry is charged to the memory budget of dataAccess/memory.py with the
+# time its loader took, under the category of its loader's module, and dropped
+# when the budget needs the room.
+
+# Memory budget category of the loaders of each module, 'queries' for the others
+CATEGORIES = {
+    'dataAccess.zones': 'geometry',
+    'dataAccess.vendor_data': 'datasets',
+    'dataAccess.prediction_data': 'datasets',
+    'dataAccess.vendor_rollup': 'rollups',
+    'dataAccess.demand_cube': 'rollups',
+}
+
+_entries = {}
+_key_locks = {}
+_lock = threading.Lock()
+
+
+def enable_copy_on_write():
+    # Process-wide, so it is left to the app rather than done on import, which
+    # would change the option for every script using the data modules
+    pd.set_option('mode.copy_on_write', True)
+
+
+def source_version(path):
+    # Modification time and size of a database or data file
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _copy(result):
+    if isinstance(result, pd.DataFrame):
+        return result.copy(deep=not pd.get_option('mode.copy_on_write'))
+    if isinstance(result, tuple):
+        return tuple(_copy(item) for item in result)
+    if isinstance(result, list):
+        return [_copy(item) for item in result]
+    if isinstance(result, dict):
+        return {name: _copy(item) for name, item in result.items()}
+    return result
+
+
+def _key_lock(key):
+    with _lock:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def cached_call(source, loader, *args, **kwargs):
+    # loader(*args, **kwargs), reused while `source` keeps the same version.
+    # Concurrent callers of the same key wait for the first one to finish.
+    key = (loader.__module__, loader.__qualname__, source, tuple(sorted(kwargs.items())))
+    category = CATEGORIES.get(loader.__module__, 'queries')
+    with _key_lock(key):
+        version = source_version(source)
+        entry = _entries.get(key)
+        if entry is None or entry[0] != version:
+            start = time.perf_counter()
+            entry = (version, loader(*args, **kwargs))
+            kept = budget.charge(category, key, entry[1], time.perf_counter() - start, lambda: _evict(key, entry))
+            with _lock:
+                if kept:
+                    _entries[key] = entry
+                else:
+                    _entries.pop(key, None)
+        else:
+            budget.touch(category, key)
+    return _copy(entry[1])
+
+
+def _evict(key, entry):
+    # Drop the entry the budget evicted, unless it has been reloaded since
+    with _lock:
+        if _entries.get(key) is entry:
+            del _entries[key]
+
+
+def cached(loader, **kwargs):
+    # loader(connection, **kwargs) cached per database file, as a loader for
+    # dataAccess.concurrent_queries.fetch_concurrently
+    def load(connection):
+        db_path = database_path(connection)
+        if not db_path:
+            return loader(connection, **kwargs)
+        return cached_call(db_path, loader, connection, **kwargs)
+
+    load.__name__ = loader.__name__
+    return load
+
+
+def clear_cache():
+    with _lock:
+        keys = list(_entries)
+        _entries.clear()
+    for key in keys:
+        budget.release(CATEGORIES.get(key[0], 'queries'), key)
@@ -0,0 +1,56 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from dataAccess import profiling
+from dataAccess.connection import run_query
+
+# Concurrent fetching of independent, read-only data. A page declares the loaders
+# it needs up front and fetch_concurrently runs each on a thread pool with its own
+# read-only connection to the same database file. sqlite3 releases the GIL while
+# SQLite executes a statement, so the queries overlap and the fetch takes about
+# as long as the slowest loader rather than the sum of all of them.
+
+MAX_WORKERS = 4
+
+
+def database_path(connection):
+    # File behind the main database of a connection, '' for in-memory databases
+    for _, name, path in connection.execute('PRAGMA database_list').fetchall():
+        if name == 'main':
+            return path
+    return ''
+
+
+def read_connection(db_path):
+    return sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+
+
+def fetch_concurrently(connection, loaders, max_workers=MAX_WORKERS):
+    # loaders: {name: function(connection)}. Returns {name: result}. In-memory
+    # databases cannot be shared between connections, so they run one by one.
+    db_path = database_path(connection)
+    if not db_path or len(loaders) < 2:
+        return {name: loader(connection) for name, loader in loaders.items()}
+
+    context = profiling.run_context()
+
+    def run(loader):
+        profiling.adopt_run_context(context)
+        reader = read_connection(db_path)
+        try:
+            return loader(reader)
+        finally:
+            reader.close()
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(loaders))) as executor:
+        futures = {name: executor.submit(run, loader) for name, loader in loaders.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def run_queries(connection, queries, max_workers=MAX_WORKERS):
+    # queries: {name: sql} or {name: (sql, params)}. Returns {name: DataFrame}.
+    loaders = {}
+    for name, query in queries.items():
+        sql, params = query if isinstance(query, tuple) else (query, None)
+        loaders[name] = lambda reader, sql=sql, params=params, name=name: run_query(reader, sql, params, name=name)
+    return fetch_concurrently(connection, loaders, max_workers)
@@ -0,0 +1,18 @@
+import sqlite3
+
+import pandas as pd
+
+from dataAccess.profiling import profile_query
+
+# Default SQLite database path, relative to the dashboards directory
+DB_PATH = 'nyc_taxi_database.db'
+
+
+def connect_to_database(db_path=DB_PATH):
+    # Connect to SQLite database
+    return sqlite3.connect(db_path)
+
+
+def run_query(connection, query, params=None, name='query'):
+    # Single entry point for every dashboard query, profiled when profiling is on
+    return profile_query(connection, name, query, params, lambda: pd.read_sql_query(query, connection, params=params))
@@ -0,0 +1,163 @@
+import pandas as pd
+
+from dataAccess.cache import cached
+from dataAccess.connection import run_query
+from dataAccess.quantiles import load_percentiles, sketches_available
+from dataAccess.trips import TAXI_CODES, trips_available
+from dataAccess.zones import load_shapefile
+
+PASSENGER_COUNT_QUERY = "SELECT passenger_count, COUNT(*) as num_rides FROM {yellow_trips} WHERE passenger_count BETWEEN 1 AND 4 GROUP BY passenger_count"
+
+RIDE_SHARING_QUERY = """
+SELECT
+    tz.LocationID,
+    tz.Borough,
+    tz.Zone,
+    COALESCE(COUNT(CASE WHEN yt.Passenger_count = 1 THEN 1 END), 0) AS IndividualRides,
+    COALESCE(COUNT(CASE WHEN yt.Passenger_count > 1 THEN 1 END), 0) AS SharedRides,
+    COALESCE(MAX(yt.Passenger_count), 0) AS MaxPassengerCount,
+    CASE
+        WHEN COALESCE(SUM(CASE WHEN yt.Passenger_count > 1 THEN 1 ELSE 0 END), 0) = 0 THEN 0
+        ELSE (COALESCE(SUM(CASE WHEN yt.Passenger_count > 1 THEN 1 ELSE 0 END), 0) * 100.0) / COALESCE(SUM(CASE WHEN yt.Passenger_count > 0 THEN 1 ELSE 0 END), 1)
+    END AS SharedPercentage
+FROM
+    taxi_zone_lookup tz
+LEFT JOIN
+    {yellow_trips} yt ON yt.PULocationID = tz.LocationID
+GROUP BY
+    tz.LocationID, tz.Borough, tz.Zone
+HAVING
+    SharedPercentage > 0 AND SharedPercentage < 100;
+"""
+
+PAYMENT_TYPE_QUERY = """
+    SELECT 
+        CASE 
+            WHEN payment_type = 1 THEN 'Credit Card'
+            WHEN payment_type = 2 THEN 'Cash'
+            ELSE 'Others'
+        END as PaymentCategory,
+        COUNT(*) as Count
+    FROM {yellow_trips}
+    GROUP BY PaymentCategory
+"""
+
+PAYMENT_TYPE_BY_LOCATION_QUERY = """
+    SELECT 
+        tzl.Borough,
+        CASE 
+            WHEN ytd.Payment_type = 1 THEN 'Credit Card'
+            WHEN ytd.Payment_type = 2 THEN 'Cash'
+            ELSE 'Others (No charge, Dispute, Unknown, Voided trip)'
+        END as PaymentCategory,
+        COUNT(*) as Count
+    FROM {yellow_trips} ytd
+    JOIN taxi_zone_lookup tzl ON ytd.PULocationID = tzl.LocationID
+    GROUP BY tzl.Borough, PaymentCategory;
+"""
+
+SPENDING_PATTERNS_QUERY = """
+SELECT
+    tz.LocationID,
+    tz.Borough,
+    tz.Zone,
+    COALESCE(AVG(yt.total_amount), 0) AS AvgTotalSpendingAmount
+FROM
+    taxi_zone_lookup tz
+LEFT JOIN
+    {yellow_trips} yt ON yt.PULocationID = tz.LocationID
+GROUP BY
+    tz.LocationID, tz.Borough, tz.Zone
+HAVING
+    AvgTotalSpendingAmount > 0;  -- Exclude locations with AvgTotalSpendingAmount of 0
+"""
+
+
+def yellow_query(connection, query):
+    # Fill {yellow_trips} with the yellow taxi trips of the trips table when it is
+    # built, under the yellow_tripdata column names, or with yellow_tripdata itself.
+    # These rollups read every yellow trip and columns no index covers, so the unary
+    # + keeps SQLite scanning the table instead of looking up each row from an index.
+    if trips_available(connection):
+        source = f'''(
+            SELECT PULocationID, passenger_count, payment_type, total_fare AS total_amount
+            FROM trips
+            WHERE +service = {TAXI_CODES['yellow']}
+        )'''
+    else:
+        source = 'yellow_tripdata'
+    return query.format(yellow_trips=source)
+
+
+def load_passenger_count_trends(connection):
+    return run_query(connection, yellow_query(connection, PASSENGER_COUNT_QUERY), name='passenger_count')
+
+
+def top_and_bottom_locations(merged_gdf, column):
+    # Highlight top 5 locations with the highest value in one color
+    top5_high = merged_gdf.nlargest(5, column)
+    top5_high['highlight_color'] = 'green'
+
+    # Highlight top 5 locations with the lowest value in another color
+    top5_low = merged_gdf.nsmallest(5, column)
+    top5_low['highlight_color'] = 'red'
+
+    # Combine the highlighted DataFrames
+    highlighted_gdf = pd.concat([top5_high, top5_low])
+    return top5_high, top5_low, highlighted_gdf
+
+
+def load_ride_sharing_preference(connection, gdf=None):
+    if gdf is None:
+        gdf = load_shapefile()
+
+    data = run_query(connection, yellow_query(connection, RIDE_SHARING_QUERY), name='ride_sharing')
+
+    # Merge the data with the GeoDataFrame
+    return gdf.merge(data, how='left', left_on='LocationID', right_on='LocationID')
+
+
+def load_payment_type_distribution(connection):
+    return run_query(connection, yellow_query(connection, PAYMENT_TYPE_QUERY), name='payment_type')
+
+
+def load_payment_type_by_location(connection):
+    result = run_query(connection, yellow_query(connection, PAYMENT_TYPE_BY_LOCATION_QUERY), name='payment_type_by_location')
+
+    # Calculate percentage for each payment category within each pickup location
+    result['Percentage'] = result.groupby('Borough')['Count'].transform(lambda x: x / x.sum() * 100)
+    return result
+
+
+def load_spending_patterns(connection, gdf=None):
+    if gdf is None:
+        gdf = load_shapefile()
+
+    data = run_query(connection, yellow_query(connection, SPENDING_PATTERNS_QUERY), name='spending_patterns')
+
+    # Merge the data with the GeoDataFrame
+    return gdf.merge(data, how='left', left_on='LocationID', right_on='LocationID')
+
+
+def load_spending_percentiles(connection):
+    # Percentiles of the same trips as the spending map, yellow taxi total amounts
+    # by pickup borough and zone, or None when the quantile sketches are not built
+    if not sketches_available(connection):
+        return None
+    yellow = {'quantiles': (0.5, 0.9, 0.95), 'where': 'service = ?', 'params': ('Yellow Taxi',)}
+    by_borough = load_percentiles(connection, 'fare', ['Borough'], **yellow)
+    by_zone = load_percentiles(connection, 'fare', ['PULocationID', 'Zone', 'Borough'], **yellow)
+    return by_borough, by_zone
+
+
+def customer_page_loaders():
+    # Data of the customer behavior page, for dataAccess.concurrent_queries.fetch_concurrently.
+    # Loaders are cached, so the warm-up thread and the page share their results.
+    return {
+        'passenger_count': cached(load_passenger_count_trends),
+        'ride_sharing': cached(load_ride_sharing_preference),
+        'payment_type': cached(load_payment_type_distribution),
+        'payment_type_by_location': cached(load_payment_type_by_location),
+        'spending_percentiles': cached(load_spending_percentiles),
+        'spending_patterns': cached(load_spending_patterns),
+    }
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pandas as pd
+
+from dataAccess.concurrent_queries import database_path
+from dataAccess.connection import run_query
+from dataAccess.memory import budget
+from dataAccess.trips import TRIPS_TABLE, last_trip_rowid, trips_generation
+
+# Rollups of the trips table refreshed from the rows appended since they were
+# last computed, for pages open while dataLoader/stream_trips.py is ingesting.
+# Trips are only ever appended, so the rows a micro-batch added are a rowid range.
+# A rollup remembers the last rowid it has counted. When the table has grown, the
+# same query runs again over the new rowids only, and its groups are added to the
+# previous result. This only works for additive measures (sums and counts per
+# group). A rebuild of the table restarts the rowids and the batch log, which
+# makes the next refresh recompute the rollup in full.
+#
+# The query is pointed at a range of rowids by a common table expression named
+# like the trips table, so the same SQL serves both cases. The full run stops at
+# the rowid it records, so rows appended meanwhile are counted once, by the next
+# delta; the unary + keeps that bound from replacing the query's own index. A
+# delta is materialized from the rowid range first, so SQLite reads the new rows
+# directly instead of the month's index range.
+#
+# Rollups are charged to the memory budget of dataAccess/memory.py with the time
+# of their full computation. An evicted rollup is recomputed in full on its next
+# refresh.
+
+_rollups = {}
+_lock = threading.Lock()
+
+
+def rowid_range_query(query, last_rowid, first_rowid=None):
+    # query, reading the trips up to last_rowid, or only those after first_rowid
+    if first_rowid is None:
+        trips = f'SELECT * FROM main.{TRIPS_TABLE} WHERE +rowid <= {last_rowid}'
+    else:
+        trips = f'SELECT * FROM main.{TRIPS_TABLE} WHERE rowid > {first_rowid} AND rowid <= {last_rowid}'
+    materialize = '' if first_rowid is None else 'MATERIALIZED '
+    return f'''
+        WITH {TRIPS_TABLE} AS {materialize}({trips})
+        {query}
+    '''
+
+
+def merge_groups(frame, delta, keys):
+    # Measures of the same group are added, an all-NULL sum stays NULL
+    merged = pd.concat([frame, delta], ignore_index=True)
+    return merged.groupby(keys, as_index=False, sort=True).sum(min_count=1)
+
+
+class DeltaRollup:
+
+    def __init__(self, query, keys, name):
+        self.query = query
+        self.keys = list(keys)
+        self.name = name
+        self.frame = None
+        self.generation = None
+        self.watermark = 0
+        self.cost = 0.0
+        self.lock = threading.Lock()
+
+    def refresh(self, connection, key):
+        with self.lock:
+            generation = trips_generation(connection)
+            last_rowid = last_trip_rowid(connection)
+            start = time.perf_counter()
+            if self.frame is None or generation != self.generation or last_rowid < self.watermark:
+                self.frame = run_query(connection, rowid_range_query(self.query, last_rowid), name=self.name)
+                self.cost = time.perf_counter() - start
+            elif last_rowid > self.watermark:
+                query = rowid_range_query(self.query, last_rowid, first_rowid=self.watermark)
+                delta = run_query(connection, query, name=f'{self.name}_delta')
+                self.frame = merge_groups(self.frame, delta, self.keys)
+            self.generation = generation
+            self.watermark = last_rowid
+            frame = self.frame.copy()
+        if not budget.charge('rollups', key, frame, self.cost, lambda: _evict(key, self)):
+            _evict(key, self)
+        return frame
+
+
+def _evict(key, rollup):
+    with _lock:
+        if _rollups.get(key) is rollup:
+            del _rollups[key]
+
+
+def delta_rollup(connection, query, keys, name='query'):
+    # Result of an additive GROUP BY query over the trips table, grouped by keys,
+    # kept per database and query until the memory budget needs the room
+    key = (database_path(connection), query)
+    with _lock:
+        rollup = _rollups.get(key)
+        if rollup is None:
+            rollup = _rollups[key] = DeltaRollup(query, keys, name)
+    return rollup.refresh(connection, key)
@@ -0,0 +1,262 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataAccess.cache import cached_call
+from dataAccess.quality import CLEAN_TRIPS
+from dataAccess.trips import (SECONDS_PER_DAY, SECONDS_PER_HOUR, SERVICE_CODES, TRIPS_TABLE, last_trip_rowid,
+                              trips_available, trips_generation)
+
+# Pickups and revenue of the trips table per (pickup day, measure, service, pickup
+# hour, zone) in one memory-mapped float64 array, built by
+# dataLoader/build_demand_cube.py and kept up to date by dataLoader/stream_trips.py.
+# The hourly demand of the geospatial page and the revenue trends, hours, weekdays
+# and zones of the revenue page are sums over slices of it, so they are NumPy
+# reductions over the days they cover instead of queries.
+#
+# The array is a raw file next to a JSON manifest naming the file and its axes:
+# the days in the order of their slots, the measures, the service codes, the 24
+# hours and the zones, indexed by LocationID with 0 for trips without a valid zone.
+# Pickups and revenue are counted at the pickup zone, drop-offs and drop-off
+# revenue at the drop-off zone, all at the pickup day and hour. The clean_ measures
+# count the same for the trips breaking no data quality rule only (see
+# dataAccess/quality.py), so the pages can leave out the flagged ones. New days are
+# appended as new slots at the end of the file and trips of days already in the
+# cube are added to their slot, so the existing slots never move. A rebuilt cube
+# goes to a new file, swapped in by the manifest, and readers holding the previous
+# one keep reading it. Trips without a pickup time are left out.
+#
+# The manifest also records the last trips rowid counted and the trips generation
+# (see dataAccess/trips.py). The pages only read the cube while it holds every trip
+# of the trips table, and fall back to their queries otherwise.
+
+DEMAND_CUBE_DIR = 'data/demandCube'
+MANIFEST = 'manifest.json'
+
+MEASURES = ('pickups', 'revenue', 'dropoffs', 'dropoff_revenue',
+            'clean_pickups', 'clean_revenue', 'clean_dropoffs', 'clean_dropoff_revenue')
+SERVICES = tuple(sorted(SERVICE_CODES))
+HOURS = 24
+N_ZONES = 266
+DTYPE = 'float64'
+
+PICKUP_CELLS_QUERY = f'''
+    SELECT
+        pickup_time / {SECONDS_PER_DAY} AS day,
+        service,
+        pickup_time / {SECONDS_PER_HOUR} % 24 AS hour,
+        CASE WHEN PULocationID BETWEEN 1 AND {N_ZONES - 1} THEN PULocationID ELSE 0 END AS zone,
+        COUNT(*) AS pickups,
+        TOTAL(total_fare) AS revenue,
+        TOTAL({CLEAN_TRIPS}) AS clean_pickups,
+        TOTAL(CASE WHEN {CLEAN_TRIPS} THEN total_fare END) AS clean_revenue
+    FROM {TRIPS_TABLE}
+    WHERE rowid > ? AND rowid <= ? AND pickup_time >= 0
+    GROUP BY 1, 2, 3, 4
+'''
+
+DROPOFF_CELLS_QUERY = f'''
+    SELECT
+        pickup_time / {SECONDS_PER_DAY} AS day,
+        service,
+        pickup_time / {SECONDS_PER_HOUR} % 24 AS hour,
+        CASE WHEN DOLocationID BETWEEN 1 AND {N_ZONES - 1} THEN DOLocationID ELSE 0 END AS zone,
+        COUNT(*) AS dropoffs,
+        TOTAL(total_fare) AS dropoff_revenue,
+        TOTAL({CLEAN_TRIPS}) AS clean_dropoffs,
+        TOTAL(CASE WHEN {CLEAN_TRIPS} THEN total_fare END) AS clean_dropoff_revenue
+    FROM {TRIPS_TABLE}
+    WHERE rowid > ? AND rowid <= ? AND pickup_time >= 0
+    GROUP BY 1, 2, 3, 4
+'''
+
+
+def manifest_path(directory=DEMAND_CUBE_DIR):
+    return os.path.join(directory, MANIFEST)
+
+
+def read_manifest(directory=DEMAND_CUBE_DIR):
+    path = manifest_path(directory)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, directory=DEMAND_CUBE_DIR):
+    # Written to a temporary file and renamed, so readers never see half a manifest
+    path = manifest_path(directory)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def empty_manifest(file):
+    return {
+        'file': file,
+        'dtype': DTYPE,
+        'axes': {'day': [], 'measure': list(MEASURES), 'service': list(SERVICES), 'hour': HOURS, 'zone': N_ZONES},
+        'last_rowid': 0,
+        'generation': None,
+        'trips': 0,
+    }
+
+
+def quality_measure(measure, clean_only=False):
+    # Name of the measure counting only the clean trips with clean_only
+    return f'clean_{measure}' if clean_only else measure
+
+
+def current_measures(manifest):
+    # Whether the cube has every measure; cubes built before the clean measures
+    # are rebuilt by their next update
+    return manifest['axes']['measure'] == list(MEASURES)
+
+
+def cube_shape(manifest):
+    axes = manifest['axes']
+    return len(axes['day']), len(axes['measure']), len(axes['service']), axes['hour'], axes['zone']
+
+
+def day_numbers(manifest):
+    # Days of the slots as days since the epoch, like pickup_time / 86400
+    days = np.array(manifest['axes']['day'], dtype='datetime64[D]')
+    return days.astype('int64')
+
+
+def open_values(manifest, directory=DEMAND_CUBE_DIR, mode='r'):
+    # Memory map of the cube's file, with the slots listed in the manifest
+    shape = cube_shape(manifest)
+    if shape[0] == 0:
+        return np.zeros(shape, dtype=manifest['dtype'])
+    return np.memmap(os.path.join(directory, manifest['file']), dtype=manifest['dtype'], mode=mode, shape=shape)
+
+
+def _open_cube(directory):
+    manifest = read_manifest(directory)
+    return manifest, day_numbers(manifest), open_values(manifest, directory)
+
+
+def load_cube(directory=DEMAND_CUBE_DIR):
+    # (manifest, day numbers, read-only values) of the cube, reopened when the
+    # manifest changes, or None when it has not been built
+    path = manifest_path(directory)
+    if not os.path.exists(path):
+        return None
+    return cached_call(os.path.abspath(path), _open_cube, directory)
+
+
+def cube_available(directory=DEMAND_CUBE_DIR):
+    return os.path.exists(manifest_path(directory))
+
+
+def current_cube(connection, directory=DEMAND_CUBE_DIR):
+    # The cube when it holds every trip of the connection's trips table, else None
+    if not cube_available(directory) or not trips_available(connection):
+        return None
+    cube = load_cube(directory)
+    manifest = cube[0]
+    if not current_measures(manifest):
+        return None
+    if manifest['last_rowid'] != last_trip_rowid(connection) or manifest['generation'] != trips_generation(connection):
+        return None
+    return cube
+
+
+def _contiguous(indices):
+    # A slice for consecutive indices, so NumPy returns a view instead of a copy
+    if len(indices) and np.array_equal(indices, np.arange(indices[0], indices[0] + len(indices))):
+        return slice(int(indices[0]), int(indices[-1]) + 1)
+    return indices
+
+
+def day_slots(days, start=None, end=None):
+    # Slots of the days in [start, end), which must fall on midnights, and their
+    # day numbers. None when a bound is within a day, which the cube cannot split.
+    mask = np.ones(len(days), dtype=bool)
+    for bound, keep in ((start, days.__ge__), (end, days.__lt__)):
+        if bound is None:
+            continue
+        seconds = int(pd.Timestamp(bound).timestamp())
+        if seconds % SECONDS_PER_DAY:
+            return None
+        mask &= keep(seconds // SECONDS_PER_DAY)
+    slots = np.flatnonzero(mask)
+    return _contiguous(slots), days[slots]
+
+
+def measure_values(cube, measure, start=None, end=None, services=SERVICES):
+    # (day, service, hour, zone) values of one measure on the days in [start, end)
+    # and the day number of each, or None when the bounds are not whole days.
+    # Services are in the order given.
+    manifest, days, values = cube
+    selected = day_slots(days, start, end)
+    if selected is None:
+        return None
+    slots, selected_days = selected
+    positions = np.array([manifest['axes']['service'].index(code) for code in services], dtype='int64')
+    measure = manifest['axes']['measure'].index(measure)
+    return selected_days, values[slots, measure][:, _contiguous(positions)]
+
+
+def add_cells(manifest, cells, directory=DEMAND_CUBE_DIR):
+    # Add grouped cells (day, service, hour, zone and one column per measure) to
+    # the cube, appending a slot for every new day. Returns the manifest with
+    # the new days; it is only written once the values are flushed.
+    axes = manifest['axes']
+    known = {day: slot for slot, day in enumerate(day_numbers(manifest))}
+    new_days = sorted(set(cells['day'].tolist()) - set(known))
+    for day in new_days:
+        known[day] = len(known)
+    axes['day'] = axes['day'] + [str(np.datetime64(day, 'D')) for day in new_days]
+
+    exists = os.path.exists(os.path.join(directory, manifest['file']))
+    values = open_values(manifest, directory, mode='r+' if exists else 'w+')
+    flat = values.reshape(-1)
+    slot = cells['day'].map(known).to_numpy(dtype='int64')
+    service = np.searchsorted(np.array(axes['service']), cells['service'].to_numpy(dtype='int64'))
+    hour = cells['hour'].to_numpy(dtype='int64')
+    zone = cells['zone'].to_numpy(dtype='int64')
+    for measure in MEASURES:
+        if measure not in cells:
+            continue
+        index = (((slot * len(axes['measure']) + axes['measure'].index(measure)) * len(axes['service']) + service)
+                 * axes['hour'] + hour) * axes['zone'] + zone
+        # Cells are grouped, so every index appears once
+        flat[index] += cells[measure].to_numpy(dtype='float64')
+    if isinstance(values, np.memmap):
+        values.flush()
+    return manifest
+
+
+def update_cube(connection, rebuild=False, directory=DEMAND_CUBE_DIR):
+    # Add the trips appended since the last update, or all of them in a new file
+    # when the trips table has been rebuilt since. Returns the number of trips
+    # rows read.
+    manifest = read_manifest(directory)
+    last_rowid = last_trip_rowid(connection)
+    generation = trips_generation(connection)
+    previous = None
+    if (rebuild or manifest is None or not current_measures(manifest) or manifest['generation'] != generation
+            or last_rowid < manifest['last_rowid']):
+        previous = manifest and manifest['file']
+        number = int(previous.split('-')[1].split('.')[0]) + 1 if previous else 1
+        manifest = empty_manifest(f'cube-{number}.f8')
+        os.makedirs(directory, exist_ok=True)
+    watermark = manifest['last_rowid']
+
+    if last_rowid > watermark:
+        for query in (PICKUP_CELLS_QUERY, DROPOFF_CELLS_QUERY):
+            cells = pd.read_sql_query(query, connection, params=(watermark, last_rowid))
+            manifest = add_cells(manifest, cells, directory)
+            manifest['trips'] += int(cells['pickups'].sum()) if 'pickups' in cells else 0
+    manifest['last_rowid'] = last_rowid
+    manifest['generation'] = generation
+    write_manifest(manifest, directory)
+
+    # Pages still reading the previous file keep their memory map of it
+    if previous and previous != manifest['file'] and os.path.exists(os.path.join(directory, previous)):
+        os.remove(os.path.join(directory, previous))
+    return last_rowid - watermark
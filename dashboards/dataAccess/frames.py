@@ -0,0 +1,38 @@
+import pandas as pd
+
+# Compact in-memory representation for the frames the pages keep around. Repeated
+# names become categoricals (one small integer code per row instead of a Python
+# string), integers are downcast to the smallest type that holds them and
+# timestamps are parsed once into datetime64. Floats are only narrowed to float32
+# for the columns named by the caller: revenue totals need more than float32's
+# seven digits, and filters such as trip_distance > 0.2 must see the same values.
+
+# Columns holding a small set of repeated labels
+CATEGORY_COLUMNS = (
+    'Borough', 'Zone', 'service_zone', 'Service', 'taxi_type', 'PaymentCategory',
+    'PUBorough', 'DOBorough', 'Zone_PU', 'Zone_DO', 'Borough_PU', 'Borough_DO',
+    'service_zone_PU', 'service_zone_DO',
+)
+
+
+def compact_frame(df, datetime_columns=(), float32_columns=(), category_columns=CATEGORY_COLUMNS):
+    # Convert df in place and return it
+    for column in df.columns:
+        series = df[column]
+        if column in datetime_columns:
+            df[column] = pd.to_datetime(series, format='ISO8601')
+        elif column in category_columns:
+            if series.dtype == object:
+                df[column] = series.astype('category')
+        elif pd.api.types.is_bool_dtype(series):
+            continue
+        elif pd.api.types.is_integer_dtype(series):
+            df[column] = pd.to_numeric(series, downcast='integer')
+        elif column in float32_columns and pd.api.types.is_float_dtype(series):
+            df[column] = series.astype('float32')
+    return df
+
+
+def frame_bytes(df):
+    # Memory held by a frame, including the Python strings of object columns
+    return int(df.memory_usage(deep=True).sum())
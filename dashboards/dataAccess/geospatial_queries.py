@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+
+from dataAccess.approximate import STRATUM_COLUMNS, estimate_totals, load_samples, months_in_range
+from dataAccess.connection import run_query
+from dataAccess.demand_cube import current_cube, measure_values
+from dataAccess.frames import compact_frame
+from dataAccess.partitions import format_trip_query
+from dataAccess.trips import TAXI_CODES, taxi_trips, trips_available
+
+PICKUP_TIMES_QUERY = '''
+    SELECT
+        tpep_pickup_datetime as pickup_datetime,
+        'yellow' as taxi_type
+    FROM
+        {yellow_trips}
+    UNION ALL
+    SELECT
+        lpep_pickup_datetime as pickup_datetime,
+        'green' as taxi_type
+    FROM
+        {green_trips};
+'''
+
+TOP_TAXI_LOCATIONS_QUERY = '''
+    SELECT
+        tz.LocationID,
+        tz.Borough,
+        tz.Zone,
+        COUNT(*) AS TripCount
+    FROM
+        taxi_zone_lookup tz
+    LEFT JOIN
+        (
+            SELECT PULocationID
+            FROM yellow_tripdata
+            UNION ALL
+            SELECT PULocationID
+            FROM green_tripdata
+        ) AS combined_taxi
+    ON
+        tz.LocationID = combined_taxi.PULocationID
+    GROUP BY
+        tz.LocationID, tz.Borough, tz.Zone
+    ORDER BY
+        TripCount DESC;
+'''
+
+# Same data from the unified trips table, see dataAccess/trips.py
+
+TRIPS_PICKUP_TIMES_QUERY = '''
+    SELECT
+        pickup_time,
+        service
+    FROM
+        trips
+    WHERE
+        {taxi_trips};
+'''
+
+# Zones without pickups count 1, as COUNT(*) over the LEFT JOIN above does
+TRIPS_TOP_TAXI_LOCATIONS_QUERY = '''
+    SELECT
+        tz.LocationID,
+        tz.Borough,
+        tz.Zone,
+        COALESCE(pickups.TripCount, 1) AS TripCount
+    FROM
+        taxi_zone_lookup tz
+    LEFT JOIN
+        (
+            SELECT
+                PULocationID,
+                COUNT(*) AS TripCount
+            FROM
+                trips
+            WHERE
+                {taxi_trips}
+            GROUP BY
+                PULocationID
+        ) AS pickups
+    ON
+        tz.LocationID = pickups.PULocationID
+    ORDER BY
+        TripCount DESC;
+'''
+
+
+def trips_pickup_times(connection, start, end):
+    df = run_query(connection, TRIPS_PICKUP_TIMES_QUERY.format(taxi_trips=taxi_trips(start, end)), name='pickup_times')
+    taxi_types = {code: service for service, code in TAXI_CODES.items()}
+    return pd.DataFrame({
+        'pickup_datetime': pd.to_datetime(df['pickup_time'], unit='s'),
+        'taxi_type': df['service'].map(taxi_types),
+    })
+
+
+def load_pickup_times(connection, start=None, end=None):
+    # Pickups in [start, end), only reading the partitions that overlap it
+    if trips_available(connection):
+        df = trips_pickup_times(connection, start, end)
+    else:
+        query = format_trip_query(connection, PICKUP_TIMES_QUERY, start, end)
+        df = run_query(connection, query, name='pickup_times')
+
+    # Ensure 'pickup_datetime' is in datetime format, taxi_type becomes a categorical
+    return compact_frame(df, datetime_columns=('pickup_datetime',))
+
+
+def hourly_demand(df_filtered):
+    # Group by hour and calculate the number of trips
+    pickup_hour = df_filtered['pickup_datetime'].dt.hour.rename('pickup_hour')
+    return df_filtered.groupby([pickup_hour, 'taxi_type'], observed=True).size().reset_index(name='Number of Trips')
+
+
+def cube_hourly_demand(connection, start, end, taxi_types):
+    # Same frame as hourly_demand, summed from the demand cube. None when the cube
+    # is missing or behind the trips table, or the range does not cover whole days.
+    cube = current_cube(connection)
+    if cube is None:
+        return None
+    taxi_types = sorted(taxi_types)
+    selected = measure_values(cube, 'pickups', start, end, [TAXI_CODES[taxi_type] for taxi_type in taxi_types])
+    if selected is None:
+        return None
+    trips = selected[1].sum(axis=(0, 3)).T
+    hour, service = np.nonzero(trips)
+    return pd.DataFrame({
+        'pickup_hour': hour.astype('int32'),
+        'taxi_type': np.array(taxi_types, dtype=object)[service],
+        'Number of Trips': trips[hour, service].astype('int64'),
+    })
+
+
+def load_top_taxi_locations(connection):
+    if trips_available(connection):
+        return run_query(connection, TRIPS_TOP_TAXI_LOCATIONS_QUERY.format(taxi_trips=taxi_trips()), name='top_taxi_locations')
+    return run_query(connection, TOP_TAXI_LOCATIONS_QUERY, name='top_taxi_locations')
+
+
+def approximate_hourly_demand(connection, start, end, taxi_types, sample_rate):
+    # Estimated trips per hour and taxi type in [start, end) from the stratified
+    # samples, with the 95% margin of every estimate
+    samples = load_samples(connection, taxi_types, months_in_range(start, end), sample_rate)
+    in_range = samples[(samples['pickup_datetime'] >= pd.Timestamp(start)) & (samples['pickup_datetime'] < pd.Timestamp(end))]
+    contributions = in_range[STRATUM_COLUMNS].assign(
+        row=in_range.index,
+        group=list(zip(in_range['pickup_datetime'].dt.hour, in_range['service'])),
+        value=1.0,
+    )
+    estimates = estimate_totals(contributions, samples)
+
+    demand = pd.DataFrame(estimates['group'].tolist(), columns=['pickup_hour', 'taxi_type'])
+    demand['Number of Trips'] = estimates['estimate']
+    demand['margin'] = estimates['margin']
+    return demand.sort_values(['pickup_hour', 'taxi_type']).reset_index(drop=True)
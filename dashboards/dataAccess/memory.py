@@ -0,0 +1,142 @@
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from dataAccess.frames import frame_bytes
+
+# Memory budget shared by every in-process cache: the page cache of
+# dataAccess/cache.py, the incremental rollups of dataAccess/deltas.py and the
+# API results of dataAccess/aggregates.py. Each cache charges the approximate
+# size of an entry when it keeps one, with the seconds the entry took to compute,
+# and names a callback that drops it. When the total goes over the budget, the
+# entries that are cheapest to recompute per byte and least recently used are
+# dropped first (GreedyDual-Size): an entry's priority is the clock plus its cost
+# per byte, refreshed on every hit, and the clock advances to the priority of each
+# evicted entry, so entries nobody reads age out even if they were expensive.
+#
+# The budget is TAXI_MEMORY_BUDGET_MB megabytes, 1024 by default, 0 for no bound.
+# Memory-mapped arrays, such as the origin-destination matrices, are backed by
+# their files and count as nothing.
+
+BUDGET_ENV = 'TAXI_MEMORY_BUDGET_MB'
+DEFAULT_BUDGET_MB = 1024
+
+
+def geometry_bytes(df):
+    # Coordinates of the shapely geometries of a GeoDataFrame, which memory_usage
+    # counts as one pointer each
+    geometry_columns = [column for column, dtype in df.dtypes.items() if str(dtype) == 'geometry']
+    if not geometry_columns:
+        return 0
+    import shapely
+
+    return sum(int(shapely.get_num_coordinates(np.asarray(df[column])).sum()) * 16 for column in geometry_columns)
+
+
+def object_bytes(value):
+    # Approximate memory held by a cached value
+    if isinstance(value, pd.DataFrame):
+        return frame_bytes(value) + geometry_bytes(value)
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.memmap):
+        return 0
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(object_bytes(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(object_bytes(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+def budget_from_env():
+    megabytes = float(os.environ.get(BUDGET_ENV, DEFAULT_BUDGET_MB))
+    return int(megabytes * 2 ** 20) if megabytes > 0 else None
+
+
+class MemoryBudget:
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.entries = {}
+        self.clock = 0.0
+        self.evictions = {}
+        self.lock = threading.Lock()
+
+    def _priority(self, size, cost):
+        return self.clock + cost / max(size, 1)
+
+    def charge(self, category, key, value, cost, evict):
+        # Account for value kept under (category, key), `cost` seconds to recompute.
+        # Returns False when the value alone is over the budget and must not be kept.
+        size = object_bytes(value)
+        if self.budget_bytes is not None and size > self.budget_bytes:
+            self.release(category, key)
+            return False
+        with self.lock:
+            self.entries[(category, key)] = [size, cost, self._priority(size, cost), evict]
+            evicted = self._evict_over_budget(keep=(category, key))
+        for callback in evicted:
+            callback()
+        return True
+
+    def touch(self, category, key):
+        with self.lock:
+            entry = self.entries.get((category, key))
+            if entry is not None:
+                entry[2] = self._priority(entry[0], entry[1])
+
+    def release(self, category, key=None):
+        # Forget an entry, or every entry of a category, without calling its callback
+        with self.lock:
+            for entry_key in [entry_key for entry_key in self.entries
+                              if entry_key[0] == category and (key is None or entry_key[1] == key)]:
+                del self.entries[entry_key]
+
+    def _evict_over_budget(self, keep):
+        # Callbacks of the entries dropped to get back under the budget, called
+        # once the lock is released since they take the lock of their cache
+        evicted = []
+        if self.budget_bytes is None:
+            return evicted
+        used = sum(entry[0] for entry in self.entries.values())
+        while used > self.budget_bytes:
+            candidates = [entry_key for entry_key in self.entries if entry_key != keep]
+            if not candidates:
+                break
+            victim = min(candidates, key=lambda entry_key: self.entries[entry_key][2])
+            size, _, priority, evict = self.entries.pop(victim)
+            self.clock = max(self.clock, priority)
+            self.evictions[victim[0]] = self.evictions.get(victim[0], 0) + 1
+            used -= size
+            evicted.append(evict)
+        return evicted
+
+    def usage(self):
+        # Entries, bytes and evictions so far per category
+        with self.lock:
+            rows = {}
+            for (category, _), (size, _, _, _) in self.entries.items():
+                row = rows.setdefault(category, {'category': category, 'entries': 0, 'bytes': 0})
+                row['entries'] += 1
+                row['bytes'] += size
+            for category, count in self.evictions.items():
+                rows.setdefault(category, {'category': category, 'entries': 0, 'bytes': 0})
+            usage = pd.DataFrame(list(rows.values()), columns=['category', 'entries', 'bytes'])
+            usage['evictions'] = usage['category'].map(self.evictions).fillna(0).astype('int64')
+        return usage.sort_values('bytes', ascending=False).reset_index(drop=True)
+
+    def used_bytes(self):
+        with self.lock:
+            return sum(entry[0] for entry in self.entries.values())
+
+
+budget = MemoryBudget(budget_from_env())
+
+
+def memory_usage():
+    return budget.usage()
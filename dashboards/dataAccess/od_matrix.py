@@ -0,0 +1,189 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataAccess.partitions import TRIP_TABLES
+from dataAccess.trips import TRIPS_TABLE, table_exists, trips_available, trips_generation
+
+# Dense origin-destination matrices. A zone pair is a cell of a 266 x 266 array
+# indexed by LocationID - 1, so the rollups the pages need are array reductions
+# instead of joins and group bys: revenue per zone is a row sum plus a column sum,
+# and a borough heatmap is Bᵀ · M · B with B the zone-to-borough indicator matrix.
+# The last row and column hold the trips whose pickup or drop-off zone is missing
+# or outside 1-265, so such a trip still counts at its other end.
+#
+# dataLoader/build_od_matrix.py writes one .npy file per pickup month holding the
+# taxi trips (yellow and green) with the shape (measure, hour, pickup zone, drop-off
+# zone). Files are memory-mapped when read, so a page only touches the cells it sums.
+# Months built without the hour split have a single hour slice. clean_trips and
+# clean_revenue count the trips breaking no data quality rule only (see
+# dataAccess/quality.py).
+#
+# The manifest records for every month the last rowid of the tables it was built
+# from and the trips generation (see dataAccess/trips.py). The pages only read a
+# month while they match the database they query, and fall back to their queries
+# otherwise.
+
+N_ZONES = 265
+OUTSIDE = N_ZONES
+SIZE = N_ZONES + 1
+MEASURES = ('trips', 'revenue', 'distance', 'duration', 'clean_trips', 'clean_revenue')
+HOURS = 24
+
+OD_MATRIX_DIR = 'data/odMatrix'
+MANIFEST = 'manifest.json'
+
+
+def matrix_path(month, directory=OD_MATRIX_DIR):
+    return os.path.join(directory, f'{month}.npy')
+
+
+def load_matrix(month, directory=OD_MATRIX_DIR):
+    # Read-only memory map of the month, or None when it has not been built
+    path = matrix_path(month, directory)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode='r')
+
+
+def current_matrix(connection, month, directory=OD_MATRIX_DIR):
+    # The month's matrix when it was built from the connection's trips as they
+    # are now, with every measure, else None
+    entry = read_manifest(directory).get(month)
+    if entry is None or entry_version(entry) != source_version(connection):
+        return None
+    matrix = load_matrix(month, directory)
+    if matrix is None or not has_measures(matrix):
+        return None
+    return matrix
+
+
+def has_measures(matrix):
+    # Whether the matrix has every measure; months built before the clean
+    # measures need a rebuild
+    return matrix.shape[0] == len(MEASURES)
+
+
+def open_matrix(month, by_hour=False, directory=OD_MATRIX_DIR):
+    # Writable memory map of the month, created with zeros when missing
+    path = matrix_path(month, directory)
+    if os.path.exists(path):
+        return np.load(path, mmap_mode='r+')
+    os.makedirs(directory, exist_ok=True)
+    shape = (len(MEASURES), HOURS if by_hour else 1, SIZE, SIZE)
+    return np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=shape)
+
+
+def read_manifest(directory=OD_MATRIX_DIR):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, directory=OD_MATRIX_DIR):
+    # Written to a temporary file and renamed, so readers never see half a manifest
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def source_version(connection):
+    # Last rowid of the tables the matrices are built from, the trips table or else
+    # the taxi trip tables, and the trips generation
+    if trips_available(connection):
+        tables = [TRIPS_TABLE]
+    else:
+        tables = [table for table in TRIP_TABLES.values() if table_exists(connection, table)]
+    last_rowid = {table: connection.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {table}').fetchone()[0]
+                  for table in tables}
+    generation = trips_generation(connection) if trips_available(connection) else None
+    return {'last_rowid': last_rowid, 'generation': generation}
+
+
+def entry_version(entry):
+    # The source_version recorded for a month of the manifest
+    return {'last_rowid': entry.get('last_rowid'), 'generation': entry.get('generation')}
+
+
+def zone_index(location_ids):
+    # Array index of each LocationID, and the mask of IDs that fall in the matrix
+    ids = pd.to_numeric(pd.Series(location_ids), errors='coerce').to_numpy(dtype=np.float64)
+    valid = (ids >= 1) & (ids <= N_ZONES)
+    return np.where(valid, ids - 1, 0).astype(np.int64), valid
+
+
+def pair_sums(pickup, dropoff, weights=None, hours=None, n_hours=1):
+    # Sum of `weights` (or a count) per (hour, pickup zone, drop-off zone) cell.
+    # Zones outside the matrix go to the OUTSIDE row or column, rows with an hour
+    # outside the matrix are dropped and missing weights count as 0, like SUM in SQL.
+    pu, pu_valid = zone_index(pickup)
+    do, do_valid = zone_index(dropoff)
+    cell = np.where(pu_valid, pu, OUTSIDE) * SIZE + np.where(do_valid, do, OUTSIDE)
+    valid = np.ones(len(cell), dtype=bool)
+    if n_hours > 1:
+        hour = np.asarray(hours, dtype=np.float64)
+        valid &= (hour >= 0) & (hour < n_hours)
+        cell = np.where(valid, hour, 0).astype(np.int64) * SIZE * SIZE + cell
+    if weights is not None:
+        weights = np.nan_to_num(np.asarray(weights, dtype=np.float64)[valid])
+    sums = np.bincount(cell[valid], weights=weights, minlength=n_hours * SIZE * SIZE)
+    return sums.reshape(n_hours, SIZE, SIZE)
+
+
+def accumulate(matrix, trips):
+    # Add trips to a (measure, hour, zone, zone) matrix in place. `trips` has
+    # PULocationID, DOLocationID, hour and one column per measure, where `trips`
+    # is the number of trips each row stands for.
+    for i, measure in enumerate(MEASURES):
+        matrix[i] += pair_sums(trips['PULocationID'], trips['DOLocationID'], trips[measure], trips['hour'], matrix.shape[1])
+
+
+def measure_matrix(matrix, measure, hour=None):
+    # 266 x 266 totals of one measure, for one hour of the day or all of them
+    values = matrix[MEASURES.index(measure)]
+    if hour is None:
+        return values.sum(axis=0)
+    if values.shape[0] == 1:
+        raise ValueError('this month was built without the hour split')
+    return np.asarray(values[hour])
+
+
+def zone_totals(zone_matrix):
+    # Total of every zone counted at the pickup and at the drop-off end, as the
+    # UNION ALL of pickups and drop-offs in the revenue queries does, indexed by
+    # LocationID - 1
+    return (zone_matrix.sum(axis=1) + zone_matrix.sum(axis=0))[:N_ZONES]
+
+
+def borough_indicator(lookup_df):
+    # Boroughs in sorted order and the SIZE x boroughs 0/1 matrix mapping zones to
+    # them, with no borough for the OUTSIDE row
+    lookup = lookup_df[['LocationID', 'Borough']].dropna()
+    boroughs = sorted(lookup['Borough'].astype(str).unique())
+    index, valid = zone_index(lookup['LocationID'])
+    columns = pd.Categorical(lookup['Borough'].astype(str), categories=boroughs).codes
+    indicator = np.zeros((SIZE, len(boroughs)))
+    indicator[index[valid], columns[valid]] = 1.0
+    return boroughs, indicator
+
+
+def borough_matrix(zone_matrix, lookup_df):
+    # Pickup borough x drop-off borough totals of a 266 x 266 matrix
+    boroughs, indicator = borough_indicator(lookup_df)
+    totals = indicator.T @ np.asarray(zone_matrix) @ indicator
+    return pd.DataFrame(totals, index=boroughs, columns=boroughs)
+
+
+def borough_pairs(sums, counts, lookup_df, value_name):
+    # Mean per borough pair in long form (PUBorough, DOBorough, value), keeping
+    # only the pairs with at least one count
+    total = borough_matrix(sums, lookup_df).stack()
+    count = borough_matrix(counts, lookup_df).stack()
+    mean = (total / count)[count > 0]
+    mean.index.names = ['PUBorough', 'DOBorough']
+    return mean.rename(value_name).reset_index()
@@ -0,0 +1,77 @@
+import sqlite3
+
+import pandas as pd
+
+# Routing for the date-partitioned trip tables written by dataLoader/partition_trips.py.
+# Each partition holds the trips of one service for one month (or day), and the
+# trip_partitions catalog records the pickup range it covers. A query asks for the
+# trips picked up in [start, end) and only reads the partitions overlapping that
+# range. Databases without the catalog fall back to the unpartitioned tables with
+# the same pickup predicate, so the results do not depend on the layout. The
+# catalog also records the last rowid of the table each service was copied from,
+# and is ignored once the table has changed: rows appended or the table reloaded
+# by dataLoader/load_dataset.py, until the partitions are written again.
+
+PARTITION_CATALOG = 'trip_partitions'
+
+TRIP_TABLES = {'yellow': 'yellow_tripdata', 'green': 'green_tripdata'}
+PICKUP_COLUMNS = {'yellow': 'tpep_pickup_datetime', 'green': 'lpep_pickup_datetime'}
+
+
+def timestamp_literal(value):
+    # Stored timestamps are ISO text, so bounds are compared as the same text
+    return pd.Timestamp(value).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def month_range(month):
+    # '2023-09' -> ('2023-09-01 00:00:00', '2023-10-01 00:00:00')
+    start = pd.Timestamp(f'{month}-01')
+    return timestamp_literal(start), timestamp_literal(start + pd.offsets.MonthBegin(1))
+
+
+def day_range(day):
+    start = pd.Timestamp(day).normalize()
+    return timestamp_literal(start), timestamp_literal(start + pd.Timedelta(days=1))
+
+
+def partition_tables(connection, service, start, end):
+    # Partitions of `service` overlapping [start, end), or None when the service is
+    # not partitioned or its partitions no longer match its table
+    try:
+        rows = connection.execute(
+            f'SELECT table_name, start_date, end_date, source_rowid FROM {PARTITION_CATALOG} '
+            f'WHERE service = ? ORDER BY start_date',
+            (service,),
+        ).fetchall()
+        last_rowid = connection.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {TRIP_TABLES[service]}').fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+    if not rows or any(source_rowid != last_rowid for _, _, _, source_rowid in rows):
+        return None
+    return [table for table, first, last, _ in rows if first < end and last > start]
+
+
+def trips_in_range(connection, service, start=None, end=None, columns='*'):
+    # FROM clause fragment with the trips of `service` picked up in [start, end)
+    table = TRIP_TABLES[service]
+    if start is None and end is None:
+        return table
+
+    pickup = PICKUP_COLUMNS[service]
+    start = timestamp_literal(start) if start is not None else '0000-01-01 00:00:00'
+    end = timestamp_literal(end) if end is not None else '9999-12-31 23:59:59'
+    predicate = f"{pickup} >= '{start}' AND {pickup} < '{end}'"
+
+    tables = partition_tables(connection, service, start, end)
+    if tables is None:
+        tables = [table]
+    if not tables:
+        # No partition overlaps the range, keep the columns but return no rows
+        return f'(SELECT {columns} FROM {table} WHERE 0)'
+    return '(' + ' UNION ALL '.join(f'SELECT {columns} FROM {t} WHERE {predicate}' for t in tables) + ')'
+
+
+def format_trip_query(connection, query, start=None, end=None):
+    # Fill the {yellow_trips} and {green_trips} placeholders of a query template
+    return query.format(**{f'{service}_trips': trips_in_range(connection, service, start, end) for service in TRIP_TABLES})
+
@@ -0,0 +1,92 @@
+import os
+
+import pandas as pd
+
+from dataAccess.cache import cached_call
+from dataAccess.connection import run_query
+from dataAccess.frames import compact_frame
+from dataAccess.od_matrix import borough_pairs, pair_sums
+
+# Prediction outputs of the notebooks in predictions/, relative to the dashboards directory
+HOURLY_PREDICTION_CSV = 'data/predictedData/hourly_pred.csv'
+LOCATION_PREDICTION_CSV = 'data/predictedData/location_pred.csv'
+FARE_PREDICTION_CSV = 'data/predictedData/fare_predictions.csv'
+TRIP_DURATION_PREDICTION_CSV = 'data/predictedData/trip_duration_pred.csv'
+
+PREDICTED_DEMAND_BY_BOROUGH_QUERY = '''
+    SELECT
+        tz.Borough,
+        SUM(l.prediction) AS TotalPrediction
+    FROM
+        location_prediction l
+    JOIN
+        taxi_zone_lookup tz
+    ON
+        l.PULocationID = tz.LocationID
+    GROUP BY
+        tz.Borough;
+'''
+
+
+def _read_predictions(filepath):
+    # Predictions only feed means and colour scales, float32 is precise enough for them
+    return compact_frame(pd.read_csv(filepath), float32_columns=('prediction',))
+
+
+def load_predictions(filepath):
+    # Read once per process and file version, shared by every session
+    return cached_call(os.path.abspath(filepath), _read_predictions, filepath)
+
+
+def hourly_demand_for_day(df_time_prediction, day_of_the_month=28.0):
+    return df_time_prediction[df_time_prediction['day_of_the_month'] == day_of_the_month]
+
+
+def join_location_predictions(df_location_prediction, lookup_df):
+    return pd.merge(df_location_prediction, lookup_df, how='inner', left_on='PULocationID', right_on='LocationID')
+
+
+def load_predicted_demand_by_borough(connection):
+    return run_query(connection, PREDICTED_DEMAND_BY_BOROUGH_QUERY, name='predicted_demand_by_borough')
+
+
+def merge_zone_names(df, lookup_df):
+    # Attach pickup (_PU) and drop-off (_DO) zone names to every prediction
+    merged_data = df.merge(lookup_df, left_on='PULocationID', right_on='LocationID', how='left', suffixes=('_PU', '_DO'))
+    return merged_data.merge(lookup_df, left_on='DOLocationID', right_on='LocationID', how='left', suffixes=('_PU', '_DO'))
+
+
+def lookup_mean_prediction(merged_data, pu_location, do_location, hour_of_day=None):
+    # Mean prediction for a pickup/drop-off zone pair, optionally at one hour of the day
+    mask = (merged_data['Zone_PU'] == pu_location) & (merged_data['Zone_DO'] == do_location)
+    if hour_of_day is not None:
+        mask &= merged_data['hour_of_day'] == hour_of_day
+    filtered_data = merged_data[mask]
+
+    if filtered_data.empty:
+        return None
+    return filtered_data['prediction'].mean()
+
+
+def borough_heatmap(df_filtered, lookup_df):
+    # Mean prediction per pickup and drop-off borough pair. Predictions are summed
+    # into zone pair matrices and reduced to boroughs with the zone-to-borough
+    # mapping, instead of merging the lookup twice and grouping every row.
+    sums = pair_sums(df_filtered['PULocationID'], df_filtered['DOLocationID'], df_filtered['prediction'])[0]
+    counts = pair_sums(df_filtered['PULocationID'], df_filtered['DOLocationID'], df_filtered['prediction'].notna())[0]
+    return borough_pairs(sums, counts, lookup_df, 'prediction')
+
+
+def fare_heatmap(df, lookup_df, trip_distance_threshold, days_of_the_month=(29, 30)):
+    # Filter out rows with small trip distances and specific days
+    df_filtered = df[
+        (df['trip_distance'] > trip_distance_threshold) &
+        (df['day_of_the_month'].isin(days_of_the_month))
+    ]
+    return borough_heatmap(df_filtered, lookup_df)
+
+
+def trip_duration_heatmap(df, lookup_df, trip_duration_threshold):
+    # Filter out rows with small trip durations
+    df_filtered = df[df['prediction'] > trip_duration_threshold]
+    return borough_heatmap(df_filtered, lookup_df)
@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import time
+
+# Query profiling for run_query. When enabled, every query records its wall time,
+# rows returned, bytes materialized and SQLite's EXPLAIN QUERY PLAN, and flags full
+# table scans. Records are kept per script run (Streamlit runs each session on its
+# own thread) for the sidebar panel and appended as JSON lines to a log file.
+
+# Set TAXI_QUERY_PROFILING=1 to profile every run, not only when the panel is on
+PROFILING_ENV = 'TAXI_QUERY_PROFILING'
+PROFILE_LOG_ENV = 'TAXI_QUERY_PROFILE_LOG'
+DEFAULT_PROFILE_LOG = 'logs/query_profile.jsonl'
+
+_state = threading.local()
+_log_lock = threading.Lock()
+
+
+def profiling_enabled():
+    return getattr(_state, 'enabled', False) or os.environ.get(PROFILING_ENV) == '1'
+
+
+def start_run(page, enabled=False):
+    # Reset the records of the current thread at the top of a page run
+    _state.page = page
+    _state.enabled = enabled
+    _state.records = []
+
+
+def current_page():
+    return getattr(_state, 'page', None)
+
+
+def run_context():
+    # Profiling state of the current page run, for worker threads fetching its data
+    from dataAccess.spans import current_section
+
+    if not hasattr(_state, 'records'):
+        _state.records = []
+    return {
+        'page': current_page(),
+        'enabled': getattr(_state, 'enabled', False),
+        'records': _state.records,
+        'section': current_section(),
+    }
+
+
+def adopt_run_context(context):
+    # Record the queries of this worker thread into the page run that started it
+    _state.page = context['page']
+    _state.enabled = context['enabled']
+    _state.records = context['records']
+    _state.section = context['section']
+
+
+def run_records():
+    return list(getattr(_state, 'records', []))
+
+
+def explain_query_plan(connection, query, params=None):
+    rows = connection.execute('EXPLAIN QUERY PLAN ' + query.strip().rstrip(';'), params or ()).fetchall()
+    # Each row is (id, parent, notused, detail)
+    return [row[3] for row in rows]
+
+
+def full_scans(plan):
+    # "SCAN <table>" without an index is a full table scan, "SEARCH" and
+    # "SCAN ... USING [COVERING] INDEX" are not. Scans of subqueries SQLite
+    # runs as co-routines or materializes are not table scans either.
+    subqueries = {detail.split()[1] for detail in plan if detail.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+    scans = []
+    for detail in plan:
+        if not detail.startswith('SCAN ') or 'USING' in detail or 'CONSTANT ROW' in detail:
+            continue
+        table_name = detail.split()[1]
+        if table_name not in subqueries:
+            scans.append(table_name)
+    return scans
+
+
+def profile_query(connection, name, query, params, execute):
+    if not profiling_enabled():
+        return execute()
+
+    start = time.perf_counter()
+    df = execute()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    try:
+        plan = explain_query_plan(connection, query, params)
+    except Exception as e:
+        plan = [f'EXPLAIN failed: {e}']
+
+    from dataAccess.spans import current_section
+
+    record = {
+        'timestamp': time.time(),
+        'page': current_page(),
+        'section': current_section() or getattr(_state, 'section', None),
+        'query': name,
+        'wall_ms': elapsed_ms,
+        'rows': len(df),
+        'bytes': int(df.memory_usage(deep=True).sum()),
+        'full_scans': full_scans(plan),
+        'plan': plan,
+    }
+    if not hasattr(_state, 'records'):
+        _state.records = []
+    _state.records.append(record)
+    write_log(record)
+    return df
+
+
+def write_log(record, log_path=None):
+    log_path = log_path or os.environ.get(PROFILE_LOG_ENV, DEFAULT_PROFILE_LOG)
+    os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+    with _log_lock, open(log_path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def read_log(log_path=DEFAULT_PROFILE_LOG):
+    # Load the JSON lines log for offline analysis
+    import pandas as pd
+
+    return pd.read_json(log_path, lines=True)
+
+
+def summarize_log(log_path=DEFAULT_PROFILE_LOG):
+    # Per-query latency summary, slowest first
+    df = read_log(log_path)
+    df['full_scan'] = df['full_scans'].str.len() > 0
+    summary = df.groupby(['page', 'query']).agg(
+        runs=('wall_ms', 'size'),
+        mean_ms=('wall_ms', 'mean'),
+        p95_ms=('wall_ms', lambda x: x.quantile(0.95)),
+        mean_rows=('rows', 'mean'),
+        mean_bytes=('bytes', 'mean'),
+        full_scan=('full_scan', 'any'),
+    )
+    return summary.sort_values('p95_ms', ascending=False).reset_index()
+
+
+if __name__ == '__main__':
+    import sys
+
+    print(summarize_log(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PROFILE_LOG).to_string(index=False))
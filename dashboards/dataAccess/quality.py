@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+# Data quality rules evaluated once per trip while the trips table is built, see
+# dataLoader/build_trips_table.py. Every rule is one bit of the trips.quality
+# column, so a trip breaking several rules keeps all of them and quality = 0 marks
+# a clean trip. The clean trips have their own partial index, which lets rollups
+# exclude the bad rows with that single predicate instead of repeating the rules,
+# or filtering the results in pandas afterwards.
+#
+# Each rule is written twice, as a SQL condition for the in-SQLite rebuild and as a
+# vectorized condition on a DataFrame of trips columns for the Parquet batches. A
+# NULL value breaks no rule in either form.
+
+QUALITY_TABLE = 'trip_quality'
+
+# Rule name: (bit, SQL condition, description)
+RULES = {
+    'zero_distance': (1, 'distance <= 0', 'distance of zero or less'),
+    'negative_fare': (2, 'total_fare < 0', 'negative total fare'),
+    'non_positive_duration': (4, 'duration <= 0', 'drop-off at or before pickup'),
+    'multi_day': (8, 'duration >= 86400', 'trip of a day or more'),
+    'implausible_speed': (16, 'distance * 3600 > 100 * duration AND duration > 0', 'average speed above 100 mph'),
+}
+
+CLEAN_TRIPS = 'quality = 0'
+
+CREATE_QUALITY_SQL = f'''
+    CREATE TABLE IF NOT EXISTS {QUALITY_TABLE} (
+        service INTEGER NOT NULL,
+        rule TEXT NOT NULL,
+        trips INTEGER NOT NULL,
+        PRIMARY KEY (service, rule)
+    ) STRICT;
+'''
+
+
+def quality_sql():
+    # Bitmask expression over the trips columns
+    return ' | '.join(f'(CASE WHEN {condition} THEN {bit} ELSE 0 END)' for bit, condition, _ in RULES.values())
+
+
+def rule_masks(trips):
+    # Boolean array per rule for a DataFrame with the trips columns
+    distance = trips['distance'].to_numpy(dtype=np.float64)
+    fare = trips['total_fare'].to_numpy(dtype=np.float64)
+    duration = trips['duration'].to_numpy(dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        return {
+            'zero_distance': distance <= 0,
+            'negative_fare': fare < 0,
+            'non_positive_duration': duration <= 0,
+            'multi_day': duration >= 86400,
+            'implausible_speed': (distance * 3600 > 100 * duration) & (duration > 0),
+        }
+
+
+def quality_flags(trips):
+    flags = np.zeros(len(trips), dtype=np.int64)
+    for rule, mask in rule_masks(trips).items():
+        flags |= np.where(mask, RULES[rule][0], 0)
+    return flags
+
+
+def rule_counts(groups):
+    # Trips breaking each rule per service, from the trip counts of (service, quality) groups
+    counts = []
+    for rule, (bit, _, _) in RULES.items():
+        broken = groups[(groups['quality'] & bit) != 0].groupby('service')['trips'].sum()
+        counts.append(pd.DataFrame({'service': broken.index, 'rule': rule, 'trips': broken.to_numpy()}))
+    return pd.concat(counts, ignore_index=True)
+
+
+def add_rule_counts(connection, counts):
+    connection.execute(CREATE_QUALITY_SQL)
+    connection.executemany(
+        f'''INSERT INTO {QUALITY_TABLE} (service, rule, trips) VALUES (?, ?, ?)
+            ON CONFLICT (service, rule) DO UPDATE SET trips = trips + excluded.trips''',
+        counts[['service', 'rule', 'trips']].astype(object).itertuples(index=False, name=None),
+    )
+
+
+def load_rule_counts(connection):
+    # No counts before the trips table is built. Read-only connections cannot
+    # create the table, so it is only looked up.
+    row = connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?", (QUALITY_TABLE,)).fetchone()
+    if row[0] == 0:
+        return pd.DataFrame(columns=['service', 'rule', 'trips'])
+    return pd.read_sql_query(f'SELECT service, rule, trips FROM {QUALITY_TABLE} ORDER BY service, rule', connection)
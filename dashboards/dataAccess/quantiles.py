@@ -0,0 +1,124 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from dataAccess.connection import run_query
+
+# Mergeable quantile sketches for fares and trip durations. Values are counted in
+# logarithmic buckets (as in DDSketch): bucket k holds (gamma^(k-1), gamma^k], so
+# any quantile read from the bucket counts is within RELATIVE_ACCURACY of the true
+# value. Counts are kept per (metric, service, pickup zone, pickup hour) in SQLite.
+# Sketches merge by adding counts, so new trips are folded in with an upsert and
+# any rollup (per borough, per service, all hours) is a GROUP BY over the counts.
+
+SKETCH_TABLE = 'quantile_sketches'
+METRICS = ('fare', 'duration')
+
+RELATIVE_ACCURACY = 0.02
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+# Magnitudes below MIN_VALUE (under a cent or a second) share the zero bucket.
+# Positive buckets are shifted above it and negative ones mirrored below it, so
+# bucket order is value order.
+MIN_VALUE = 0.01
+KEY_OFFSET = 1 - math.ceil(math.log(MIN_VALUE) / LOG_GAMMA)
+
+# Hour recorded for trips loaded without a pickup time (older compact FHV loads)
+UNKNOWN_HOUR = -1
+
+
+def create_sketch_table(connection):
+    connection.execute(f'''
+        CREATE TABLE IF NOT EXISTS {SKETCH_TABLE} (
+            metric TEXT,
+            service TEXT,
+            PULocationID INTEGER,
+            hour INTEGER,
+            bucket INTEGER,
+            count INTEGER,
+            PRIMARY KEY (metric, service, PULocationID, hour, bucket)
+        ) WITHOUT ROWID
+    ''')
+
+
+def bucket_keys(values):
+    values = np.asarray(values, dtype='float64')
+    magnitude = np.abs(values)
+    keys = np.zeros(len(values), dtype='int64')
+    nonzero = magnitude >= MIN_VALUE
+    keys[nonzero] = np.ceil(np.log(magnitude[nonzero]) / LOG_GAMMA).astype('int64') + KEY_OFFSET
+    return np.where(values < 0, -keys, keys)
+
+
+def bucket_values(keys):
+    # Representative value of each bucket, within RELATIVE_ACCURACY of everything in it
+    keys = np.asarray(keys, dtype='int64')
+    k = np.abs(keys) - KEY_OFFSET
+    values = 2 * np.power(GAMMA, k) / (GAMMA + 1)
+    return np.where(keys == 0, 0.0, np.sign(keys) * values)
+
+
+def update_sketches(connection, trips):
+    # Fold a batch of trips into the sketches. trips has service, PULocationID,
+    # hour and one column per metric; NULL values and trips without a pickup zone
+    # are skipped. The caller commits, so the counts go in with the trips.
+    create_sketch_table(connection)
+    for metric in METRICS:
+        batch = trips[trips[metric].notna() & trips['PULocationID'].notna()]
+        if batch.empty:
+            continue
+        counts = pd.DataFrame({
+            'service': batch['service'],
+            'PULocationID': batch['PULocationID'],
+            'hour': batch['hour'],
+            'bucket': bucket_keys(batch[metric]),
+        }).groupby(['service', 'PULocationID', 'hour', 'bucket']).size().reset_index(name='count')
+        connection.executemany(f'''
+            INSERT INTO {SKETCH_TABLE} VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (metric, service, PULocationID, hour, bucket) DO UPDATE SET count = count + excluded.count
+        ''', [(metric, service, int(zone), int(hour), int(bucket), int(count))
+              for service, zone, hour, bucket, count in counts.itertuples(index=False)])
+
+
+def quantiles_from_counts(counts, group_columns, quantiles):
+    # counts: bucket counts of the sketches merged per group. Returns one row per
+    # group with its trip count and one column per quantile, e.g. p50 and p90.
+    rows = []
+    for group, buckets in counts.sort_values('bucket').groupby(group_columns, dropna=False, observed=True):
+        cumulative = buckets['count'].cumsum().to_numpy()
+        total = cumulative[-1]
+        row = dict(zip(group_columns, group if isinstance(group, tuple) else (group,)))
+        row['trips'] = int(total)
+        for q in quantiles:
+            # Rank of the quantile among the sorted values (0-based), as in DDSketch
+            position = np.searchsorted(cumulative, q * (total - 1), side='right')
+            row[f'p{round(q * 100):d}'] = float(bucket_values([buckets['bucket'].iloc[position]])[0])
+        rows.append(row)
+    return pd.DataFrame(rows, columns=list(group_columns) + ['trips'] + [f'p{round(q * 100):d}' for q in quantiles])
+
+
+def load_percentiles(connection, metric, by, quantiles=(0.5, 0.9), where=None, params=()):
+    # Percentiles of `metric` merged over everything but `by`. `by` may name
+    # Borough or Zone (from taxi_zone_lookup), service, PULocationID or hour.
+    # Buckets are merged per pickup zone in SQL and zones are mapped to their
+    # borough afterwards, on a few thousand rows instead of the whole table.
+    sketch_columns = [c for c in by if c not in ('Borough', 'Zone', 'PULocationID')] + ['PULocationID']
+    columns = ', '.join(sketch_columns)
+    query = f'''
+        SELECT {columns}, bucket, SUM(count) AS count
+        FROM {SKETCH_TABLE}
+        WHERE metric = ? {f'AND {where}' if where else ''}
+        GROUP BY {columns}, bucket
+    '''
+    counts = run_query(connection, query, (metric, *params), name=f'{metric}_percentiles')
+    zones = run_query(connection, 'SELECT LocationID AS PULocationID, Borough, Zone FROM taxi_zone_lookup', name='zone_names')
+    counts = counts.merge(zones, on='PULocationID')
+    counts = counts.groupby(list(by) + ['bucket'], dropna=False)['count'].sum().reset_index()
+    return quantiles_from_counts(counts, list(by), quantiles)
+
+
+def sketches_available(connection):
+    row = connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?", (SKETCH_TABLE,)).fetchone()
+    return row[0] > 0
@@ -0,0 +1,537 @@
+import numpy as np
+import pandas as pd
+
+from dataAccess.approximate import STRATUM_COLUMNS, estimate_totals, load_samples
+from dataAccess.cache import cached
+from dataAccess.concurrent_queries import run_queries
+from dataAccess.connection import run_query
+from dataAccess.deltas import delta_rollup
+from dataAccess.demand_cube import current_cube, measure_values, quality_measure
+from dataAccess.od_matrix import current_matrix, measure_matrix, zone_index, zone_totals
+from dataAccess.partitions import TRIP_TABLES, format_trip_query, month_range
+from dataAccess.quality import CLEAN_TRIPS
+from dataAccess.trips import SECONDS_PER_DAY, TAXI_CODES, format_epoch, taxi_trips, trips_available
+
+# Taxi services of the demand cube, see dataAccess/demand_cube.py
+TAXI_SERVICES = tuple(TAXI_CODES.values())
+
+# Trip sources are the {yellow_trips} and {green_trips} placeholders, filled by
+# dataAccess.partitions with the pickups of the requested month
+
+DAILY_QUERY = '''
+    SELECT
+        DATE(tpep_pickup_datetime) AS Date,
+        SUM(total_amount) AS DailyRevenue
+    FROM
+        (
+            SELECT
+                tpep_pickup_datetime,
+                total_amount
+            FROM
+                {yellow_trips}
+            UNION ALL
+            SELECT
+                lpep_pickup_datetime,
+                total_amount
+            FROM
+                {green_trips}
+        ) AS combined_taxi
+    GROUP BY
+        Date
+    ORDER BY
+        Date;
+'''
+
+WEEKLY_QUERY = '''
+    SELECT
+        strftime('%Y-%m-%d', tpep_pickup_datetime, 'weekday 0', '-6 days') AS WeekStart,
+        SUM(total_amount) AS WeeklyRevenue
+    FROM
+        (
+            SELECT
+                tpep_pickup_datetime,
+                total_amount
+            FROM
+                {yellow_trips}
+            UNION ALL
+            SELECT
+                lpep_pickup_datetime,
+                total_amount
+            FROM
+                {green_trips}
+        ) AS combined_taxi
+    GROUP BY
+        WeekStart
+    ORDER BY
+        WeekStart;
+'''
+
+MONTHLY_QUERY = '''
+    SELECT
+        strftime('%Y-%m', tpep_pickup_datetime) AS Month,
+        SUM(total_amount) AS MonthlyRevenue
+    FROM
+        (
+            SELECT
+                tpep_pickup_datetime,
+                total_amount
+            FROM
+                {yellow_trips}
+            UNION ALL
+            SELECT
+                lpep_pickup_datetime,
+                total_amount
+            FROM
+                {green_trips}
+        ) AS combined_taxi
+    GROUP BY
+        Month
+    ORDER BY
+        Month;
+'''
+
+REVENUE_BY_ZONE_QUERY = '''
+    SELECT
+        tz.LocationID,
+        tz.Borough,
+        tz.Zone,
+        SUM(total_amount) AS TotalRevenue
+    FROM
+        taxi_zone_lookup tz
+    JOIN
+        (
+            SELECT
+                PULocationID AS LocationID,
+                total_amount
+            FROM
+                {yellow_trips}
+            UNION ALL
+            SELECT
+                DOLocationID AS LocationID,
+                total_amount
+            FROM
+                {yellow_trips}
+            UNION ALL
+            SELECT
+                PULocationID AS LocationID,
+                total_amount
+            FROM
+                {green_trips}
+            UNION ALL
+            SELECT
+                DOLocationID AS LocationID,
+                total_amount
+            FROM
+                {green_trips}
+        ) AS combined_taxi
+    ON
+        tz.LocationID = combined_taxi.LocationID
+    GROUP BY
+        tz.LocationID, tz.Borough, tz.Zone
+'''
+
+REVENUE_BY_LOCATION_QUERY = REVENUE_BY_ZONE_QUERY + '''
+    ORDER BY
+        TotalRevenue DESC
+    LIMIT 30;
+'''
+
+REVENUE_BY_TIME_QUERY = '''
+    SELECT
+        strftime('%H', pickup_datetime) AS HourOfDay,
+        SUM(total_amount) AS TotalRevenue
+    FROM
+        (
+            SELECT
+                tpep_pickup_datetime AS pickup_datetime,
+                total_amount
+            FROM
+                {yellow_trips}
+            UNION ALL
+            SELECT
+                lpep_pickup_datetime AS pickup_datetime,
+                total_amount
+            FROM
+                {green_trips}
+        ) AS combined_taxi
+    GROUP BY
+        HourOfDay
+    ORDER BY
+        HourOfDay;
+'''
+
+REVENUE_BY_DAYWEEK_QUERY = '''
+    SELECT
+        strftime('%w', pickup_datetime) AS DayOfWeek,
+        SUM(total_amount) AS TotalRevenue
+    FROM
+        (
+            SELECT
+                tpep_pickup_datetime AS pickup_datetime,
+                total_amount
+            FROM
+                {yellow_trips}
+            UNION ALL
+            SELECT
+                lpep_pickup_datetime AS pickup_datetime,
+                total_amount
+            FROM
+                {green_trips}
+        ) AS combined_taxi
+    GROUP BY
+        DayOfWeek
+    ORDER BY
+        DayOfWeek;
+'''
+
+REVENUE_BY_TRIP_TYPE_QUERY = '''
+    WITH CombinedRevenue AS (
+        SELECT
+            tz.LocationID,
+            tz.Borough,
+            tz.Zone,
+            SUM(total_amount) AS TotalRevenue
+        FROM
+            taxi_zone_lookup tz
+        JOIN
+            (
+                SELECT
+                    PULocationID AS LocationID,
+                    total_amount
+                FROM
+                    {yellow_trips}
+                UNION ALL
+                SELECT
+                    DOLocationID AS LocationID,
+                    total_amount
+                FROM
+                    {yellow_trips}
+                UNION ALL
+                SELECT
+                    PULocationID AS LocationID,
+                    total_amount
+                FROM
+                    {green_trips}
+                UNION ALL
+                SELECT
+                    DOLocationID AS LocationID,
+                    total_amount
+                FROM
+                    {green_trips}
+            ) AS combined_taxi
+        ON
+            tz.LocationID = combined_taxi.LocationID
+        GROUP BY
+            tz.LocationID, tz.Borough, tz.Zone
+    )
+
+    SELECT
+        CASE
+            WHEN LOWER(Zone) LIKE '%airport%' THEN 'Airport'
+            ELSE 'Non-Airport'
+        END AS TripType,
+        SUM(TotalRevenue) AS TotalRevenue
+    FROM
+        CombinedRevenue
+    GROUP BY
+        TripType;
+'''
+
+
+# Same data from the unified trips table, see dataAccess/trips.py. {taxi_trips} is
+# the predicate selecting the month's taxi trips. Days, hours and weekdays are
+# integer arithmetic on the epoch pickup time, 1970-01-01 being a Thursday, and
+# are only formatted as dates once aggregated.
+
+TRIPS_DAILY_QUERY = '''
+    SELECT
+        pickup_time / 86400 AS day,
+        SUM(total_fare) AS DailyRevenue
+    FROM
+        trips
+    WHERE
+        {taxi_trips}
+    GROUP BY
+        day
+    ORDER BY
+        day;
+'''
+
+TRIPS_REVENUE_BY_HOUR_OF_WEEK_QUERY = '''
+    SELECT
+        pickup_time / 3600 % 24 AS hour,
+        (pickup_time / 86400 + 4) % 7 AS weekday,
+        SUM(total_fare) AS TotalRevenue
+    FROM
+        trips
+    WHERE
+        {taxi_trips}
+    GROUP BY
+        hour, weekday;
+'''
+
+TRIPS_REVENUE_BY_ZONE_QUERY = '''
+    SELECT
+        tz.LocationID,
+        tz.Borough,
+        tz.Zone,
+        SUM(zone_revenue.revenue) AS TotalRevenue
+    FROM
+        taxi_zone_lookup tz
+    JOIN
+        (
+            SELECT
+                PULocationID AS LocationID,
+                SUM(total_fare) AS revenue
+            FROM
+                trips
+            WHERE
+                {taxi_trips}
+            GROUP BY
+                PULocationID
+            UNION ALL
+            SELECT
+                DOLocationID AS LocationID,
+                SUM(total_fare) AS revenue
+            FROM
+                trips
+            WHERE
+                {taxi_trips}
+            GROUP BY
+                DOLocationID
+        ) AS zone_revenue
+    ON
+        tz.LocationID = zone_revenue.LocationID
+    GROUP BY
+        tz.LocationID, tz.Borough, tz.Zone;
+'''
+
+
+def month_query(connection, query, month, clean_only=False):
+    # Route the query to the partitions holding the month's pickups. The trip
+    # tables have no quality flags, only the trips table can leave out flagged trips.
+    if clean_only:
+        raise ValueError('flagged trips can only be left out with the trips table, see build_trips_table.py')
+    start, end = month_range(month)
+    return format_trip_query(connection, query, start, end)
+
+
+def month_trips(month, clean_only=False):
+    # Predicate of the month's taxi trips in the trips table, only the clean ones with clean_only
+    start, end = month_range(month)
+    predicate = taxi_trips(start, end)
+    return f'{predicate} AND {CLEAN_TRIPS}' if clean_only else predicate
+
+
+def trips_taxi_revenues(connection, month, clean_only=False):
+    # One pass over the month's trips; weeks and the month are sums of its days.
+    # Days are kept up to date from the trips appended since the last call.
+    query = TRIPS_DAILY_QUERY.format(taxi_trips=month_trips(month, clean_only))
+    daily = delta_rollup(connection, query, ['day'], name='daily_revenue')
+    return revenue_trends(daily)
+
+
+def cube_taxi_revenues(cube, month, clean_only=False):
+    # Revenue of the month's days with taxi pickups, summed from the demand cube
+    start, end = month_range(month)
+    days, revenue = measure_values(cube, quality_measure('revenue', clean_only), start, end, TAXI_SERVICES)
+    _, pickups = measure_values(cube, quality_measure('pickups', clean_only), start, end, TAXI_SERVICES)
+    present = pickups.sum(axis=(1, 2, 3)) > 0
+    daily = pd.DataFrame({'day': days, 'DailyRevenue': revenue.sum(axis=(1, 2, 3))})[present]
+    return revenue_trends(daily.sort_values('day').reset_index(drop=True))
+
+
+def revenue_trends(daily):
+    # Daily, weekly and monthly revenue from the revenue of each day number
+    week_start = (daily['day'] - (daily['day'] + 3) % 7) * SECONDS_PER_DAY
+    day_start = daily['day'] * SECONDS_PER_DAY
+
+    weekly = daily.groupby(format_epoch(week_start, '%Y-%m-%d').rename('WeekStart'))['DailyRevenue'].sum()
+    monthly = daily.groupby(format_epoch(day_start, '%Y-%m').rename('Month'))['DailyRevenue'].sum()
+    daily = pd.DataFrame({'Date': format_epoch(day_start, '%Y-%m-%d'), 'DailyRevenue': daily['DailyRevenue']})
+    return daily, weekly.rename('WeeklyRevenue').reset_index(), monthly.rename('MonthlyRevenue').reset_index()
+
+
+def load_taxi_revenues(connection, month='2023-09', clean_only=False):
+    # Daily, weekly and monthly revenue for September 2023, queried concurrently.
+    # clean_only leaves out the trips flagged by the data quality rules.
+    cube = current_cube(connection)
+    if cube is not None:
+        return cube_taxi_revenues(cube, month, clean_only)
+    if trips_available(connection):
+        return trips_taxi_revenues(connection, month, clean_only)
+    frames = run_queries(connection, {
+        'daily_revenue': month_query(connection, DAILY_QUERY, month, clean_only),
+        'weekly_revenue': month_query(connection, WEEKLY_QUERY, month, clean_only),
+        'monthly_revenue': month_query(connection, MONTHLY_QUERY, month, clean_only),
+    })
+    return frames['daily_revenue'], frames['weekly_revenue'], frames['monthly_revenue']
+
+
+def matrix_revenue_by_zone(connection, month, clean_only=False):
+    # Revenue of every zone with trips, counted at the pickup and at the drop-off
+    # end, from the month's origin-destination matrix. None when the month has no
+    # matrix or it was built from other trips, see dataLoader/build_od_matrix.py.
+    matrix = current_matrix(connection, month)
+    if matrix is None:
+        return None
+    prefix = 'clean_' if clean_only else ''
+    revenue = zone_totals(measure_matrix(matrix, f'{prefix}revenue'))
+    trips = zone_totals(measure_matrix(matrix, f'{prefix}trips'))
+    return zone_revenue(connection, revenue, trips)
+
+
+def zone_revenue(connection, revenue, trips):
+    # Zones with trips and their revenue, from totals indexed by LocationID - 1
+    zones = run_query(connection, 'SELECT LocationID, Borough, Zone FROM taxi_zone_lookup', name='zone_names')
+    index, valid = zone_index(zones['LocationID'])
+    zones = zones.assign(TotalRevenue=revenue[index])
+    return zones[valid & (trips[index] > 0)].reset_index(drop=True)
+
+
+def cube_revenue_by_zone(connection, cube, month, clean_only=False):
+    # Revenue of every zone with trips, counted at the pickup and at the drop-off
+    # end, from the demand cube
+    start, end = month_range(month)
+    totals = {}
+    for measure in ('pickups', 'revenue', 'dropoffs', 'dropoff_revenue'):
+        _, values = measure_values(cube, quality_measure(measure, clean_only), start, end, TAXI_SERVICES)
+        totals[measure] = values.sum(axis=(0, 1, 2))
+    # Zone 0 of the cube holds the trips without a valid zone
+    revenue = (totals['revenue'] + totals['dropoff_revenue'])[1:]
+    trips = (totals['pickups'] + totals['dropoffs'])[1:]
+    return zone_revenue(connection, revenue, trips)
+
+
+def month_revenue_by_zone(connection, month, cube=None, clean_only=False):
+    # Revenue of every zone from the demand cube or the origin-destination matrix,
+    # None when neither is built
+    if cube is not None:
+        return cube_revenue_by_zone(connection, cube, month, clean_only)
+    return matrix_revenue_by_zone(connection, month, clean_only)
+
+
+def top_revenue_zones(by_zone):
+    return by_zone.sort_values('TotalRevenue', ascending=False).head(30).reset_index(drop=True)
+
+
+def trips_revenue_vary(connection, month, by_zone, clean_only=False):
+    # Hours and weekdays are sums of the 168 hours of the week, kept up to date
+    # from the trips appended since the last call
+    taxi_trips = month_trips(month, clean_only)
+    query = TRIPS_REVENUE_BY_HOUR_OF_WEEK_QUERY.format(taxi_trips=taxi_trips)
+    hours = delta_rollup(connection, query, ['hour', 'weekday'], name='revenue_by_hour_of_week')
+    if by_zone is None:
+        by_zone = run_query(connection, TRIPS_REVENUE_BY_ZONE_QUERY.format(taxi_trips=taxi_trips), name='revenue_by_zone')
+    return revenue_vary_frames(hours, by_zone)
+
+
+def cube_revenue_vary(connection, cube, month, clean_only=False):
+    # Revenue per hour of the week of the month's taxi trips, summed from the demand cube
+    start, end = month_range(month)
+    days, revenue = measure_values(cube, quality_measure('revenue', clean_only), start, end, TAXI_SERVICES)
+    _, pickups = measure_values(cube, quality_measure('pickups', clean_only), start, end, TAXI_SERVICES)
+    by_day_hour = revenue.sum(axis=(1, 3))
+    present = pickups.sum(axis=(1, 3)) > 0
+    day, hour = np.nonzero(present)
+    hours = pd.DataFrame({'hour': hour, 'weekday': (days[day] + 4) % 7, 'TotalRevenue': by_day_hour[day, hour]})
+    return revenue_vary_frames(hours, cube_revenue_by_zone(connection, cube, month, clean_only))
+
+
+def revenue_vary_frames(hours, by_zone):
+    # Top zones, and revenue per hour of the day and day of the week from the
+    # revenue per hour of the week
+    R_time = hours.groupby('hour')['TotalRevenue'].sum().reset_index()
+    R_time = pd.DataFrame({'HourOfDay': R_time['hour'].map('{:02d}'.format), 'TotalRevenue': R_time['TotalRevenue']})
+    R_day = hours.groupby('weekday')['TotalRevenue'].sum().reset_index()
+    R_day = pd.DataFrame({'DayOfWeek': R_day['weekday'].astype(str), 'TotalRevenue': R_day['TotalRevenue']})
+    return top_revenue_zones(by_zone), R_time, R_day
+
+
+def load_revenue_vary(connection, month='2023-09', clean_only=False):
+    # Revenue by location, hour of the day and day of the week, queried concurrently.
+    # Revenue by location comes from the origin-destination matrix when it is built,
+    # and everything from the demand cube when it holds every trip.
+    cube = current_cube(connection)
+    if cube is not None:
+        return cube_revenue_vary(connection, cube, month, clean_only)
+    by_zone = matrix_revenue_by_zone(connection, month, clean_only)
+    if trips_available(connection):
+        return trips_revenue_vary(connection, month, by_zone, clean_only)
+
+    queries = {
+        'revenue_by_time': month_query(connection, REVENUE_BY_TIME_QUERY, month, clean_only),
+        'revenue_by_dayweek': month_query(connection, REVENUE_BY_DAYWEEK_QUERY, month, clean_only),
+    }
+    if by_zone is None:
+        queries['revenue_by_location'] = month_query(connection, REVENUE_BY_LOCATION_QUERY, month)
+    frames = run_queries(connection, queries)
+
+    R_location = frames['revenue_by_location'] if by_zone is None else top_revenue_zones(by_zone)
+    return R_location, frames['revenue_by_time'], frames['revenue_by_dayweek']
+
+
+def load_revenue_by_trip_type(connection, month='2023-09', clean_only=False):
+    by_zone = month_revenue_by_zone(connection, month, current_cube(connection), clean_only)
+    if by_zone is None and trips_available(connection):
+        query = TRIPS_REVENUE_BY_ZONE_QUERY.format(taxi_trips=month_trips(month, clean_only))
+        by_zone = run_query(connection, query, name='revenue_by_zone')
+    if by_zone is None:
+        query = month_query(connection, REVENUE_BY_TRIP_TYPE_QUERY, month, clean_only)
+        return run_query(connection, query, name='revenue_by_trip_type')
+
+    # Same airport split as REVENUE_BY_TRIP_TYPE_QUERY
+    airport = by_zone['Zone'].str.lower().str.contains('airport', na=False)
+    trip_type = airport.map({True: 'Airport', False: 'Non-Airport'}).rename('TripType')
+    return by_zone.groupby(trip_type)['TotalRevenue'].sum().reset_index()
+
+
+def load_revenue_by_zone(connection, month='2023-09', clean_only=False):
+    # Revenue of every zone, highest first, from the cube, the matrix, the trips table or the trip tables
+    by_zone = month_revenue_by_zone(connection, month, current_cube(connection), clean_only)
+    if by_zone is None and trips_available(connection):
+        query = TRIPS_REVENUE_BY_ZONE_QUERY.format(taxi_trips=month_trips(month, clean_only))
+        by_zone = run_query(connection, query, name='revenue_by_zone')
+    if by_zone is None:
+        query = month_query(connection, REVENUE_BY_ZONE_QUERY, month, clean_only)
+        by_zone = run_query(connection, query, name='revenue_by_zone')
+    return by_zone.sort_values(['TotalRevenue', 'LocationID'], ascending=[False, True]).reset_index(drop=True)
+
+
+def approximate_revenue_vary(connection, month='2023-09', sample_rate=0.05):
+    # Same three frames as load_revenue_vary, estimated from the stratified samples,
+    # each with the 95% margin of its TotalRevenue
+    samples = load_samples(connection, TRIP_TABLES, [month], sample_rate)
+    rows = samples[STRATUM_COLUMNS].assign(row=samples.index, value=samples['total_amount'].fillna(0))
+
+    # Revenue is counted at the pickup and at the drop-off zone, as in REVENUE_BY_LOCATION_QUERY
+    by_location = estimate_totals(pd.concat([
+        rows.assign(group=samples['PULocationID']),
+        rows.assign(group=samples['DOLocationID']),
+    ]), samples)
+    by_location = by_location.dropna(subset=['group']).astype({'group': 'int64'})
+    zones = run_query(connection, 'SELECT LocationID, Borough, Zone FROM taxi_zone_lookup', name='zone_names')
+    R_location = zones.merge(by_location.rename(columns={'group': 'LocationID', 'estimate': 'TotalRevenue'}), on='LocationID')
+    R_location = R_location.sort_values('TotalRevenue', ascending=False).head(30).reset_index(drop=True)
+
+    by_hour = estimate_totals(rows.assign(group=samples['pickup_datetime'].dt.strftime('%H')), samples)
+    R_time = by_hour.rename(columns={'group': 'HourOfDay', 'estimate': 'TotalRevenue'}).sort_values('HourOfDay').reset_index(drop=True)
+
+    # SQLite's %w counts from Sunday = 0, pandas from Monday = 0
+    weekday = ((samples['pickup_datetime'].dt.dayofweek + 1) % 7).astype(str)
+    by_day = estimate_totals(rows.assign(group=weekday), samples)
+    R_day = by_day.rename(columns={'group': 'DayOfWeek', 'estimate': 'TotalRevenue'}).sort_values('DayOfWeek').reset_index(drop=True)
+    return R_location, R_time, R_day
+
+
+def revenue_page_loaders(sample_rate=None, clean_only=False):
+    # Data of the revenue page, for dataAccess.concurrent_queries.fetch_concurrently.
+    # Loaders are cached, so the warm-up thread and the page share their results.
+    # The samples have no quality flags, so estimates count every trip.
+    options = {'clean_only': True} if clean_only else {}
+    vary = cached(approximate_revenue_vary, sample_rate=sample_rate) if sample_rate else cached(load_revenue_vary, **options)
+    return {
+        'revenues': cached(load_taxi_revenues, **options),
+        'vary': vary,
+        'trip_type': cached(load_revenue_by_trip_type, **options),
+    }
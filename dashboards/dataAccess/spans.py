@@ -0,0 +1,136 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+from dataAccess import profiling
+
+# Section timing for the pages. A section is a named span that can be used as a
+# decorator or a context manager and may nest. Inside a section, checkpoint(phase)
+# attributes the time since the previous checkpoint to one of the phases below;
+# whatever runs after the last checkpoint counts as render time. Spans are only
+# recorded while profiling is enabled, otherwise section() is a no-op.
+
+PHASES = ('data', 'transform', 'render')
+SPAN_LOG_ENV = 'TAXI_SPAN_LOG'
+DEFAULT_SPAN_LOG = 'logs/section_spans.jsonl'
+
+_state = threading.local()
+_log_lock = threading.Lock()
+
+
+def _stack():
+    if not hasattr(_state, 'stack'):
+        _state.stack = []
+    return _state.stack
+
+
+def _open_spans():
+    # Spans of the sections open on this thread, without those not profiled
+    return [span for span in _stack() if span is not None]
+
+
+def current_section():
+    # Path of the innermost open section, e.g. "plot_heatmap/fare_heatmap"
+    spans = _open_spans()
+    return '/'.join(span['name'] for span in spans) if spans else None
+
+
+def start_run():
+    # Reset the spans of the current thread at the top of a page run
+    _state.stack = []
+    _state.spans = []
+
+
+def run_spans():
+    # Spans finished since the current page run started, innermost first
+    return list(getattr(_state, 'spans', []))
+
+
+class section(contextlib.ContextDecorator):
+    # One instance decorates a page function for every session, so the state of
+    # each call lives on the calling thread's stack, never on the instance. A None
+    # entry stands for a section entered while profiling was disabled.
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if not profiling.profiling_enabled():
+            _stack().append(None)
+            return self
+        now = time.perf_counter()
+        _stack().append({
+            'name': self.name,
+            'path': '/'.join([span['name'] for span in _open_spans()] + [self.name]),
+            'start': now,
+            'last_checkpoint': now,
+            'phases': dict.fromkeys(PHASES, 0.0),
+        })
+        return self
+
+    def __exit__(self, *exc):
+        span = _stack().pop()
+        if span is None:
+            return False
+        now = time.perf_counter()
+        span['phases']['render'] += (now - span['last_checkpoint']) * 1000
+        record = {
+            'timestamp': time.time(),
+            'page': profiling.current_page(),
+            'section': span['path'],
+            'total_ms': (now - span['start']) * 1000,
+            **{f'{phase}_ms': elapsed for phase, elapsed in span['phases'].items()},
+            'failed': exc[0] is not None,
+        }
+        _record(record)
+        return False
+
+
+def checkpoint(phase):
+    # Count the time since the section started (or the previous checkpoint) as `phase`
+    stack = _stack()
+    if not stack or stack[-1] is None:
+        return
+    span = stack[-1]
+    now = time.perf_counter()
+    span['phases'][phase] += (now - span['last_checkpoint']) * 1000
+    span['last_checkpoint'] = now
+
+
+def _record(record):
+    if not hasattr(_state, 'spans'):
+        _state.spans = []
+    _state.spans.append(record)
+    write_log(record)
+
+
+def write_log(record, log_path=None):
+    log_path = log_path or os.environ.get(SPAN_LOG_ENV, DEFAULT_SPAN_LOG)
+    os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+    with _log_lock, open(log_path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def slow_section_report(log_path=DEFAULT_SPAN_LOG, top=20):
+    # Slowest sections across every session that wrote to the span log
+    import pandas as pd
+
+    df = pd.read_json(log_path, lines=True)
+    report = df.groupby(['page', 'section']).agg(
+        runs=('total_ms', 'size'),
+        mean_ms=('total_ms', 'mean'),
+        p95_ms=('total_ms', lambda x: x.quantile(0.95)),
+        max_ms=('total_ms', 'max'),
+        data_ms=('data_ms', 'mean'),
+        transform_ms=('transform_ms', 'mean'),
+        render_ms=('render_ms', 'mean'),
+    )
+    return report.sort_values('p95_ms', ascending=False).head(top).reset_index()
+
+
+if __name__ == '__main__':
+    import sys
+
+    print(slow_section_report(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SPAN_LOG).to_string(index=False))
@@ -0,0 +1,155 @@
+import time
+
+import pandas as pd
+
+from dataAccess.quality import CLEAN_TRIPS, quality_sql
+
+# Unified trips fact table written by dataLoader/build_trips_table.py. Every trip of
+# every service is one row with the same typed columns: epoch pickup and drop-off
+# seconds, a small integer service code, pickup and drop-off zones, distance in
+# miles, duration in seconds and the total fare, already summed for FHV trips, and
+# the bitmask of the data quality rules it breaks (see dataAccess/quality.py).
+# Queries filter on service and pickup time through an index instead of a UNION ALL
+# of per-service tables with tpep_/lpep_ columns, and bucket times by integer
+# arithmetic on the epoch instead of calling strftime on every row.
+
+TRIPS_TABLE = 'trips'
+SERVICES_TABLE = 'trip_services'
+BATCHES_TABLE = 'trip_batches'
+
+# Service code: (source, service name, FHV license number)
+SERVICE_CODES = {
+    1: ('yellow', 'Yellow Taxi', None),
+    2: ('green', 'Green Taxi', None),
+    3: ('fhvhv', 'Juno', 'HV0002'),
+    4: ('fhvhv', 'Uber', 'HV0003'),
+    5: ('fhvhv', 'Via', 'HV0004'),
+    6: ('fhvhv', 'Lyft', 'HV0005'),
+    7: ('fhvhv', 'Other FHV', None),
+}
+TAXI_CODES = {'yellow': 1, 'green': 2}
+OTHER_FHV_CODE = 7
+
+SECONDS_PER_DAY = 86400
+SECONDS_PER_HOUR = 3600
+
+CREATE_TRIPS_SQL = [f'''
+    CREATE TABLE IF NOT EXISTS {TRIPS_TABLE} (
+        service INTEGER NOT NULL,
+        pickup_time INTEGER,
+        dropoff_time INTEGER,
+        PULocationID INTEGER,
+        DOLocationID INTEGER,
+        passenger_count INTEGER,
+        payment_type INTEGER,
+        distance REAL,
+        duration INTEGER,
+        total_fare REAL,
+        quality INTEGER NOT NULL DEFAULT 0
+    ) STRICT
+''', f'''
+    CREATE TABLE IF NOT EXISTS {SERVICES_TABLE} (
+        code INTEGER PRIMARY KEY,
+        source TEXT NOT NULL,
+        name TEXT NOT NULL,
+        license TEXT
+    ) STRICT
+''', f'''
+    CREATE TABLE IF NOT EXISTS {BATCHES_TABLE} (
+        batch INTEGER PRIMARY KEY,
+        source TEXT NOT NULL,
+        first_rowid INTEGER NOT NULL,
+        last_rowid INTEGER NOT NULL,
+        loaded_at REAL NOT NULL
+    ) STRICT
+''']
+
+# Date filters are ranges of the first index, which also covers the revenue and
+# demand rollups, so they never read the table. The second serves the joins of
+# the zone lookup with the trips picked up in each zone. The third only holds the
+# clean trips and covers the per-zone fare, distance and duration rollups.
+TRIPS_INDEXES = {
+    'trips_service_pickup': '(service, pickup_time, PULocationID, DOLocationID, total_fare)',
+    'trips_service_zone': '(service, PULocationID)',
+    'trips_clean_zone': f'(service, PULocationID, total_fare, distance, duration) WHERE {CLEAN_TRIPS}',
+}
+
+
+def create_trips_table(connection):
+    # Statement by statement, executescript would commit the caller's transaction
+    for statement in CREATE_TRIPS_SQL:
+        connection.execute(statement)
+    connection.executemany(
+        f'INSERT OR REPLACE INTO {SERVICES_TABLE} (code, source, name, license) VALUES (?, ?, ?, ?)',
+        [(code, *spec) for code, spec in SERVICE_CODES.items()],
+    )
+
+
+def add_quality_column(connection):
+    # Trips tables built before the quality rules get the column and their flags.
+    # Returns whether existing rows were flagged.
+    columns = {row[1] for row in connection.execute(f'PRAGMA table_info({TRIPS_TABLE})')}
+    if 'quality' in columns:
+        return False
+    connection.execute(f'ALTER TABLE {TRIPS_TABLE} ADD COLUMN quality INTEGER NOT NULL DEFAULT 0')
+    connection.execute(f'UPDATE {TRIPS_TABLE} SET quality = {quality_sql()}')
+    return True
+
+
+def create_trips_indexes(connection):
+    for name, columns in TRIPS_INDEXES.items():
+        connection.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {TRIPS_TABLE} {columns}')
+
+
+def last_trip_rowid(connection):
+    return connection.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {TRIPS_TABLE}').fetchone()[0]
+
+
+def record_batch(connection, source, first_rowid):
+    # Log the rows appended since first_rowid. Rows are only ever appended, so a
+    # rowid range is exactly what a load added, until the table is rebuilt.
+    last_rowid = last_trip_rowid(connection)
+    connection.execute(
+        f'INSERT INTO {BATCHES_TABLE} (source, first_rowid, last_rowid, loaded_at) VALUES (?, ?, ?, ?)',
+        (source, first_rowid, last_rowid, time.time()),
+    )
+    return last_rowid - first_rowid + 1
+
+
+def trips_generation(connection):
+    # Load time of the first batch, which changes when the table is rebuilt. Tables
+    # built before batches were logged have none.
+    if not table_exists(connection, BATCHES_TABLE):
+        return None
+    row = connection.execute(f'SELECT loaded_at FROM {BATCHES_TABLE} ORDER BY batch LIMIT 1').fetchone()
+    return row[0] if row else None
+
+
+def table_exists(connection, name):
+    row = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+    return row is not None
+
+
+def trips_available(connection):
+    return table_exists(connection, TRIPS_TABLE)
+
+
+def epoch_seconds(value):
+    # Stored timestamps are naive local times, read as UTC the way strftime('%s') does
+    return int(pd.Timestamp(value).timestamp())
+
+
+def taxi_trips(start=None, end=None, services=tuple(TAXI_CODES)):
+    # WHERE predicate selecting the taxi trips picked up in [start, end)
+    codes = ', '.join(str(TAXI_CODES[service]) for service in services)
+    predicate = f'service IN ({codes})'
+    if start is not None:
+        predicate += f' AND pickup_time >= {epoch_seconds(start)}'
+    if end is not None:
+        predicate += f' AND pickup_time < {epoch_seconds(end)}'
+    return predicate
+
+
+def format_epoch(seconds, fmt):
+    # Epoch seconds of the trips table as text in a strftime format
+    return pd.to_datetime(seconds, unit='s').dt.strftime(fmt)
@@ -0,0 +1,34 @@
+import os
+
+import pandas as pd
+
+from dataAccess.cache import cached_call
+from dataAccess.frames import compact_frame
+
+# Snapshots written by dataLoader/create_taxi_stats_table.py, relative to the dashboards directory
+TAXI_STATS_CSV = 'data/dataFiles/taxi_stats.csv'
+TAXI_PREF_CSV = 'data/dataFiles/taxi_pref.csv'
+
+
+# Read once per process and file version, shared by every session
+
+
+def _read_snapshot(filepath):
+    return compact_frame(pd.read_csv(filepath))
+
+
+def load_taxi_data(filepath=TAXI_STATS_CSV):
+    return cached_call(os.path.abspath(filepath), _read_snapshot, filepath)
+
+
+def load_taxi_pref(filepath=TAXI_PREF_CSV):
+    return cached_call(os.path.abspath(filepath), _read_snapshot, filepath)
+
+
+def dominant_service(result_df):
+    # Find the service with the highest ride count for each location
+    return result_df.loc[result_df.groupby('LocationID')['NumberOfRides'].idxmax()]
+
+
+def rides_by_service_and_borough(result_df):
+    return result_df.groupby(['Borough', 'Service'], observed=True)['NumberOfRides'].sum().reset_index()
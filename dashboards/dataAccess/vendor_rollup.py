@@ -0,0 +1,276 @@
+import numpy as np
+import pandas as pd
+
+from dataAccess.connection import run_query
+from dataAccess.frames import compact_frame
+from dataAccess.quality import CLEAN_TRIPS
+from dataAccess.trips import (OTHER_FHV_CODE, SECONDS_PER_DAY, SECONDS_PER_HOUR, SERVICE_CODES, TAXI_CODES,
+                              TRIPS_TABLE, last_trip_rowid, table_exists, trips_generation)
+
+# Additive vendor statistics per (pickup day, pickup hour, pickup zone, service,
+# clean), built from the trips table by dataLoader/build_vendor_rollup.py and kept
+# up to date by dataLoader/stream_trips.py. Every measure is a sum with its
+# non-null count, like the partials of dataLoader/partitioned_stats.py, so the
+# statistics of any window of days and hours are sums over the window's rows
+# divided at the end. The vendor comparison page holds the rollup in memory, sorted by day: a
+# window is a slice of days and a mask of hours, and the zones and services are
+# summed with one np.bincount per measure, which takes milliseconds. clean is 1
+# for the trips breaking no data quality rule (see dataAccess/quality.py), so a
+# window can also leave out the flagged trips.
+#
+# Trips without a pickup time (older compact FHV loads) are kept under day and
+# hour -1 and only counted when the window is the whole period and every hour.
+#
+# The dominant service of every zone for each hour of the day and day of the
+# week is precomputed from the rollup into one small uint8 array, so the page's
+# hour slider only indexes it.
+
+ROLLUP_TABLE = 'vendor_rollup'
+ROLLUP_STATE_TABLE = 'vendor_rollup_state'
+UNKNOWN_DAY = -1
+
+MEASURES = ('fare', 'distance', 'time', 'time_per_distance')
+SUM_COLUMNS = ['rides'] + [f'{measure}_{kind}' for measure in MEASURES for kind in ('sum', 'count')]
+
+CREATE_ROLLUP_SQL = f'''
+    CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+        day INTEGER NOT NULL,
+        hour INTEGER NOT NULL,
+        PULocationID INTEGER NOT NULL,
+        service INTEGER NOT NULL,
+        clean INTEGER NOT NULL,
+        rides INTEGER NOT NULL,
+        fare_sum REAL, fare_count INTEGER NOT NULL,
+        distance_sum REAL, distance_count INTEGER NOT NULL,
+        time_sum REAL, time_count INTEGER NOT NULL,
+        time_per_distance_sum REAL, time_per_distance_count INTEGER NOT NULL,
+        PRIMARY KEY (day, hour, PULocationID, service, clean)
+    ) WITHOUT ROWID
+'''
+
+CREATE_STATE_SQL = f'''
+    CREATE TABLE IF NOT EXISTS {ROLLUP_STATE_TABLE} (
+        last_rowid INTEGER NOT NULL,
+        generation REAL
+    )
+'''
+
+# Time per distance is averaged per trip for the taxis and computed from the
+# averages for FHV, as in the taxi_stats query
+ROLLUP_QUERY = f'''
+    SELECT
+        COALESCE(pickup_time / {SECONDS_PER_DAY}, {UNKNOWN_DAY}) AS day,
+        COALESCE(pickup_time / {SECONDS_PER_HOUR} % 24, {UNKNOWN_DAY}) AS hour,
+        COALESCE(PULocationID, 0) AS PULocationID,
+        service,
+        {CLEAN_TRIPS} AS clean,
+        COUNT(*) AS rides,
+        SUM(total_fare) AS fare_sum, COUNT(total_fare) AS fare_count,
+        SUM(distance) AS distance_sum, COUNT(distance) AS distance_count,
+        SUM(duration) AS time_sum, COUNT(duration) AS time_count,
+        SUM(CASE WHEN service IN ({', '.join(map(str, TAXI_CODES.values()))}) THEN 1.0 * duration / distance END) AS time_per_distance_sum,
+        COUNT(CASE WHEN service IN ({', '.join(map(str, TAXI_CODES.values()))}) THEN 1.0 * duration / distance END) AS time_per_distance_count
+    FROM {TRIPS_TABLE}
+    WHERE rowid > ? AND rowid <= ?
+    GROUP BY 1, 2, 3, 4, 5
+'''
+
+# Service labels of the two vendor comparison tables, as in taxi_stats.csv and taxi_pref.csv
+STATS_LABELS = {code: 'FHV' for code in SERVICE_CODES}
+STATS_LABELS.update({TAXI_CODES['yellow']: 'Yellow Taxi', TAXI_CODES['green']: 'Green Taxi'})
+PREF_LABELS = {code: name for code, (_, name, _) in SERVICE_CODES.items()}
+PREF_LABELS.update({TAXI_CODES['yellow']: 'Yellow taxi', TAXI_CODES['green']: 'Green taxi'})
+N_ZONES = 266
+N_SERVICES = max(SERVICE_CODES) + 1
+
+# Dominant service per (weekday, hour, zone) for the dominance map. Weekdays run
+# from Monday = 0 to Sunday = 6 with 7 for every day, and hours from 0 to 23 with
+# 24 for every hour. Service code 0 is unused and marks zones without rides.
+ALL_WEEKDAYS = 7
+ALL_HOURS = 24
+NO_SERVICE = 0
+
+# Trips without a pickup time go to the every day and all hours cell
+DOMINANCE_QUERY = f'''
+    SELECT
+        CASE WHEN day = {UNKNOWN_DAY} THEN {ALL_WEEKDAYS} ELSE (day + 3) % 7 END AS weekday,
+        CASE WHEN day = {UNKNOWN_DAY} THEN {ALL_HOURS} ELSE hour END AS hour,
+        PULocationID,
+        service,
+        SUM(rides) AS rides
+    FROM {ROLLUP_TABLE}
+    WHERE service != {OTHER_FHV_CODE} AND PULocationID < {N_ZONES} {{clean}}
+    GROUP BY 1, 2, 3, 4
+'''
+
+
+def rollup_available(connection):
+    return table_exists(connection, ROLLUP_TABLE)
+
+
+def rollup_has_quality(connection):
+    # Whether the rollup has the clean column; rollups built before it get it on
+    # their next update
+    columns = {row[1] for row in connection.execute(f'PRAGMA table_info({ROLLUP_TABLE})')}
+    return 'clean' in columns
+
+
+def rollup_watermark(connection):
+    # (last trips rowid counted, trips generation) of the rollup
+    row = connection.execute(f'SELECT last_rowid, generation FROM {ROLLUP_STATE_TABLE}').fetchone()
+    return row if row else (0, None)
+
+
+def add_trips(connection, first_rowid, last_rowid):
+    # Add the trips with rowids in (first_rowid, last_rowid] to the rollup
+    connection.execute(f'''
+        INSERT INTO {ROLLUP_TABLE}
+        {ROLLUP_QUERY}
+        ON CONFLICT (day, hour, PULocationID, service, clean) DO UPDATE SET
+            {', '.join(f'{column} = {column} + excluded.{column}' for column in SUM_COLUMNS if column.endswith(('rides', 'count')))},
+            {', '.join(f'{column} = COALESCE({column} + excluded.{column}, {column}, excluded.{column})' for column in SUM_COLUMNS if column.endswith('sum'))}
+    ''', (first_rowid, last_rowid))
+
+
+def update_rollup(connection, rebuild=False):
+    # Count the trips appended since the last update, or all of them when the trips
+    # table has been rebuilt since. Returns the number of trips rows read. Nothing
+    # is committed, so a streamed batch and its rollup update land together.
+    if rollup_available(connection) and not rollup_has_quality(connection):
+        connection.execute(f'DROP TABLE {ROLLUP_TABLE}')
+        rebuild = True
+    connection.execute(CREATE_ROLLUP_SQL)
+    connection.execute(CREATE_STATE_SQL)
+    watermark, generation = rollup_watermark(connection)
+    last_rowid = last_trip_rowid(connection)
+    current = trips_generation(connection)
+    if rebuild or generation != current or last_rowid < watermark:
+        connection.execute(f'DELETE FROM {ROLLUP_TABLE}')
+        watermark = 0
+    if last_rowid > watermark:
+        add_trips(connection, watermark, last_rowid)
+    connection.execute(f'DELETE FROM {ROLLUP_STATE_TABLE}')
+    connection.execute(f'INSERT INTO {ROLLUP_STATE_TABLE} (last_rowid, generation) VALUES (?, ?)', (last_rowid, current))
+    return last_rowid - watermark
+
+
+def load_vendor_rollup(connection):
+    # The whole rollup in day order, with the smallest integer types
+    df = run_query(connection, f'SELECT * FROM {ROLLUP_TABLE} ORDER BY day, hour', name='vendor_rollup')
+    return compact_frame(df)
+
+
+def day_number(value):
+    return int(pd.Timestamp(value).normalize().timestamp()) // SECONDS_PER_DAY
+
+
+def rollup_days(rollup):
+    # First and last pickup day of the rollup as dates, None when it is empty
+    days = rollup['day'].to_numpy()
+    days = days[days != UNKNOWN_DAY]
+    if len(days) == 0:
+        return None
+    return tuple(pd.to_datetime(days[[0, -1]].astype('int64') * SECONDS_PER_DAY, unit='s').date)
+
+
+def window_sums(rollup, start=None, end=None, hours=(0, 23), clean_only=False):
+    # Sums per (zone, service) of the trips picked up on days [start, end] (dates,
+    # None for no bound) between hours[0] and hours[1] inclusive, only the clean
+    # ones with clean_only, as a frame with PULocationID, service and the SUM_COLUMNS
+    day = rollup['day'].to_numpy()
+    low = np.searchsorted(day, UNKNOWN_DAY + 1 if start is None else day_number(start), side='left')
+    high = len(day) if end is None else np.searchsorted(day, day_number(end), side='right')
+    rows = slice(low, high)
+
+    hour = rollup['hour'].to_numpy()[rows]
+    mask = (hour >= hours[0]) & (hour <= hours[1])
+    if clean_only:
+        mask &= rollup['clean'].to_numpy()[rows] == 1
+    whole_period = start is None and end is None and tuple(hours) == (0, 23)
+    groups = (rollup['PULocationID'].to_numpy()[rows].astype('int64') * N_SERVICES
+              + rollup['service'].to_numpy()[rows].astype('int64'))[mask]
+    if whole_period:
+        unknown = rollup['day'].to_numpy() == UNKNOWN_DAY
+        if clean_only:
+            unknown &= rollup['clean'].to_numpy() == 1
+        groups = np.concatenate([groups, rollup['PULocationID'].to_numpy()[unknown].astype('int64') * N_SERVICES
+                                 + rollup['service'].to_numpy()[unknown].astype('int64')])
+
+    sums = {}
+    for column in SUM_COLUMNS:
+        values = rollup[column].to_numpy(dtype='float64', na_value=0.0)
+        selected = values[rows][mask]
+        if whole_period:
+            selected = np.concatenate([selected, values[unknown]])
+        sums[column] = np.bincount(groups, weights=selected, minlength=N_ZONES * N_SERVICES)
+    present = np.flatnonzero(sums['rides'])
+    return pd.DataFrame({
+        'PULocationID': present // N_SERVICES,
+        'service': present % N_SERVICES,
+        **{column: sums[column][present] for column in SUM_COLUMNS},
+    })
+
+
+def window_taxi_stats(sums, lookup_df):
+    # Average fare, distance and time per borough and service, as in taxi_stats.csv
+    df = sums.merge(lookup_df[['LocationID', 'Borough']], left_on='PULocationID', right_on='LocationID')
+    df['Service'] = df['service'].map(STATS_LABELS)
+    totals = df.groupby(['Service', 'Borough'], observed=True, sort=True)[SUM_COLUMNS].sum().reset_index()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stats = pd.DataFrame({'Borough': totals['Borough'].astype(str), 'Service': totals['Service']})
+        stats['AvgTotalFare'] = totals['fare_sum'] / totals['fare_count']
+        stats['AvgTripDistance'] = totals['distance_sum'] / totals['distance_count']
+        stats['AvgFarePerUnitDistance'] = stats['AvgTotalFare'] / stats['AvgTripDistance']
+        stats['AvgTripTime'] = totals['time_sum'] / totals['time_count']
+        stats['AvgTripTimePerUnitDistance'] = np.where(
+            totals['Service'] == 'FHV',
+            stats['AvgTripTime'] / stats['AvgTripDistance'],
+            totals['time_per_distance_sum'] / totals['time_per_distance_count'],
+        )
+    return stats.replace([np.inf, -np.inf], np.nan)
+
+
+def window_taxi_pref(sums, lookup_df):
+    # Rides per zone and service, as in taxi_pref.csv. FHV trips without a known
+    # license are left out, like the NULL service of the taxi_pref query.
+    sums = sums[sums['service'] != OTHER_FHV_CODE]
+    zones = lookup_df[['LocationID', 'Borough', 'Zone']]
+    pref = zones.merge(sums[['PULocationID', 'service', 'rides']], left_on='LocationID', right_on='PULocationID')
+    return pd.DataFrame({
+        'LocationID': pref['LocationID'],
+        'Borough': pref['Borough'],
+        'Zone': pref['Zone'],
+        'Service': pref['service'].map(PREF_LABELS),
+        'NumberOfRides': pref['rides'].astype('int64'),
+    })
+
+
+def load_dominance_cube(connection, clean_only=False):
+    # uint8 array of shape (8, 25, N_ZONES) with the service code of most rides,
+    # the lowest code on ties, NO_SERVICE where a zone has no rides. Only the
+    # clean trips are counted with clean_only. The every day and all hours cell
+    # also counts the trips without a pickup time, like the whole period window.
+    query = DOMINANCE_QUERY.format(clean='AND clean = 1' if clean_only else '')
+    df = run_query(connection, query, name='dominance_cube')
+    rides = np.zeros((ALL_WEEKDAYS + 1, ALL_HOURS + 1, N_ZONES, N_SERVICES), dtype=np.int64)
+    cells = np.ravel_multi_index(
+        (df['weekday'].to_numpy(), df['hour'].to_numpy(), df['PULocationID'].to_numpy(), df['service'].to_numpy()),
+        rides.shape,
+    )
+    rides.ravel()[:] = np.bincount(cells, weights=df['rides'].to_numpy(dtype='float64'), minlength=rides.size)
+    unknown = rides[ALL_WEEKDAYS, ALL_HOURS].copy()
+    rides[ALL_WEEKDAYS] = rides[:ALL_WEEKDAYS].sum(axis=0)
+    rides[:, ALL_HOURS] = rides[:, :ALL_HOURS].sum(axis=1)
+    rides[ALL_WEEKDAYS, ALL_HOURS] += unknown
+
+    cube = rides.argmax(axis=3).astype(np.uint8)
+    cube[rides.max(axis=3) == 0] = NO_SERVICE
+    cube.flags.writeable = False
+    return cube
+
+
+def dominant_services(cube, location_ids, weekday=ALL_WEEKDAYS, hour=ALL_HOURS):
+    # Service label per zone of location_ids, None where no service has rides
+    codes = cube[weekday, hour][np.clip(np.asarray(location_ids), 0, N_ZONES - 1)]
+    labels = np.array([None] + [PREF_LABELS.get(code) for code in range(1, N_SERVICES)], dtype=object)
+    return labels[codes]
@@ -0,0 +1,83 @@
+import logging
+import os
+import threading
+import time
+
+# Background cache warm-up. When the app starts, a daemon thread runs the
+# default-parameter loaders of the slowest pages and parses the zone geometry,
+# which puts the results in the shared cache of dataAccess/cache.py before the
+# first visitor asks for them. The thread then watches the database file and
+# warms the cache again as soon as an ingest has changed it, so the first view
+# after a data refresh is as fast as a repeat view. The data modules are imported
+# by the thread, so starting it does not slow down the page that starts it.
+
+WARMUP_POLL_SECONDS = 30
+
+# Same default as dataAccess.connection.DB_PATH, which would import pandas
+DB_PATH = 'nyc_taxi_database.db'
+
+logger = logging.getLogger(__name__)
+
+_started = set()
+_lock = threading.Lock()
+
+
+def warmup_loaders():
+    # Page loaders with their default parameters, named after the page
+    from dataAccess.customer_queries import customer_page_loaders
+    from dataAccess.revenue_queries import revenue_page_loaders
+
+    loaders = {}
+    for page, page_loaders in (('revenue', revenue_page_loaders()), ('customer', customer_page_loaders())):
+        loaders.update({f'{page}/{name}': loader for name, loader in page_loaders.items()})
+    return loaders
+
+
+def warm_cache(db_path):
+    from dataAccess.concurrent_queries import fetch_concurrently, read_connection
+    from dataAccess.zones import load_geojson, load_shapefile, load_zone_lookup
+
+    start = time.perf_counter()
+    for load_zones in (load_shapefile, load_geojson, load_zone_lookup):
+        load_zones()
+    connection = read_connection(os.path.abspath(db_path))
+    try:
+        fetch_concurrently(connection, warmup_loaders())
+    finally:
+        connection.close()
+    elapsed = time.perf_counter() - start
+    logger.info('warmed the page cache from %s in %.1f s', db_path, elapsed)
+    return elapsed
+
+
+def _watch(db_path, poll_seconds):
+    from dataAccess.cache import enable_copy_on_write, source_version
+
+    # The cache hands out shallow copies from now on, see dataAccess/cache.py
+    enable_copy_on_write()
+    version = None
+    while True:
+        try:
+            current = source_version(db_path)
+            if current != version:
+                # Wait until the file has stopped changing, an ingest may still be writing
+                time.sleep(1)
+                if source_version(db_path) == current:
+                    warm_cache(db_path)
+                    version = current
+                    continue
+        except Exception:
+            logger.exception('cache warm-up of %s failed', db_path)
+        time.sleep(poll_seconds)
+
+
+def start_warmup(db_path=None, poll_seconds=WARMUP_POLL_SECONDS):
+    # Start the warm-up thread of db_path (the dashboards database by default)
+    # once per process; later calls are no-ops
+    db_path = os.path.abspath(db_path or DB_PATH)
+    with _lock:
+        if db_path in _started or not os.path.exists(db_path):
+            return False
+        _started.add(db_path)
+    threading.Thread(target=_watch, args=(db_path, poll_seconds), name='cache-warmup', daemon=True).start()
+    return True
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from dataAccess.zones import TAXI_ZONES_SHAPEFILE
+
+# Point-in-polygon assignment of raw coordinates to taxi zone LocationIDs, for the
+# older TLC months and FHV feeds that carry pickup and drop-off latitude/longitude
+# instead of zone IDs.
+#
+# The zone polygons are reprojected to longitude/latitude once, so the points are
+# never transformed. An STRtree over the polygons then classifies a regular grid of
+# small cells once: cells that lie inside a single zone resolve every point in them
+# with array arithmetic, cells that touch no zone are outside the city, and only the
+# points of cells crossing a zone boundary are tested against the few polygons that
+# cell overlaps, one vectorized contains_xy call per zone. No Point geometry is ever
+# built, which is what makes millions of coordinates per second possible.
+
+# Lookup IDs for trips without usable coordinates and for points outside every zone
+UNKNOWN_LOCATION = 264
+OUTSIDE_LOCATION = 265
+
+# Grid cell size in degrees, about 200 m. Smaller cells leave fewer points for the
+# exact test but take longer to classify.
+CELL_DEGREES = 0.002
+
+
+class ZoneAssigner:
+
+    def __init__(self, filepath=TAXI_ZONES_SHAPEFILE, cell_degrees=CELL_DEGREES):
+        import geopandas as gpd
+        import shapely
+
+        zones = gpd.read_file(filepath).to_crs(4326)
+        self.geometries = np.array(list(zones.geometry))
+        self.location_ids = zones['LocationID'].to_numpy(dtype=np.int64)
+        shapely.prepare(self.geometries)
+        tree = shapely.STRtree(self.geometries)
+
+        self.cell_degrees = cell_degrees
+        self.min_x, self.min_y, max_x, max_y = zones.total_bounds
+        self.n_x = int(np.ceil((max_x - self.min_x) / cell_degrees))
+        self.n_y = int(np.ceil((max_y - self.min_y) / cell_degrees))
+        cell_x, cell_y = np.divmod(np.arange(self.n_x * self.n_y), self.n_y)
+        cells = shapely.box(
+            self.min_x + cell_x * cell_degrees, self.min_y + cell_y * cell_degrees,
+            self.min_x + (cell_x + 1) * cell_degrees, self.min_y + (cell_y + 1) * cell_degrees,
+        )
+
+        # LocationID of the cells inside a single zone, 0 for the others
+        inside_cell, inside_zone = tree.query(cells, predicate='within')
+        self.cell_location = np.zeros(len(cells), dtype=np.int64)
+        self.cell_location[inside_cell] = self.location_ids[inside_zone]
+
+        # Zones overlapping each boundary cell, as CSR arrays sorted by cell
+        cell, zone = tree.query(cells, predicate='intersects')
+        boundary = self.cell_location[cell] == 0
+        order = np.lexsort((zone[boundary], cell[boundary]))
+        self.candidate_zones = zone[boundary][order]
+        self.candidate_start = np.searchsorted(cell[boundary][order], np.arange(len(cells) + 1))
+
+    def assign(self, longitude, latitude):
+        # LocationID of every (longitude, latitude) point
+        import shapely
+
+        x = np.asarray(longitude, dtype=np.float64)
+        y = np.asarray(latitude, dtype=np.float64)
+        location = np.full(len(x), OUTSIDE_LOCATION, dtype=np.int64)
+
+        # Missing coordinates, often recorded as 0, are unknown rather than outside
+        unknown = ~(np.isfinite(x) & np.isfinite(y)) | (x == 0) | (y == 0)
+        location[unknown] = UNKNOWN_LOCATION
+
+        grid_x = np.floor((x - self.min_x) / self.cell_degrees)
+        grid_y = np.floor((y - self.min_y) / self.cell_degrees)
+        on_grid = ~unknown & (grid_x >= 0) & (grid_x < self.n_x) & (grid_y >= 0) & (grid_y < self.n_y)
+        cell = np.where(on_grid, grid_x * self.n_y + grid_y, 0).astype(np.int64)
+
+        resolved = self.cell_location[cell]
+        inside = on_grid & (resolved > 0)
+        location[inside] = resolved[inside]
+
+        # Pair every remaining point with the zones of its cell, then test the pairs zone by zone
+        points = np.flatnonzero(on_grid & (resolved == 0))
+        start = self.candidate_start[cell[points]]
+        counts = self.candidate_start[cell[points] + 1] - start
+        pair_point = np.repeat(points, counts)
+        offset = np.arange(len(pair_point)) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_zone = self.candidate_zones[np.repeat(start, counts) + offset]
+
+        order = np.argsort(pair_zone, kind='stable')
+        pair_point, pair_zone = pair_point[order], pair_zone[order]
+        bounds = np.searchsorted(pair_zone, np.arange(len(self.geometries) + 1))
+        hit = np.zeros(len(pair_point), dtype=bool)
+        for zone in np.flatnonzero(np.diff(bounds)):
+            pairs = slice(bounds[zone], bounds[zone + 1])
+            hit[pairs] = shapely.contains_xy(self.geometries[zone], x[pair_point[pairs]], y[pair_point[pairs]])
+
+        # A point on a shared edge keeps the first zone it falls in
+        location[pair_point[hit][::-1]] = self.location_ids[pair_zone[hit][::-1]]
+        return location
+
+    def assign_frame(self, df, longitude, latitude):
+        # LocationIDs of the points in two columns of a DataFrame
+        return pd.Series(self.assign(df[longitude], df[latitude]), index=df.index, dtype='int32')
@@ -0,0 +1,36 @@
+import os
+
+import pandas as pd
+
+from dataAccess.cache import cached_call
+from dataAccess.frames import compact_frame
+
+# Zone files used by the map sections and lookups, relative to the dashboards directory
+TAXI_ZONES_SHAPEFILE = 'data/dataFiles/taxi_zones/taxi_zones.shp'
+TAXI_ZONES_GEOJSON = 'data/dataFiles/NYC_Taxi_Zones.geojson'
+TAXI_ZONE_LOOKUP_CSV = 'data/dataFiles/taxi+_zone_lookup.csv'
+
+# Geometry is parsed once per process and file version, see dataAccess/cache.py.
+# geopandas is only imported when a map actually needs it.
+
+
+def _read_geometry(filepath):
+    import geopandas as gpd
+
+    return gpd.read_file(filepath)
+
+
+def load_shapefile(filepath=TAXI_ZONES_SHAPEFILE):
+    return cached_call(os.path.abspath(filepath), _read_geometry, filepath)
+
+
+def load_geojson(filepath=TAXI_ZONES_GEOJSON):
+    return cached_call(os.path.abspath(filepath), _read_geometry, filepath)
+
+
+def _read_zone_lookup(filepath):
+    return compact_frame(pd.read_csv(filepath))
+
+
+def load_zone_lookup(filepath=TAXI_ZONE_LOOKUP_CSV):
+    return cached_call(os.path.abspath(filepath), _read_zone_lookup, filepath)
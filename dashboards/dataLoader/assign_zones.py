@@ -0,0 +1,119 @@
+import argparse
+import os
+import sys
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from partitioned_stats import SOURCES
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataAccess.zone_assignment import ZoneAssigner
+from dataAccess.zones import TAXI_ZONES_SHAPEFILE
+
+# Adds PULocationID and DOLocationID to a trip file that only has pickup and drop-off
+# coordinates, as the TLC files before mid-2016 and some FHV feeds do, see
+# dataAccess/zone_assignment.py. The file is rewritten one row group at a time with
+# the two zone columns appended, so it can then go through the same loaders and
+# builders as the current files. With --service, the other columns of the older
+# schemas are also renamed to the current names of that service.
+
+taxi_zones_filepath = os.path.join('..', TAXI_ZONES_SHAPEFILE)
+
+# Coordinate column names used by the different eras of the TLC files, matched without case
+COORDINATE_COLUMNS = {
+    'PULocationID': [('pickup_longitude', 'pickup_latitude'), ('start_lon', 'start_lat')],
+    'DOLocationID': [('dropoff_longitude', 'dropoff_latitude'), ('end_lon', 'end_lat')],
+}
+
+# Older column names, lower case, and their current names. {pickup} and {dropoff}
+# stand for the timestamp columns of the service.
+LEGACY_COLUMNS = {
+    'trip_pickup_datetime': '{pickup}',
+    'pickup_datetime': '{pickup}',
+    'lpep_pickup_datetime': '{pickup}',
+    'trip_dropoff_datetime': '{dropoff}',
+    'dropoff_datetime': '{dropoff}',
+    'lpep_dropoff_datetime': '{dropoff}',
+    'passenger_count': 'passenger_count',
+    'trip_distance': 'trip_distance',
+    'rate_code': 'RatecodeID',
+    'payment_type': 'payment_type',
+    'fare_amt': 'fare_amount',
+    'fare_amount': 'fare_amount',
+    'tip_amt': 'tip_amount',
+    'tip_amount': 'tip_amount',
+    'tolls_amt': 'tolls_amount',
+    'tolls_amount': 'tolls_amount',
+    'total_amt': 'total_amount',
+    'total_amount': 'total_amount',
+}
+
+
+def current_names(names, service):
+    spec = SOURCES[service]
+    renamed = []
+    for name in names:
+        target = LEGACY_COLUMNS.get(name.lower())
+        renamed.append(target.format(pickup=spec['pickup'], dropoff=spec['dropoff']) if target else name)
+    return renamed
+
+
+def find_columns(schema_names, candidates):
+    names = {name.lower(): name for name in schema_names}
+    for longitude, latitude in candidates:
+        if longitude in names and latitude in names:
+            return names[longitude], names[latitude]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Assign taxi zones to the coordinates of a trip file.')
+    parser.add_argument('input', help='Parquet trip file with pickup and drop-off coordinates')
+    parser.add_argument('output', help='Parquet file to write, with PULocationID and DOLocationID added')
+    parser.add_argument('--service', choices=['yellow', 'green'], help='also rename older columns to the current names of this service')
+    parser.add_argument('--shapefile', default=taxi_zones_filepath, help='taxi zone shapefile')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    assigner = ZoneAssigner(args.shapefile)
+    print(f'Zone index built in {time.perf_counter() - start:.1f} s')
+
+    parquet_file = pq.ParquetFile(args.input)
+    columns = {}
+    for zone_column, candidates in COORDINATE_COLUMNS.items():
+        found = find_columns(parquet_file.schema_arrow.names, candidates)
+        if found is not None:
+            columns[zone_column] = found
+    if not columns:
+        parser.error(f'{args.input} has no pickup or drop-off coordinate columns')
+
+    writer = None
+    points = 0
+    assign_seconds = 0.0
+    for row_group in range(parquet_file.num_row_groups):
+        table = parquet_file.read_row_group(row_group)
+        for zone_column, (longitude, latitude) in columns.items():
+            start = time.perf_counter()
+            location = assigner.assign(table[longitude].to_numpy(zero_copy_only=False), table[latitude].to_numpy(zero_copy_only=False))
+            assign_seconds += time.perf_counter() - start
+            points += len(location)
+            if zone_column in table.column_names:
+                table = table.drop_columns([zone_column])
+            table = table.append_column(zone_column, pa.array(location, type=pa.int32()))
+        if args.service:
+            table = table.rename_columns(current_names(table.column_names, args.service))
+        if writer is None:
+            writer = pq.ParquetWriter(args.output, table.schema)
+        writer.write_table(table)
+    if writer is not None:
+        writer.close()
+
+    print(f'{points} points assigned in {assign_seconds:.1f} s ({points / max(assign_seconds, 1e-9) / 1e6:.1f} million per second)')
+    print(f'Wrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
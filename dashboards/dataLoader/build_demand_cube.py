@@ -0,0 +1,44 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataAccess.demand_cube import DEMAND_CUBE_DIR, cube_shape, read_manifest, update_cube
+from dataAccess.trips import trips_available
+
+# Memory-mapped cube of pickups and revenue per (pickup day, service, pickup hour,
+# zone) of the trips table, see dataAccess/demand_cube.py. Without --rebuild only
+# the trips appended to the trips table since the last run are added, new days
+# as new slots at the end of the cube, and a rebuilt trips table is counted again
+# from scratch into a new file.
+
+# Define the SQLite database path
+db_path = 'nyc_taxi_database.db'
+
+# The cube is written next to the dashboards' data files
+cube_dir = os.path.join('..', DEMAND_CUBE_DIR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or update the demand cube of the trips table.')
+    parser.add_argument('--db', default=db_path, help='SQLite database with the trips table')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the cube from every trip')
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.db)
+    if not trips_available(connection):
+        parser.error(f'{args.db} has no trips table, build it first with build_trips_table.py --rebuild')
+
+    start = time.perf_counter()
+    trips = update_cube(connection, rebuild=args.rebuild, directory=cube_dir)
+    manifest = read_manifest(cube_dir)
+    shape = ' x '.join(map(str, cube_shape(manifest)))
+    print(f"{trips} trips added in {time.perf_counter() - start:.1f} s, cube of {shape} holding {manifest['trips']} trips")
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from partitioned_stats import SOURCES, available_sources
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataAccess.od_matrix import (MEASURES, OD_MATRIX_DIR, accumulate, entry_version, has_measures, load_matrix,
+                                  matrix_path, open_matrix, read_manifest, source_version, write_manifest)
+from dataAccess.partitions import TRIP_TABLES, month_range, trips_in_range
+from dataAccess.quality import quality_flags, quality_sql
+from dataAccess.trips import (BATCHES_TABLE, SECONDS_PER_HOUR, TAXI_CODES, TRIPS_TABLE, table_exists, taxi_trips,
+                              trips_available, trips_generation)
+
+# Dense origin-destination matrices of the taxi trips, see dataAccess/od_matrix.py.
+# By default every pickup month of the taxi trips is rebuilt from the database, from
+# the trips table when it has one (so streamed trips are included) and from the
+# yellow and green trip tables otherwise; SQLite groups the trips by zone pair (and
+# hour) first, so only the non-empty cells come back to Python. --from-parquet adds
+# one more monthly file to the matrices of the months it covers, a row group at a
+# time, right after build_trips_table.py --from-parquet has appended it.
+
+# Define the SQLite database path
+db_path = 'nyc_taxi_database.db'
+
+# Matrices are written next to the dashboards' data files
+matrix_dir = os.path.join('..', OD_MATRIX_DIR)
+
+
+# Cells of the trips in {trips}, with the columns of the trips table. {quality} is
+# the trips' quality bitmask, evaluated from the rules for the trip tables, which
+# have no quality column.
+CELL_QUERY = '''
+    SELECT
+        PULocationID,
+        DOLocationID,
+        {hour} AS hour,
+        COUNT(*) AS trips,
+        SUM(total_fare) AS revenue,
+        SUM(distance) AS distance,
+        SUM(duration) AS duration,
+        SUM(({quality}) = 0) AS clean_trips,
+        SUM(CASE WHEN ({quality}) = 0 THEN total_fare END) AS clean_revenue
+    FROM
+        {trips}
+    GROUP BY
+        PULocationID, DOLocationID, hour
+'''
+
+
+def cell_query(connection, service, month, by_hour):
+    spec = SOURCES[service]
+    start, end = month_range(month)
+    trips = f'''(
+        SELECT
+            PULocationID,
+            DOLocationID,
+            {spec['pickup']},
+            total_amount AS total_fare,
+            trip_distance AS distance,
+            strftime('%s', {spec['dropoff']}) - strftime('%s', {spec['pickup']}) AS duration
+        FROM
+            {trips_in_range(connection, service, start, end)}
+    )'''
+    hour = f"CAST(substr({spec['pickup']}, 12, 2) AS INTEGER)" if by_hour else '0'
+    return CELL_QUERY.format(hour=hour, quality=quality_sql(), trips=trips)
+
+
+def trips_cell_query(month, by_hour):
+    start, end = month_range(month)
+    trips = f'(SELECT * FROM {TRIPS_TABLE} WHERE {taxi_trips(start, end)})'
+    hour = f'pickup_time / {SECONDS_PER_HOUR} % 24' if by_hour else '0'
+    return CELL_QUERY.format(hour=hour, quality='quality', trips=trips)
+
+
+def taxi_sources(connection):
+    return [source for source in available_sources(connection) if source in TRIP_TABLES]
+
+
+def trip_months(connection):
+    # Pickup months present in the trips table, or the trip tables without it
+    if trips_available(connection):
+        codes = ', '.join(map(str, TAXI_CODES.values()))
+        rows = connection.execute(f"SELECT DISTINCT strftime('%Y-%m', pickup_time, 'unixepoch') FROM {TRIPS_TABLE} "
+                                  f"WHERE service IN ({codes}) AND pickup_time IS NOT NULL")
+        return sorted(row[0] for row in rows)
+    months = set()
+    for service in taxi_sources(connection):
+        spec = SOURCES[service]
+        months.update(row[0] for row in connection.execute(f"SELECT DISTINCT substr({spec['pickup']}, 1, 7) FROM {spec['table']}") if row[0])
+    return sorted(months)
+
+
+def parquet_batches(filepath, service):
+    # One frame of trips per row group, with the columns accumulate expects and the
+    # pickup month. Hours are dropped by accumulate for matrices without the hour split.
+    spec = SOURCES[service]
+    parquet_file = pq.ParquetFile(filepath)
+    columns = ['PULocationID', 'DOLocationID', spec['pickup'], spec['dropoff'], 'total_amount', 'trip_distance']
+    for row_group in range(parquet_file.num_row_groups):
+        df = parquet_file.read_row_group(row_group, columns=columns).to_pandas()
+        pickup = df[spec['pickup']].astype('datetime64[s]')
+        trips = pd.DataFrame({
+            'month': pickup.to_numpy().astype('datetime64[M]').astype(str),
+            'PULocationID': df['PULocationID'],
+            'DOLocationID': df['DOLocationID'],
+            'hour': pickup.dt.hour,
+            'trips': 1,
+            'revenue': df['total_amount'],
+            'distance': df['trip_distance'],
+            'duration': (df[spec['dropoff']].astype('datetime64[s]') - pickup).dt.total_seconds(),
+        })
+        clean = quality_flags(trips.rename(columns={'revenue': 'total_fare'})) == 0
+        yield trips.assign(clean_trips=clean.astype('int64'), clean_revenue=trips['revenue'].where(clean))
+
+
+def record_month(manifest, month, matrix, source, version):
+    # version is the source_version of the database the matrix now matches
+    entry = manifest.setdefault(month, {'sources': []})
+    entry['hours'] = matrix.shape[1]
+    entry['trips'] = int(matrix[MEASURES.index('trips')].sum())
+    entry['sources'].append(source)
+    entry.update(version)
+
+
+def build_month(connection, month, by_hour, manifest):
+    # Recompute a month from the database into a new file, then swap it in, so the
+    # pages keep reading the previous matrix until the new one is complete
+    version = source_version(connection)
+    building = f'{month}.building'
+    if os.path.exists(matrix_path(building, matrix_dir)):
+        os.remove(matrix_path(building, matrix_dir))
+    matrix = open_matrix(building, by_hour, matrix_dir)
+    if trips_available(connection):
+        queries = [trips_cell_query(month, by_hour)]
+    else:
+        queries = [cell_query(connection, service, month, by_hour) for service in taxi_sources(connection)]
+    for query in queries:
+        accumulate(matrix, pd.read_sql_query(query, connection))
+    matrix.flush()
+    os.replace(matrix_path(building, matrix_dir), matrix_path(month, matrix_dir))
+    manifest.pop(month, None)
+    record_month(manifest, month, matrix, 'database', version)
+
+
+def version_before(connection, filename):
+    # source_version of the database before build_trips_table.py --from-parquet
+    # appended the file, when its rows are the last batch logged. None when that
+    # is unknown: other rows came after it, or there is no trips table to log it.
+    if not trips_available(connection) or not table_exists(connection, BATCHES_TABLE):
+        return None
+    batches = connection.execute(f'SELECT source, first_rowid FROM {BATCHES_TABLE} ORDER BY batch DESC LIMIT 2').fetchall()
+    if not batches or batches[0][0] != filename:
+        return None
+    # A first batch starts the log, the table had no generation before it
+    generation = trips_generation(connection) if len(batches) == 2 else None
+    return {'last_rowid': {TRIPS_TABLE: batches[0][1] - 1}, 'generation': generation}
+
+
+def fold_parquet(filepath, service, manifest, before, after):
+    # Add the trips of a Parquet file to the matrices of their pickup months that
+    # matched the database before the file was ingested (source_version before).
+    # Months without a matrix are left to a rebuild, like months already counting
+    # the file or behind the database, which the fold would not bring up to date.
+    # Returns the months folded and the months of the file that were skipped.
+    foldable = {}
+    for batch in parquet_batches(filepath, service):
+        for month, trips in batch.groupby('month'):
+            if month not in foldable:
+                entry = manifest.get(month)
+                matrix = load_matrix(month, matrix_dir)
+                foldable[month] = (before is not None and entry is not None and entry_version(entry) == before
+                                   and matrix is not None and has_measures(matrix))
+            if not foldable[month]:
+                continue
+            matrix = open_matrix(month, manifest[month]['hours'] > 1, matrix_dir)
+            accumulate(matrix, trips)
+            matrix.flush()
+    folded = sorted(month for month, fold in foldable.items() if fold)
+    skipped = sorted(month for month, fold in foldable.items() if not fold)
+    for month in folded:
+        entry = manifest[month]
+        entry['trips'] = int(load_matrix(month, matrix_dir)[MEASURES.index('trips')].sum())
+        entry['sources'].append(os.path.basename(filepath))
+    # Months the file has no trips in match the database again as well
+    for month, entry in manifest.items():
+        if before is not None and month not in skipped and entry_version(entry) == before:
+            entry.update(after)
+    return folded, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the origin-destination matrices of the taxi trips.')
+    parser.add_argument('--db', default=db_path, help='SQLite database with the trip tables')
+    parser.add_argument('--month', action='append', help='only rebuild this pickup month, as YYYY-MM (repeatable)')
+    parser.add_argument('--by-hour', action='store_true', help='also split the matrices by pickup hour')
+    parser.add_argument('--from-parquet', metavar='FILE', help='add the trips of this Parquet file instead of rebuilding')
+    parser.add_argument('--source', choices=sorted(TRIP_TABLES), help='service of the --from-parquet file')
+    args = parser.parse_args()
+    if args.from_parquet and not args.source:
+        parser.error('--from-parquet needs --source')
+
+    if not os.path.exists(args.db):
+        parser.error(f'{args.db} does not exist')
+
+    manifest = read_manifest(matrix_dir)
+    connection = sqlite3.connect(args.db)
+    if args.from_parquet:
+        # The file is already in the database, so the months it is folded into
+        # match the database again
+        start = time.perf_counter()
+        before = version_before(connection, os.path.basename(args.from_parquet))
+        after = source_version(connection)
+        months, skipped = fold_parquet(args.from_parquet, args.source, manifest, before, after)
+        print(f'{args.from_parquet}: added to {", ".join(months) or "no month"} in {time.perf_counter() - start:.1f} s')
+        stale = [month for month in skipped if month not in manifest or entry_version(manifest[month]) != after]
+        if before is None:
+            print(f'{args.from_parquet} is not the last file build_trips_table.py --from-parquet appended, '
+                  'rebuild the months instead')
+        elif stale:
+            print(f'{", ".join(stale)} not built or not current before the file, rebuild them with --month')
+    else:
+        for month in args.month or trip_months(connection):
+            start = time.perf_counter()
+            build_month(connection, month, args.by_hour, manifest)
+            print(f"{month}: {manifest[month]['trips']} trips in {time.perf_counter() - start:.1f} s")
+    connection.close()
+    write_manifest(manifest, matrix_dir)
+
+
+if __name__ == '__main__':
+    main()
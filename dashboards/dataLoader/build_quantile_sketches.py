@@ -0,0 +1,123 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from partitioned_stats import FHV_FARE_COLUMNS, FHV_LICENSE_SERVICES, SOURCES, STATS_SERVICES, available_sources
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataAccess.quantiles import SKETCH_TABLE, UNKNOWN_HOUR, update_sketches
+
+# Fare and duration quantile sketches per (service, pickup zone, pickup hour), see
+# dataAccess/quantiles.py. --rebuild recomputes them from the trip tables of the
+# database. --from-parquet folds one more monthly file into the existing sketches
+# as it is ingested, without touching the trips already counted. Trips are read
+# in batches, so memory stays flat whatever the size of the month.
+
+# Define the SQLite database path
+db_path = 'nyc_taxi_database.db'
+
+batch_rows = 500_000
+
+
+def sketch_query(connection, source):
+    spec = SOURCES[source]
+    columns = {row[1] for row in connection.execute(f"PRAGMA table_info({spec['table']})")}
+    hour = f"CAST(substr({spec['pickup']}, 12, 2) AS INTEGER)" if spec['pickup'] in columns else str(UNKNOWN_HOUR)
+    if source == 'fhvhv':
+        return f'''
+            SELECT Hvfhs_license_num AS service, PULocationID, {hour} AS hour,
+                   {' + '.join(FHV_FARE_COLUMNS)} AS fare, trip_time AS duration
+            FROM {spec['table']}
+        '''
+    return f'''
+        SELECT '{STATS_SERVICES[source]}' AS service, PULocationID, {hour} AS hour,
+               total_amount AS fare,
+               strftime('%s', {spec['dropoff']}) - strftime('%s', {spec['pickup']}) AS duration
+        FROM {spec['table']}
+    '''
+
+
+def sqlite_batches(connection, source):
+    for batch in pd.read_sql_query(sketch_query(connection, source), connection, chunksize=batch_rows):
+        if source == 'fhvhv':
+            batch['service'] = batch['service'].map(FHV_LICENSE_SERVICES).fillna(batch['service'])
+        batch['hour'] = batch['hour'].fillna(UNKNOWN_HOUR)
+        yield batch
+
+
+def parquet_batches(filepath, source):
+    # Same columns as sketch_query, one Parquet row group at a time
+    spec = SOURCES[source]
+    parquet_file = pq.ParquetFile(filepath)
+    for row_group in range(parquet_file.num_row_groups):
+        if source == 'fhvhv':
+            columns = ['hvfhs_license_num', 'PULocationID', spec['pickup'], 'trip_time'] + FHV_FARE_COLUMNS
+        else:
+            columns = ['PULocationID', spec['pickup'], spec['dropoff'], 'total_amount']
+        df = parquet_file.read_row_group(row_group, columns=columns).to_pandas()
+        pickup = df[spec['pickup']]
+        if source == 'fhvhv':
+            service = df['hvfhs_license_num'].map(FHV_LICENSE_SERVICES).fillna(df['hvfhs_license_num'])
+            fare = df[FHV_FARE_COLUMNS].sum(axis=1, min_count=len(FHV_FARE_COLUMNS))
+            duration = df['trip_time']
+        else:
+            service = STATS_SERVICES[source]
+            fare = df['total_amount']
+            duration = (df[spec['dropoff']].astype('datetime64[s]') - pickup.astype('datetime64[s]')).dt.total_seconds()
+        yield pd.DataFrame({
+            'service': service,
+            'PULocationID': df['PULocationID'],
+            'hour': pickup.dt.hour.fillna(UNKNOWN_HOUR).astype('int64'),
+            'fare': fare,
+            'duration': duration,
+        })
+
+
+def fold_batches(connection, batches):
+    trips = 0
+    for batch in batches:
+        update_sketches(connection, batch)
+        trips += len(batch)
+    return trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or extend the fare and duration quantile sketches.')
+    parser.add_argument('--db', default=db_path, help='SQLite database with the trip tables')
+    parser.add_argument('--rebuild', action='store_true', help='drop the sketches and recompute them from the trip tables')
+    parser.add_argument('--from-parquet', metavar='FILE', help='fold the trips of this Parquet file into the sketches')
+    parser.add_argument('--source', choices=sorted(SOURCES), help='service of the --from-parquet file')
+    args = parser.parse_args()
+    if args.from_parquet and not args.source:
+        parser.error('--from-parquet needs --source')
+    if not args.rebuild and not args.from_parquet:
+        parser.error('nothing to do, pass --rebuild and/or --from-parquet')
+
+    connection = sqlite3.connect(args.db)
+    if args.rebuild:
+        connection.execute(f'DROP TABLE IF EXISTS {SKETCH_TABLE}')
+        for source in available_sources(connection):
+            start = time.perf_counter()
+            trips = fold_batches(connection, sqlite_batches(connection, source))
+            print(f'{source}: {trips} trips sketched in {time.perf_counter() - start:.1f} s')
+    if args.from_parquet:
+        start = time.perf_counter()
+        trips = fold_batches(connection, parquet_batches(args.from_parquet, args.source))
+        print(f'{args.from_parquet}: {trips} trips added in {time.perf_counter() - start:.1f} s')
+
+    buckets = connection.execute(f'SELECT COUNT(*) FROM {SKETCH_TABLE}').fetchone()[0]
+    print(f'{SKETCH_TABLE}: {buckets} buckets')
+
+    # Commit the changes and close the connection
+    connection.commit()
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
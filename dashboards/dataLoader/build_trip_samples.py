@@ -0,0 +1,93 @@
+import argparse
+import sqlite3
+import time
+
+# Stratified samples for the approximate query mode of the dashboards. Each stratum
+# is one (service, pickup month, pickup zone). Its trips are put in a random order;
+# the first min_rows always belong to the sample and trip k (0-based) of a stratum
+# with N trips gets inclusion_rate k / N, so the rows with inclusion_rate < r are a
+# simple random sample of max(min_rows, ceil(r * N)) trips. Only rows up to
+# --max-rate are stored. dataAccess/approximate.py reads them back.
+
+# Define the SQLite database path
+db_path = 'nyc_taxi_database.db'
+
+sample_table_name = 'trip_samples'
+sample_info_table_name = 'trip_sample_info'
+
+trip_tables = {
+    'yellow': ('yellow_tripdata', 'tpep_pickup_datetime'),
+    'green': ('green_tripdata', 'lpep_pickup_datetime'),
+}
+
+
+def sample_service(connection, service, max_rate, min_rows):
+    table_name, pickup = trip_tables[service]
+    stratum = f'substr({pickup}, 1, 7), PULocationID'
+    connection.execute(f'''
+        INSERT INTO {sample_table_name}
+        SELECT
+            service,
+            month,
+            PULocationID,
+            DOLocationID,
+            pickup_datetime,
+            total_amount,
+            population_rows,
+            CASE WHEN sample_rank < :min_rows THEN 0.0 ELSE CAST(sample_rank AS REAL) / population_rows END AS inclusion_rate
+        FROM (
+            SELECT
+                '{service}' AS service,
+                substr({pickup}, 1, 7) AS month,
+                PULocationID,
+                DOLocationID,
+                {pickup} AS pickup_datetime,
+                total_amount,
+                ROW_NUMBER() OVER (PARTITION BY {stratum} ORDER BY random()) - 1 AS sample_rank,
+                COUNT(*) OVER (PARTITION BY {stratum}) AS population_rows
+            FROM {table_name}
+            WHERE {pickup} IS NOT NULL
+        )
+        WHERE sample_rank < :min_rows OR CAST(sample_rank AS REAL) / population_rows < :max_rate
+    ''', {'min_rows': min_rows, 'max_rate': max_rate})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the stratified trip samples for approximate queries.')
+    parser.add_argument('--db', default=db_path, help='SQLite database with the trip tables')
+    parser.add_argument('--max-rate', type=float, default=0.2, help='largest sample rate the dashboards can ask for')
+    parser.add_argument('--min-rows', type=int, default=20, help='trips kept from every stratum, however small the rate')
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.db)
+    connection.execute(f'DROP TABLE IF EXISTS {sample_table_name}')
+    connection.execute(f'''
+        CREATE TABLE {sample_table_name} (
+            service TEXT,
+            month TEXT,
+            PULocationID INTEGER,
+            DOLocationID INTEGER,
+            pickup_datetime TEXT,
+            total_amount REAL,
+            population_rows INTEGER,
+            inclusion_rate REAL
+        )
+    ''')
+    for service in trip_tables:
+        start = time.perf_counter()
+        sample_service(connection, service, args.max_rate, args.min_rows)
+        print(f'{service}: sampled in {time.perf_counter() - start:.1f} s')
+
+    # A smaller rate reads a prefix of this index
+    connection.execute(f'CREATE INDEX idx_{sample_table_name}_rate ON {sample_table_name} (service, month, inclusion_rate)')
+    connection.execute(f'DROP TABLE IF EXISTS {sample_info_table_name}')
+    connection.execute(f'CREATE TABLE {sample_info_table_name} (max_rate REAL, min_rows INTEGER, built_at TEXT)')
+    connection.execute(f"INSERT INTO {sample_info_table_name} VALUES (?, ?, datetime('now'))", (args.max_rate, args.min_rows))
+
+    # Commit the changes and close the connection
+    connection.commit()
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from partitioned_stats import FHV_FARE_COLUMNS, SOURCES, available_sources
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataAccess.quality import (CREATE_QUALITY_SQL, QUALITY_TABLE, RULES, add_rule_counts, load_rule_counts, quality_flags,
+                                quality_sql, rule_counts)
+from dataAccess.trips import (BATCHES_TABLE, OTHER_FHV_CODE, SERVICE_CODES, SERVICES_TABLE, TAXI_CODES, TRIPS_INDEXES,
+                              TRIPS_TABLE, add_quality_column, create_trips_indexes, create_trips_table, last_trip_rowid,
+                              record_batch)
+
+# Builds the unified trips fact table, see dataAccess/trips.py. --rebuild fills it
+# from the yellow, green and FHV tables of the database inside SQLite, converting
+# timestamps to epoch seconds and summing the FHV fare components once per trip
+# instead of in every query. --from-parquet appends one more monthly file a row
+# group at a time, as it is ingested. Rows are inserted in pickup order per
+# service, so the index ranges of a date filter point at neighbouring pages. The
+# data quality rules of dataAccess/quality.py are evaluated as the rows go in, into
+# the quality bitmask of every trip and the per-rule counters of trip_quality.
+
+# Define the SQLite database path
+db_path = 'nyc_taxi_database.db'
+
+TRIP_COLUMNS = ['service', 'pickup_time', 'dropoff_time', 'PULocationID', 'DOLocationID',
+                'passenger_count', 'payment_type', 'distance', 'duration', 'total_fare']
+
+
+def epoch(column):
+    return f"CAST(strftime('%s', {column}) AS INTEGER)"
+
+
+def fhv_service_sql(license_column):
+    cases = ' '.join(f"WHEN '{license}' THEN {code}" for code, (_, _, license) in SERVICE_CODES.items() if license)
+    return f'CASE {license_column} {cases} ELSE {OTHER_FHV_CODE} END'
+
+
+def insert_query(connection, source):
+    spec = SOURCES[source]
+    columns = {row[1] for row in connection.execute(f"PRAGMA table_info({spec['table']})")}
+    order = 'ORDER BY pickup_time' if spec['pickup'] in columns else ''
+    if source == 'fhvhv':
+        # Compact FHV loads written before the timestamps and drop-off zones were
+        # kept have trips without a pickup time or destination
+        pickup = epoch(spec['pickup']) if spec['pickup'] in columns else 'NULL'
+        dropoff = epoch(spec['dropoff']) if spec['dropoff'] in columns else 'NULL'
+        destination = 'DOLocationID' if 'DOLocationID' in columns else 'NULL'
+        select = f'''
+            SELECT
+                {fhv_service_sql('Hvfhs_license_num')} AS service, {pickup} AS pickup_time, {dropoff} AS dropoff_time,
+                PULocationID, {destination} AS DOLocationID, NULL AS passenger_count, NULL AS payment_type,
+                trip_miles AS distance, trip_time AS duration, {' + '.join(FHV_FARE_COLUMNS)} AS total_fare
+            FROM {spec['table']}
+        '''
+    else:
+        select = f'''
+            SELECT
+                {TAXI_CODES[source]} AS service, pickup_time, dropoff_time, PULocationID, DOLocationID,
+                CAST(passenger_count AS INTEGER) AS passenger_count, CAST(payment_type AS INTEGER) AS payment_type,
+                trip_distance AS distance, dropoff_time - pickup_time AS duration, total_amount AS total_fare
+            FROM (
+                SELECT *, {epoch(spec['pickup'])} AS pickup_time, {epoch(spec['dropoff'])} AS dropoff_time
+                FROM {spec['table']}
+            )
+        '''
+    # The quality rules are evaluated on the normalized columns, in the same statement
+    return f'''
+        INSERT INTO {TRIPS_TABLE} ({', '.join(TRIP_COLUMNS)}, quality)
+        SELECT {', '.join(TRIP_COLUMNS)}, {quality_sql()} FROM ({select}) {order}
+    '''
+
+
+def epoch_seconds(series):
+    # Whole seconds since the epoch, as strftime('%s') gives them, NULL for missing times
+    seconds = series.astype('datetime64[s]').astype('int64').astype('float64')
+    seconds[series.isna()] = np.nan
+    return seconds
+
+
+def trips_frame(df, source):
+    # TRIP_COLUMNS and the quality flags of trips in the TLC schema of a service
+    spec = SOURCES[source]
+    pickup = epoch_seconds(df[spec['pickup']])
+    dropoff = epoch_seconds(df[spec['dropoff']])
+    if source == 'fhvhv':
+        licenses = {license: code for code, (_, _, license) in SERVICE_CODES.items() if license}
+        trips = pd.DataFrame({
+            'service': df['hvfhs_license_num'].map(licenses).fillna(OTHER_FHV_CODE),
+            'passenger_count': np.nan,
+            'payment_type': np.nan,
+            'distance': df['trip_miles'],
+            'duration': df['trip_time'],
+            # A NULL component makes the whole SQL sum NULL
+            'total_fare': df[FHV_FARE_COLUMNS].sum(axis=1, min_count=len(FHV_FARE_COLUMNS)),
+        })
+    else:
+        trips = pd.DataFrame({
+            'service': TAXI_CODES[source],
+            'passenger_count': df['passenger_count'],
+            'payment_type': df['payment_type'],
+            'distance': df['trip_distance'],
+            'duration': dropoff - pickup,
+            'total_fare': df['total_amount'],
+        })
+    trips['pickup_time'] = pickup
+    trips['dropoff_time'] = dropoff
+    trips['PULocationID'] = df['PULocationID']
+    trips['DOLocationID'] = df['DOLocationID']
+    trips['quality'] = quality_flags(trips)
+    return trips.sort_values('pickup_time', kind='stable')[TRIP_COLUMNS + ['quality']]
+
+
+def parquet_batches(filepath, source):
+    # trips_frame of one Parquet row group at a time
+    parquet_file = pq.ParquetFile(filepath)
+    for row_group in range(parquet_file.num_row_groups):
+        yield trips_frame(parquet_file.read_row_group(row_group).to_pandas(), source)
+
+
+def insert_batch(connection, trips):
+    # NaN becomes NULL, whole floats are stored as integers by the typed columns
+    rows = trips.astype(object).where(trips.notna(), None).itertuples(index=False, name=None)
+    placeholders = ', '.join('?' * len(trips.columns))
+    connection.executemany(f"INSERT INTO {TRIPS_TABLE} ({', '.join(trips.columns)}) VALUES ({placeholders})", rows)
+    add_rule_counts(connection, rule_counts(trips.groupby(['service', 'quality']).size().rename('trips').reset_index()))
+    return len(trips)
+
+
+def recount_rules(connection):
+    # Per-rule counters of the whole table, after a rebuild or when the flags were added
+    groups = pd.read_sql_query(f'SELECT service, quality, COUNT(*) AS trips FROM {TRIPS_TABLE} GROUP BY service, quality', connection)
+    connection.execute(f'DELETE FROM {QUALITY_TABLE}')
+    add_rule_counts(connection, rule_counts(groups))
+
+
+def print_rule_counts(connection):
+    names = {code: name for code, (_, name, _) in SERVICE_CODES.items()}
+    for row in load_rule_counts(connection).itertuples():
+        print(f'{names[row.service]}: {row.trips} trips flagged {row.rule} ({RULES[row.rule][2]})')
+
+
+def drop_trips_indexes(connection):
+    # A full rebuild is faster without the indexes, they are created again at the end
+    for name in TRIPS_INDEXES:
+        connection.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or extend the unified trips fact table.')
+    parser.add_argument('--db', default=db_path, help='SQLite database with the trip tables')
+    parser.add_argument('--rebuild', action='store_true', help='drop the trips table and refill it from the trip tables')
+    parser.add_argument('--from-parquet', metavar='FILE', help='append the trips of this Parquet file')
+    parser.add_argument('--source', choices=sorted(SOURCES), help='service of the --from-parquet file')
+    args = parser.parse_args()
+    if args.from_parquet and not args.source:
+        parser.error('--from-parquet needs --source')
+    if not args.rebuild and not args.from_parquet:
+        parser.error('nothing to do, pass --rebuild and/or --from-parquet')
+
+    connection = sqlite3.connect(args.db)
+    # One transaction for the whole run, DDL included: a failed rebuild leaves the
+    # previous trips table in place and a failed append adds no rows
+    connection.execute('BEGIN')
+    if args.rebuild:
+        connection.execute(f'DROP TABLE IF EXISTS {TRIPS_TABLE}')
+        connection.execute(f'DROP TABLE IF EXISTS {BATCHES_TABLE}')
+    create_trips_table(connection)
+    connection.execute(CREATE_QUALITY_SQL)
+    recount = add_quality_column(connection) or args.rebuild
+
+    if args.rebuild:
+        drop_trips_indexes(connection)
+        for source in available_sources(connection):
+            start = time.perf_counter()
+            first_rowid = last_trip_rowid(connection) + 1
+            connection.execute(insert_query(connection, source))
+            rows = record_batch(connection, f'{source}_tripdata', first_rowid)
+            print(f'{source}: {rows} trips in {time.perf_counter() - start:.1f} s')
+    if args.from_parquet:
+        start = time.perf_counter()
+        first_rowid = last_trip_rowid(connection) + 1
+        for trips in parquet_batches(args.from_parquet, args.source):
+            insert_batch(connection, trips)
+        rows = record_batch(connection, os.path.basename(args.from_parquet), first_rowid)
+        print(f'{args.from_parquet}: {rows} trips in {time.perf_counter() - start:.1f} s')
+    if recount:
+        recount_rules(connection)
+
+    start = time.perf_counter()
+    create_trips_indexes(connection)
+    connection.execute(f'ANALYZE {TRIPS_TABLE}')
+    print(f'Indexes built in {time.perf_counter() - start:.1f} s')
+
+    counts = connection.execute(f'''
+        SELECT s.name, COUNT(*) FROM {TRIPS_TABLE} t JOIN {SERVICES_TABLE} s ON t.service = s.code GROUP BY t.service
+    ''').fetchall()
+    print(', '.join(f'{name}: {count}' for name, count in counts))
+    print_rule_counts(connection)
+
+    # Commit the changes and close the connection
+    connection.commit()
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataAccess.trips import trips_available
+from dataAccess.vendor_rollup import ROLLUP_TABLE, update_rollup
+
+# Vendor statistics per (pickup day, pickup hour, pickup zone, service) for the
+# vendor comparison page, see dataAccess/vendor_rollup.py. Without --rebuild only
+# the trips appended to the trips table since the last run are added, and a
+# rebuilt trips table is counted again from scratch.
+
+# Define the SQLite database path
+db_path = 'nyc_taxi_database.db'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or update the vendor statistics rollup of the trips table.')
+    parser.add_argument('--db', default=db_path, help='SQLite database with the trips table')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the rollup from every trip')
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.db)
+    if not trips_available(connection):
+        parser.error(f'{args.db} has no trips table, build it first with build_trips_table.py --rebuild')
+
+    start = time.perf_counter()
+    trips = update_rollup(connection, rebuild=args.rebuild)
+    rows = connection.execute(f'SELECT COUNT(*) FROM {ROLLUP_TABLE}').fetchone()[0]
+    print(f'{trips} trips added in {time.perf_counter() - start:.1f} s, {ROLLUP_TABLE}: {rows} rows')
+
+    # Commit the changes and close the connection
+    connection.commit()
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
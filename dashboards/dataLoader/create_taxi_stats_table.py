@@ -1,13 +1,32 @@
+import argparse
+import os
 import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+from partitioned_stats import (SOURCES, available_sources, compute_partials, source_of, taxi_pref_from_partials,
+                               taxi_stats_from_partials)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataAccess.quality import CLEAN_TRIPS
 
 # Define the SQLite database path
 db_path = 'nyc_taxi_database.db'
 
-# Create a connection to the database
-connection = sqlite3.connect(db_path)
+# Snapshots read by the vendor comparison page
+taxi_stats_csv = '../data/dataFiles/taxi_stats.csv'
+taxi_pref_csv = '../data/dataFiles/taxi_pref.csv'
+taxi_pref_query_filepath = 'queries/taxi_preference_query.txt'
 
-# Create a cursor object to execute SQL queries
-cursor = connection.cursor()
+# Monthly trip files, used by --from-parquet instead of the SQLite tables
+parquet_filepaths = {
+    'fhvhv': '../data/dataFiles/fhvhv_tripdata_2023-09.parquet',
+    'yellow': '../data/dataFiles/yellow_tripdata_2023-09.parquet',
+    'green': '../data/dataFiles/green_tripdata_2023-09.parquet',
+}
 
 # Your SQL query
 sql_query = '''
@@ -55,9 +74,149 @@ JOIN taxi_zone_lookup tzl ON gtd.PULocationID = tzl.LocationID
 GROUP BY tzl.Borough;
 '''
 
-# Execute the SQL query
-cursor.executescript(sql_query)
+# The same partial sums as partitioned_stats.partition_query, per service and pickup
+# zone, in one pass over the unified trips table (see build_trips_table.py). FHV
+# fares are already summed and durations already in seconds there. {where} keeps
+# every trip, or only the trips breaking no data quality rule; those are read from
+# the covering partial index of the clean trips, which the planner does not pick by
+# itself because it prefers the index ordered like the GROUP BY.
+trips_partials_query = '''
+SELECT
+    CASE WHEN s.source = 'fhvhv' THEN s.license ELSE s.source END AS service,
+    t.PULocationID,
+    COUNT(*) AS rides,
+    SUM(t.total_fare) AS fare_sum, COUNT(t.total_fare) AS fare_count,
+    SUM(t.distance) AS distance_sum, COUNT(t.distance) AS distance_count,
+    SUM(t.duration) AS time_sum, COUNT(t.duration) AS time_count,
+    SUM(CASE WHEN s.source != 'fhvhv' THEN t.duration / t.distance END) AS time_per_distance_sum,
+    COUNT(CASE WHEN s.source != 'fhvhv' THEN t.duration / t.distance END) AS time_per_distance_count
+FROM trips t {index}
+JOIN trip_services s ON t.service = s.code
+{where}
+GROUP BY t.service, t.PULocationID
+'''
+
+
+def read_taxi_pref_query():
+    with open(taxi_pref_query_filepath) as f:
+        return f.read().strip().strip("'").strip()
+
+
+def source_union(query, sources):
+    # The UNION ALL blocks of query reading the trip tables of the given sources,
+    # so --verify runs on a database holding only some of them
+    blocks = [block.strip().rstrip(';') for block in query.split('UNION ALL')]
+    tables = {SOURCES[source]['table'] for source in sources}
+    return '\n\nUNION ALL\n\n'.join(block for block in blocks if any(f' {table} ' in block for table in tables))
+
+
+def create_tables_sql(db_path):
+    # Original single statement, run by SQLite on one core
+    connection = sqlite3.connect(db_path)
+    cursor = connection.cursor()
+
+    # Execute the SQL query
+    cursor.executescript(sql_query)
+    taxi_pref_df = pd.read_sql_query(read_taxi_pref_query(), connection)
+    taxi_stats_df = pd.read_sql_query('SELECT * FROM taxi_stats', connection)
+
+    # Commit the changes and close the connection
+    connection.commit()
+    connection.close()
+    return taxi_stats_df, taxi_pref_df
+
+
+def create_tables_partitioned(db_path, workers=None, from_parquet=False):
+    # Partial sums per pickup day (or Parquet row group) computed in a process pool
+    connection = sqlite3.connect(db_path)
+    taxi_zone_df = pd.read_sql_query('SELECT * FROM taxi_zone_lookup', connection)
+    parquet_files = {}
+    if from_parquet:
+        parquet_files = {source: filepath for source, filepath in parquet_filepaths.items() if os.path.exists(filepath)}
+    sources = [source for source in parquet_filepaths if source in parquet_files or source in available_sources(connection)]
+    connection.close()
+
+    zone_totals = compute_partials(sources, workers=workers, db_path=db_path, parquet_files=parquet_files)
+    taxi_stats_df = taxi_stats_from_partials(zone_totals, taxi_zone_df, sources)
+    taxi_pref_df = taxi_pref_from_partials(zone_totals, taxi_zone_df, sources)
+
+    connection = sqlite3.connect(db_path)
+    taxi_stats_df.to_sql('taxi_stats', connection, index=False, if_exists='replace')
+    connection.commit()
+    connection.close()
+    return taxi_stats_df, taxi_pref_df
+
+
+def create_tables_trips(db_path, exclude_flagged=False):
+    connection = sqlite3.connect(db_path)
+    taxi_zone_df = pd.read_sql_query('SELECT * FROM taxi_zone_lookup', connection)
+    if exclude_flagged:
+        query = trips_partials_query.format(index='INDEXED BY trips_clean_zone', where=f'WHERE t.{CLEAN_TRIPS}')
+    else:
+        query = trips_partials_query.format(index='', where='')
+    zone_totals = pd.read_sql_query(query, connection)
+    present = set(zone_totals['service'].map(source_of))
+    sources = [source for source in parquet_filepaths if source in present]
+
+    taxi_stats_df = taxi_stats_from_partials(zone_totals, taxi_zone_df, sources)
+    taxi_pref_df = taxi_pref_from_partials(zone_totals, taxi_zone_df, sources)
+    taxi_stats_df.to_sql('taxi_stats', connection, index=False, if_exists='replace')
+    connection.commit()
+    connection.close()
+    return taxi_stats_df, taxi_pref_df
+
+
+def compare_tables(expected, actual, name):
+    # Same rows in the same order, floats equal up to summation order
+    expected = expected.reset_index(drop=True)
+    actual = actual.reset_index(drop=True)[expected.columns]
+    pd.testing.assert_frame_equal(expected, actual, check_dtype=False, rtol=1e-9)
+    print(f'{name}: {len(actual)} rows match the SQL output')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the taxi_stats table and the vendor comparison snapshots.')
+    parser.add_argument('--db', default=db_path, help='SQLite database with the trip tables')
+    parser.add_argument('--mode', choices=['sql', 'partitioned', 'trips'], default='sql',
+                        help='one SQLite statement, partial aggregates merged from a process pool, '
+                             'or one pass over the trips table')
+    parser.add_argument('--workers', type=int, help='processes for --mode partitioned (default: all cores)')
+    parser.add_argument('--from-parquet', action='store_true',
+                        help='read the monthly Parquet files by row group where they exist')
+    parser.add_argument('--export-csv', action='store_true', help='write taxi_stats.csv and taxi_pref.csv')
+    parser.add_argument('--exclude-flagged', action='store_true',
+                        help='with --mode trips, leave out the trips breaking a data quality rule')
+    parser.add_argument('--verify', action='store_true', help='also run the SQL mode and compare the results')
+    args = parser.parse_args()
+    if args.exclude_flagged and args.mode != 'trips':
+        parser.error('--exclude-flagged needs --mode trips')
+    if args.exclude_flagged and args.verify:
+        parser.error('--verify compares all trips, it cannot be combined with --exclude-flagged')
+
+    start = time.perf_counter()
+    if args.mode == 'sql':
+        taxi_stats_df, taxi_pref_df = create_tables_sql(args.db)
+    elif args.mode == 'trips':
+        taxi_stats_df, taxi_pref_df = create_tables_trips(args.db, args.exclude_flagged)
+    else:
+        taxi_stats_df, taxi_pref_df = create_tables_partitioned(args.db, args.workers, args.from_parquet)
+    print(f'{args.mode} aggregation took {time.perf_counter() - start:.2f} s')
+
+    if args.verify and args.mode != 'sql':
+        connection = sqlite3.connect(args.db)
+        sources = available_sources(connection)
+        start = time.perf_counter()
+        stats_query = sql_query.replace('CREATE TABLE IF NOT EXISTS taxi_stats AS', '')
+        compare_tables(pd.read_sql_query(source_union(stats_query, sources), connection), taxi_stats_df, 'taxi_stats')
+        compare_tables(pd.read_sql_query(source_union(read_taxi_pref_query(), sources), connection), taxi_pref_df,
+                       'taxi_pref')
+        print(f'sql aggregation took {time.perf_counter() - start:.2f} s')
+        connection.close()
+
+    if args.export_csv:
+        taxi_stats_df.to_csv(taxi_stats_csv, index=False)
+        taxi_pref_df.to_csv(taxi_pref_csv, index=False)
+
 
-# Commit the changes and close the connection
-connection.commit()
-connection.close()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,398 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Streams synthetic yellow, green and high volume FHV trips with the TLC Parquet
+# schemas, so the loaders and pages can be load tested at any volume. Rows are
+# produced and written one batch at a time, memory stays bounded by the batch size.
+
+taxi_zone_lookup_filepath = '../data/dataFiles/taxi+_zone_lookup.csv'
+
+SERVICES = ('yellow', 'green', 'fhvhv')
+DEFAULT_BATCH_SIZE = 1_000_000
+
+YELLOW_SCHEMA = pa.schema([
+    ('VendorID', pa.int32()),
+    ('tpep_pickup_datetime', pa.timestamp('us')),
+    ('tpep_dropoff_datetime', pa.timestamp('us')),
+    ('passenger_count', pa.float64()),
+    ('trip_distance', pa.float64()),
+    ('RatecodeID', pa.float64()),
+    ('store_and_fwd_flag', pa.string()),
+    ('PULocationID', pa.int32()),
+    ('DOLocationID', pa.int32()),
+    ('payment_type', pa.int64()),
+    ('fare_amount', pa.float64()),
+    ('extra', pa.float64()),
+    ('mta_tax', pa.float64()),
+    ('tip_amount', pa.float64()),
+    ('tolls_amount', pa.float64()),
+    ('improvement_surcharge', pa.float64()),
+    ('total_amount', pa.float64()),
+    ('congestion_surcharge', pa.float64()),
+    ('Airport_fee', pa.float64()),
+])
+
+GREEN_SCHEMA = pa.schema([
+    ('VendorID', pa.int32()),
+    ('lpep_pickup_datetime', pa.timestamp('us')),
+    ('lpep_dropoff_datetime', pa.timestamp('us')),
+    ('store_and_fwd_flag', pa.string()),
+    ('RatecodeID', pa.float64()),
+    ('PULocationID', pa.int32()),
+    ('DOLocationID', pa.int32()),
+    ('passenger_count', pa.float64()),
+    ('trip_distance', pa.float64()),
+    ('fare_amount', pa.float64()),
+    ('extra', pa.float64()),
+    ('mta_tax', pa.float64()),
+    ('tip_amount', pa.float64()),
+    ('tolls_amount', pa.float64()),
+    ('ehail_fee', pa.float64()),
+    ('improvement_surcharge', pa.float64()),
+    ('total_amount', pa.float64()),
+    ('payment_type', pa.float64()),
+    ('trip_type', pa.float64()),
+    ('congestion_surcharge', pa.float64()),
+])
+
+FHVHV_SCHEMA = pa.schema([
+    ('hvfhs_license_num', pa.string()),
+    ('dispatching_base_num', pa.string()),
+    ('originating_base_num', pa.string()),
+    ('request_datetime', pa.timestamp('us')),
+    ('on_scene_datetime', pa.timestamp('us')),
+    ('pickup_datetime', pa.timestamp('us')),
+    ('dropoff_datetime', pa.timestamp('us')),
+    ('PULocationID', pa.int64()),
+    ('DOLocationID', pa.int64()),
+    ('trip_miles', pa.float64()),
+    ('trip_time', pa.int64()),
+    ('base_passenger_fare', pa.float64()),
+    ('tolls', pa.float64()),
+    ('bcf', pa.float64()),
+    ('sales_tax', pa.float64()),
+    ('congestion_surcharge', pa.float64()),
+    ('airport_fee', pa.float64()),
+    ('tips', pa.float64()),
+    ('driver_pay', pa.float64()),
+    ('shared_request_flag', pa.string()),
+    ('shared_match_flag', pa.string()),
+    ('access_a_ride_flag', pa.string()),
+    ('wav_request_flag', pa.string()),
+    ('wav_match_flag', pa.string()),
+])
+
+SCHEMAS = {'yellow': YELLOW_SCHEMA, 'green': GREEN_SCHEMA, 'fhvhv': FHVHV_SCHEMA}
+
+# Share of trips per hour of the day: low at 3-5 am, peak at 5-7 pm
+HOURLY_WEIGHTS = np.array([
+    2.6, 1.8, 1.2, 0.8, 0.7, 0.9, 1.9, 3.4, 4.6, 4.6, 4.5, 4.7,
+    5.0, 5.1, 5.5, 5.8, 6.0, 6.6, 6.9, 6.3, 5.6, 5.3, 4.9, 4.0,
+])
+
+# Relative trip volume Monday..Sunday
+WEEKDAY_WEIGHTS = np.array([0.92, 1.02, 1.08, 1.10, 1.06, 0.98, 0.84])
+
+# Share of pickups per borough for each service
+BOROUGH_WEIGHTS = {
+    'yellow': {'Manhattan': 0.88, 'Queens': 0.09, 'Brooklyn': 0.02, 'Bronx': 0.005, 'Staten Island': 0.0005, 'EWR': 0.0005, 'Unknown': 0.004},
+    'green': {'Manhattan': 0.28, 'Queens': 0.32, 'Brooklyn': 0.25, 'Bronx': 0.14, 'Staten Island': 0.002, 'EWR': 0.0005, 'Unknown': 0.0075},
+    'fhvhv': {'Manhattan': 0.33, 'Queens': 0.22, 'Brooklyn': 0.28, 'Bronx': 0.14, 'Staten Island': 0.02, 'EWR': 0.001, 'Unknown': 0.009},
+}
+
+# JFK and LaGuardia get a much larger share than their borough neighbours
+AIRPORT_LOCATION_IDS = (132, 138)
+AIRPORT_BOOST = {'yellow': 40.0, 'green': 2.0, 'fhvhv': 8.0}
+
+# Probability that a trip ends in the borough it started in
+SAME_BOROUGH_SHARE = 0.7
+
+# High volume FHV license numbers and their share of trips
+FHV_LICENSES = {'HV0003': ('B03404', 0.73), 'HV0005': ('B03406', 0.27)}
+
+
+class ZoneSampler:
+    # Draws pickup and dropoff LocationIDs following the per-service borough weights
+
+    def __init__(self, taxi_zone_df, service, seed):
+        rng = np.random.default_rng([seed, SERVICES.index(service), 0])
+        self.location_ids = taxi_zone_df['LocationID'].to_numpy()
+        self.boroughs = taxi_zone_df['Borough'].fillna('Unknown').to_numpy()
+        self.manhattan = self.boroughs == 'Manhattan'
+        self.airport = np.isin(self.location_ids, AIRPORT_LOCATION_IDS)
+
+        # Fixed per-zone popularity so some zones are consistently busier than others
+        popularity = rng.lognormal(mean=0.0, sigma=1.0, size=len(self.location_ids))
+        popularity[self.airport] *= AIRPORT_BOOST[service]
+
+        borough_weights = BOROUGH_WEIGHTS[service]
+        weights = np.zeros(len(self.location_ids))
+        self.borough_names = sorted(set(self.boroughs))
+        self.borough_zone_index = {}
+        self.borough_zone_weights = {}
+        for borough in self.borough_names:
+            in_borough = np.flatnonzero(self.boroughs == borough)
+            share = popularity[in_borough] / popularity[in_borough].sum()
+            weights[in_borough] = share * borough_weights.get(borough, 0.0)
+            self.borough_zone_index[borough] = in_borough
+            self.borough_zone_weights[borough] = np.cumsum(share)
+        self.zone_weights = np.cumsum(weights / weights.sum())
+
+    def pickups(self, rng, n):
+        return np.searchsorted(self.zone_weights, rng.random(n), side='right').clip(max=len(self.zone_weights) - 1)
+
+    def dropoffs(self, rng, pickup_index):
+        # Most trips stay in the pickup borough, the rest follow the overall weights
+        dropoff_index = self.pickups(rng, len(pickup_index))
+        same_borough = rng.random(len(pickup_index)) < SAME_BOROUGH_SHARE
+        pickup_boroughs = self.boroughs[pickup_index]
+        for borough in self.borough_names:
+            rows = np.flatnonzero(same_borough & (pickup_boroughs == borough))
+            if len(rows) == 0:
+                continue
+            cumulative = self.borough_zone_weights[borough]
+            picks = np.searchsorted(cumulative, rng.random(len(rows)), side='right').clip(max=len(cumulative) - 1)
+            dropoff_index[rows] = self.borough_zone_index[borough][picks]
+        return dropoff_index
+
+
+def month_bounds(month):
+    start = pd.Timestamp(f'{month}-01')
+    end = start + pd.offsets.MonthBegin(1)
+    return start, end
+
+
+def pickup_times(rng, n, month):
+    # Day of the month weighted by weekday, hour by HOURLY_WEIGHTS, seconds uniform
+    start, end = month_bounds(month)
+    days = pd.date_range(start, end, freq='D', inclusive='left')
+    day_weights = WEEKDAY_WEIGHTS[days.dayofweek]
+    day = rng.choice(len(days), size=n, p=day_weights / day_weights.sum())
+    hour = rng.choice(24, size=n, p=HOURLY_WEIGHTS / HOURLY_WEIGHTS.sum())
+    seconds = day * 86400 + hour * 3600 + rng.integers(0, 3600, size=n)
+    return np.datetime64(start, 'us') + seconds.astype('timedelta64[s]'), hour
+
+
+def trip_shape(rng, zones, pickup_index, dropoff_index, hour):
+    # Distance is log-normal and longer across boroughs, speed drops at rush hour
+    n = len(pickup_index)
+    cross_borough = zones.boroughs[pickup_index] != zones.boroughs[dropoff_index]
+    distance = rng.lognormal(mean=0.55, sigma=0.7, size=n) * np.where(cross_borough, 3.0, 1.0)
+    to_airport = zones.airport[pickup_index] | zones.airport[dropoff_index]
+    distance = np.where(to_airport, distance + 10.0, distance).round(2)
+
+    rush_hour = ((hour >= 7) & (hour <= 9)) | ((hour >= 16) & (hour <= 19))
+    speed_mph = rng.normal(13.0, 3.0, size=n).clip(4.0, 35.0) * np.where(rush_hour, 0.75, 1.0)
+    duration_seconds = (distance / speed_mph * 3600 + rng.integers(60, 240, size=n)).astype(np.int64)
+    return distance, duration_seconds
+
+
+def taxi_fares(rng, zones, pickup_index, dropoff_index, hour, distance, duration_seconds, airport_fee):
+    n = len(pickup_index)
+    fare_amount = (3.0 + 2.5 * distance + 0.7 * duration_seconds / 60).round(2)
+    extra = np.where((hour >= 16) & (hour < 20), 2.5, np.where((hour >= 20) | (hour < 6), 1.0, 0.0))
+    mta_tax = np.full(n, 0.5)
+    improvement_surcharge = np.full(n, 1.0)
+    payment_type = np.where(rng.random(n) < 0.8, 1, 2)
+    tip_amount = np.where(payment_type == 1, (fare_amount * rng.uniform(0.1, 0.25, size=n)).round(2), 0.0)
+    tolls_amount = np.where(rng.random(n) < 0.05, 6.94, 0.0)
+    in_manhattan = zones.manhattan[pickup_index] | zones.manhattan[dropoff_index]
+    congestion_surcharge = np.where(in_manhattan, 2.5, 0.0)
+    airport = np.where(zones.airport[pickup_index], airport_fee, 0.0)
+    total_amount = (fare_amount + extra + mta_tax + tip_amount + tolls_amount + improvement_surcharge
+                    + congestion_surcharge + airport).round(2)
+    return {
+        'payment_type': payment_type,
+        'fare_amount': fare_amount,
+        'extra': extra,
+        'mta_tax': mta_tax,
+        'tip_amount': tip_amount,
+        'tolls_amount': tolls_amount,
+        'improvement_surcharge': improvement_surcharge,
+        'total_amount': total_amount,
+        'congestion_surcharge': congestion_surcharge,
+        'airport_fee': airport,
+    }
+
+
+def passenger_counts(rng, n):
+    return rng.choice([1.0, 2.0, 3.0, 4.0, 5.0, 6.0], size=n, p=[0.74, 0.15, 0.04, 0.02, 0.03, 0.02])
+
+
+def yellow_batch(rng, zones, n, month):
+    pickup, hour = pickup_times(rng, n, month)
+    pickup_index = zones.pickups(rng, n)
+    dropoff_index = zones.dropoffs(rng, pickup_index)
+    distance, duration_seconds = trip_shape(rng, zones, pickup_index, dropoff_index, hour)
+    fares = taxi_fares(rng, zones, pickup_index, dropoff_index, hour, distance, duration_seconds, airport_fee=1.75)
+    return {
+        'VendorID': rng.choice([1, 2], size=n, p=[0.27, 0.73]).astype(np.int32),
+        'tpep_pickup_datetime': pickup,
+        'tpep_dropoff_datetime': pickup + duration_seconds.astype('timedelta64[s]'),
+        'passenger_count': passenger_counts(rng, n),
+        'trip_distance': distance,
+        'RatecodeID': np.where(zones.location_ids[dropoff_index] == 132, 2.0, 1.0),
+        'store_and_fwd_flag': np.where(rng.random(n) < 0.005, 'Y', 'N'),
+        'PULocationID': zones.location_ids[pickup_index].astype(np.int32),
+        'DOLocationID': zones.location_ids[dropoff_index].astype(np.int32),
+        'payment_type': fares['payment_type'].astype(np.int64),
+        'fare_amount': fares['fare_amount'],
+        'extra': fares['extra'],
+        'mta_tax': fares['mta_tax'],
+        'tip_amount': fares['tip_amount'],
+        'tolls_amount': fares['tolls_amount'],
+        'improvement_surcharge': fares['improvement_surcharge'],
+        'total_amount': fares['total_amount'],
+        'congestion_surcharge': fares['congestion_surcharge'],
+        'Airport_fee': fares['airport_fee'],
+    }
+
+
+def green_batch(rng, zones, n, month):
+    pickup, hour = pickup_times(rng, n, month)
+    pickup_index = zones.pickups(rng, n)
+    dropoff_index = zones.dropoffs(rng, pickup_index)
+    distance, duration_seconds = trip_shape(rng, zones, pickup_index, dropoff_index, hour)
+    fares = taxi_fares(rng, zones, pickup_index, dropoff_index, hour, distance, duration_seconds, airport_fee=0.0)
+    return {
+        'VendorID': rng.choice([1, 2], size=n, p=[0.12, 0.88]).astype(np.int32),
+        'lpep_pickup_datetime': pickup,
+        'lpep_dropoff_datetime': pickup + duration_seconds.astype('timedelta64[s]'),
+        'store_and_fwd_flag': np.where(rng.random(n) < 0.005, 'Y', 'N'),
+        'RatecodeID': np.ones(n),
+        'PULocationID': zones.location_ids[pickup_index].astype(np.int32),
+        'DOLocationID': zones.location_ids[dropoff_index].astype(np.int32),
+        'passenger_count': passenger_counts(rng, n),
+        'trip_distance': distance,
+        'fare_amount': fares['fare_amount'],
+        'extra': fares['extra'],
+        'mta_tax': fares['mta_tax'],
+        'tip_amount': fares['tip_amount'],
+        'tolls_amount': fares['tolls_amount'],
+        'ehail_fee': np.full(n, np.nan),
+        'improvement_surcharge': fares['improvement_surcharge'],
+        'total_amount': fares['total_amount'],
+        'payment_type': fares['payment_type'].astype(np.float64),
+        'trip_type': np.where(rng.random(n) < 0.97, 1.0, 2.0),
+        'congestion_surcharge': fares['congestion_surcharge'],
+    }
+
+
+def fhvhv_batch(rng, zones, n, month):
+    pickup, hour = pickup_times(rng, n, month)
+    pickup_index = zones.pickups(rng, n)
+    dropoff_index = zones.dropoffs(rng, pickup_index)
+    distance, duration_seconds = trip_shape(rng, zones, pickup_index, dropoff_index, hour)
+
+    licenses = list(FHV_LICENSES)
+    license_index = rng.choice(len(licenses), size=n, p=[share for _, share in FHV_LICENSES.values()])
+    license_num = np.array(licenses)[license_index]
+    base_num = np.array([base for base, _ in FHV_LICENSES.values()])[license_index]
+
+    base_passenger_fare = (2.5 + 1.9 * distance + 0.6 * duration_seconds / 60).round(2)
+    tolls = np.where(rng.random(n) < 0.05, 6.94, 0.0)
+    bcf = (base_passenger_fare * 0.025).round(2)
+    sales_tax = (base_passenger_fare * 0.08875).round(2)
+    in_manhattan = zones.manhattan[pickup_index] | zones.manhattan[dropoff_index]
+    congestion_surcharge = np.where(in_manhattan, 2.75, 0.0)
+    airport_fee = np.where(zones.airport[pickup_index], 2.5, 0.0)
+    tips = np.where(rng.random(n) < 0.2, (base_passenger_fare * rng.uniform(0.1, 0.25, size=n)).round(2), 0.0)
+    request = pickup - rng.integers(60, 600, size=n).astype('timedelta64[s]')
+    shared = np.where(rng.random(n) < 0.01, 'Y', 'N')
+
+    return {
+        'hvfhs_license_num': license_num,
+        'dispatching_base_num': base_num,
+        'originating_base_num': base_num,
+        'request_datetime': request,
+        'on_scene_datetime': pickup - rng.integers(0, 60, size=n).astype('timedelta64[s]'),
+        'pickup_datetime': pickup,
+        'dropoff_datetime': pickup + duration_seconds.astype('timedelta64[s]'),
+        'PULocationID': zones.location_ids[pickup_index].astype(np.int64),
+        'DOLocationID': zones.location_ids[dropoff_index].astype(np.int64),
+        'trip_miles': distance,
+        'trip_time': duration_seconds,
+        'base_passenger_fare': base_passenger_fare,
+        'tolls': tolls,
+        'bcf': bcf,
+        'sales_tax': sales_tax,
+        'congestion_surcharge': congestion_surcharge,
+        'airport_fee': airport_fee,
+        'tips': tips,
+        'driver_pay': (base_passenger_fare * 0.72).round(2),
+        'shared_request_flag': shared,
+        'shared_match_flag': shared,
+        'access_a_ride_flag': np.full(n, ' '),
+        'wav_request_flag': np.where(rng.random(n) < 0.06, 'Y', 'N'),
+        'wav_match_flag': np.where(rng.random(n) < 0.04, 'Y', 'N'),
+    }
+
+
+BATCH_BUILDERS = {'yellow': yellow_batch, 'green': green_batch, 'fhvhv': fhvhv_batch}
+
+
+def generate_trips(service, rows, month='2023-09', seed=0, batch_size=DEFAULT_BATCH_SIZE, taxi_zone_df=None):
+    # Yield pyarrow Tables of at most batch_size synthetic trips until `rows` are produced.
+    # Every batch has its own generator seeded from (seed, service, batch), so output
+    # does not depend on how much has been consumed before.
+    if service not in BATCH_BUILDERS:
+        raise ValueError(f'Unknown service {service!r}, expected one of {SERVICES}')
+    if taxi_zone_df is None:
+        taxi_zone_df = pd.read_csv(taxi_zone_lookup_filepath)
+
+    zones = ZoneSampler(taxi_zone_df, service, seed)
+    schema = SCHEMAS[service]
+    build_batch = BATCH_BUILDERS[service]
+    produced = 0
+    batch = 0
+    while produced < rows:
+        n = min(batch_size, rows - produced)
+        rng = np.random.default_rng([seed, SERVICES.index(service), batch + 1])
+        yield pa.Table.from_pydict(build_batch(rng, zones, n, month), schema=schema)
+        produced += n
+        batch += 1
+
+
+def write_trips_parquet(service, rows, output_path, month='2023-09', seed=0, batch_size=DEFAULT_BATCH_SIZE, taxi_zone_df=None):
+    # Stream batches straight into one Parquet file, one row group per batch
+    with pq.ParquetWriter(output_path, SCHEMAS[service]) as writer:
+        for table in generate_trips(service, rows, month, seed, batch_size, taxi_zone_df):
+            writer.write_table(table)
+    return output_path
+
+
+def write_trips_sqlite(service, rows, connection, table_name=None, month='2023-09', seed=0, batch_size=DEFAULT_BATCH_SIZE, taxi_zone_df=None):
+    # Append batches straight into a SQLite table with the same layout the loaders create
+    table_name = table_name or f'{service}_tripdata'
+    for table in generate_trips(service, rows, month, seed, batch_size, taxi_zone_df):
+        table.to_pandas().to_sql(table_name, connection, index=False, if_exists='append')
+    return table_name
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic TLC trip data as Parquet.')
+    parser.add_argument('--service', choices=SERVICES + ('all',), default='all')
+    parser.add_argument('--rows', type=int, required=True, help='rows per service')
+    parser.add_argument('--month', default='2023-09', help='YYYY-MM of the pickups')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='rows held in memory at once')
+    parser.add_argument('--output-dir', default='../data/dataFiles')
+    args = parser.parse_args()
+
+    services = SERVICES if args.service == 'all' else (args.service,)
+    taxi_zone_df = pd.read_csv(taxi_zone_lookup_filepath)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for service in services:
+        # Same file names as the TLC downloads, so load_dataset.py picks them up
+        output_path = os.path.join(args.output_dir, f'{service}_tripdata_{args.month}.parquet')
+        write_trips_parquet(service, args.rows, output_path, args.month, args.seed, args.batch_size, taxi_zone_df)
+        print(f'Wrote {args.rows} {service} trips to {output_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,178 @@
-import pandas as pd
+import argparse
+import os
 import sqlite3
+import tempfile
+import time
+
+import pandas as pd
 
 # Load the high vol fhv trip data for sept 23 into a pandas DataFrame
 fhvhv_tripdata_filepath =  '../data/dataFiles/fhvhv_tripdata_2023-09.parquet'
-fhvhv_trip_df = pd.read_parquet(fhvhv_tripdata_filepath)
 
 # Connect to SQLite database (or create it if not exists)
 db_path = 'nyc_taxi_database.db'
-connection = sqlite3.connect(db_path)
 
 # Create a high vol fhv trip table based on the DataFrame columns
 table_name = 'fhvhv_tripdata'
-fhvhv_trip_df.to_sql(table_name, connection, index=False, if_exists='replace')
 
-# Commit the changes and close the connection
-connection.commit()
-connection.close()
\ No newline at end of file
+# The compact profile keeps only the columns the pages, the stats jobs and the
+# trips table builder read: license, pickup and drop-off zones and times, distance,
+# duration and fare components. Money is stored as integer cents, times as epoch
+# seconds and the license number as a small code, which SQLite writes as 1-4 byte
+# integers instead of 8 byte reals and repeated strings. The fhvhv_tripdata view
+# turns them back into the original columns and text timestamps, so every query
+# of those columns runs unchanged. The request and dispatch columns, driver pay
+# and the shared ride and accessibility flags are only kept by the full profile.
+compact_table_name = 'fhvhv_tripdata_compact'
+license_table_name = 'hvfhs_license'
+fare_columns = ['base_passenger_fare', 'tolls', 'tips', 'bcf', 'sales_tax', 'congestion_surcharge', 'airport_fee']
+time_columns = ['pickup_datetime', 'dropoff_datetime']
+compact_columns = (['hvfhs_license_num', 'PULocationID', 'DOLocationID', 'trip_miles', 'trip_time']
+                   + time_columns + fare_columns)
+
+# Scan used to compare the two profiles, the FHV part of the taxi_stats query
+scan_query = f'''
+SELECT
+    Hvfhs_license_num,
+    COUNT(*),
+    AVG({' + '.join(fare_columns)}),
+    AVG(trip_miles),
+    AVG(trip_time)
+FROM fhvhv_tripdata
+GROUP BY Hvfhs_license_num
+'''
+
+
+def drop_fhvhv_tripdata(connection):
+    # fhvhv_tripdata is a table after a full load and a view after a compact one
+    row = connection.execute('SELECT type FROM sqlite_master WHERE name = ?', (table_name,)).fetchone()
+    if row is not None:
+        connection.execute(f'DROP {row[0].upper()} {table_name}')
+
+
+def load_full(connection, filepath=fhvhv_tripdata_filepath):
+    # Original ingest, every column of the file
+    fhvhv_trip_df = pd.read_parquet(filepath)
+    drop_fhvhv_tripdata(connection)
+    connection.execute(f'DROP TABLE IF EXISTS {compact_table_name}')
+    connection.execute(f'DROP TABLE IF EXISTS {license_table_name}')
+    fhvhv_trip_df.to_sql(table_name, connection, index=False, if_exists='replace')
+    connection.commit()
+
+
+def epoch_seconds(series):
+    # Whole seconds since the epoch, turned back into the timestamp text by the view
+    return series.astype('datetime64[s]').astype('int64').where(series.notna()).astype('Int64')
+
+
+def compact_frame(fhvhv_trip_df):
+    licenses = sorted(fhvhv_trip_df['hvfhs_license_num'].dropna().unique())
+    compact_df = pd.DataFrame({
+        'license_code': fhvhv_trip_df['hvfhs_license_num'].map({license: code for code, license in enumerate(licenses)}).astype('Int8'),
+        'PULocationID': fhvhv_trip_df['PULocationID'].astype('Int16'),
+        'DOLocationID': fhvhv_trip_df['DOLocationID'].astype('Int16'),
+        'trip_miles': fhvhv_trip_df['trip_miles'],
+        'trip_time': fhvhv_trip_df['trip_time'].astype('Int32'),
+    })
+    for column in time_columns:
+        compact_df[f'{column}_seconds'] = epoch_seconds(fhvhv_trip_df[column])
+    for column in fare_columns:
+        compact_df[f'{column}_cents'] = (fhvhv_trip_df[column] * 100).round().astype('Int32')
+    license_df = pd.DataFrame({'license_code': range(len(licenses)), 'Hvfhs_license_num': licenses})
+    return compact_df, license_df
+
+
+def load_compact(connection, filepath=fhvhv_tripdata_filepath):
+    fhvhv_trip_df = pd.read_parquet(filepath, columns=compact_columns)
+    compact_df, license_df = compact_frame(fhvhv_trip_df)
+
+    # Fares with more than two decimals would not survive the conversion to cents
+    for column in fare_columns:
+        lossy = (compact_df[f'{column}_cents'] / 100 - fhvhv_trip_df[column]).abs() > 1e-9
+        if lossy.any():
+            print(f'warning: {lossy.sum()} {column} values have more than two decimals')
+    del fhvhv_trip_df
+
+    drop_fhvhv_tripdata(connection)
+    # INTEGER PRIMARY KEY makes the license lookup in the view a rowid search
+    connection.execute(f'DROP TABLE IF EXISTS {license_table_name}')
+    connection.execute(f'CREATE TABLE {license_table_name} (license_code INTEGER PRIMARY KEY, Hvfhs_license_num TEXT)')
+    license_df.to_sql(license_table_name, connection, index=False, if_exists='append')
+    compact_df.to_sql(compact_table_name, connection, index=False, if_exists='replace')
+
+    times = ',\n        '.join(f"datetime(ftd.{column}_seconds, 'unixepoch') AS {column}" for column in time_columns)
+    fares = ',\n        '.join(f'ftd.{column}_cents / 100.0 AS {column}' for column in fare_columns)
+    connection.execute(f'''
+    CREATE VIEW {table_name} AS
+    SELECT
+        ftd.rowid AS trip_id,
+        lic.Hvfhs_license_num,
+        {times},
+        ftd.PULocationID,
+        ftd.DOLocationID,
+        ftd.trip_miles,
+        ftd.trip_time,
+        {fares}
+    FROM {compact_table_name} ftd
+    LEFT JOIN {license_table_name} lic ON lic.license_code = ftd.license_code
+    ''')
+    connection.commit()
+
+
+def time_scan(db_path, repeat=3):
+    connection = sqlite3.connect(db_path)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connection.execute(scan_query).fetchall()
+        samples.append(time.perf_counter() - start)
+    connection.close()
+    return min(samples)
+
+
+def compare_profiles(filepath=fhvhv_tripdata_filepath):
+    # Load the file both ways into scratch databases and report size and scan time
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        results = {}
+        for profile, load in (('full', load_full), ('compact', load_compact)):
+            profile_db_path = os.path.join(scratch_dir, f'{profile}.db')
+            connection = sqlite3.connect(profile_db_path)
+            start = time.perf_counter()
+            load(connection, filepath)
+            load_seconds = time.perf_counter() - start
+            connection.close()
+            results[profile] = (os.path.getsize(profile_db_path), load_seconds, time_scan(profile_db_path))
+
+    full_size, _, full_scan = results['full']
+    for profile, (size, load_seconds, scan_seconds) in results.items():
+        print(f'{profile:<8} size {size / 2 ** 20:9.1f} MiB ({size / full_size:5.1%})  '
+              f'load {load_seconds:7.2f} s  scan {scan_seconds:7.3f} s ({scan_seconds / full_scan:5.1%})')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load the high volume FHV trips into SQLite.')
+    parser.add_argument('--profile', choices=['full', 'compact'], default='full',
+                        help='every column as in the file, or only the used columns in compact types')
+    parser.add_argument('--file', default=fhvhv_tripdata_filepath, help='FHV Parquet file')
+    parser.add_argument('--db', default=db_path, help='SQLite database')
+    parser.add_argument('--compare', action='store_true',
+                        help='load both profiles into scratch databases and report size and scan time')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_profiles(args.file)
+        return
+
+    connection = sqlite3.connect(args.db)
+    if args.profile == 'compact':
+        load_compact(connection, args.file)
+    else:
+        load_full(connection, args.file)
+
+    # Commit the changes and close the connection
+    connection.commit()
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
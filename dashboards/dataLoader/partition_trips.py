@@ -0,0 +1,109 @@
+import argparse
+import datetime
+import sqlite3
+
+# Split the yellow and green trip tables into one table per pickup month (or day),
+# e.g. yellow_tripdata_2023_09, each sorted by pickup time and indexed on it. The
+# trip_partitions catalog records the pickup range of every partition, and
+# dataAccess/partitions.py uses it to read only the partitions a date filter needs.
+# The original tables are kept for the queries without a date filter. The last
+# rowid of the original table is recorded too, partitions are only read while it
+# matches; rerun this after load_dataset.py or any other change to the tables.
+
+# Define the SQLite database path
+db_path = 'nyc_taxi_database.db'
+
+catalog_table_name = 'trip_partitions'
+
+trip_tables = {
+    'yellow': ('yellow_tripdata', 'tpep_pickup_datetime'),
+    'green': ('green_tripdata', 'lpep_pickup_datetime'),
+}
+
+
+def partition_bounds(connection, table_name, pickup, granularity):
+    # [start, end) of every month or day that has pickups, found by jumping through
+    # the pickup index instead of scanning the table
+    next_pickup = f'SELECT MIN({pickup}) FROM {table_name} WHERE {pickup} >= ?'
+    bounds = []
+    value = connection.execute(f'SELECT MIN({pickup}) FROM {table_name}').fetchone()[0]
+    while value is not None:
+        day = datetime.date.fromisoformat(value[:10])
+        if granularity == 'month':
+            start = day.replace(day=1)
+            end = (start + datetime.timedelta(days=32)).replace(day=1)
+        else:
+            start = day
+            end = day + datetime.timedelta(days=1)
+        bounds.append((f'{start} 00:00:00', f'{end} 00:00:00'))
+        value = connection.execute(next_pickup, (bounds[-1][1],)).fetchone()[0]
+    return bounds
+
+
+def partition_name(table_name, start, granularity):
+    suffix = start[:7] if granularity == 'month' else start[:10]
+    return f"{table_name}_{suffix.replace('-', '_')}"
+
+
+def drop_partitions(connection, service):
+    for (partition,) in connection.execute(f'SELECT table_name FROM {catalog_table_name} WHERE service = ?', (service,)).fetchall():
+        connection.execute(f'DROP TABLE IF EXISTS {partition}')
+    connection.execute(f'DELETE FROM {catalog_table_name} WHERE service = ?', (service,))
+
+
+def partition_service(connection, service, granularity):
+    table_name, pickup = trip_tables[service]
+    connection.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_pickup ON {table_name} ({pickup})')
+    drop_partitions(connection, service)
+    source_rowid = connection.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {table_name}').fetchone()[0]
+
+    for start, end in partition_bounds(connection, table_name, pickup, granularity):
+        partition = partition_name(table_name, start, granularity)
+        # Rows are written in pickup order, so a day inside a month partition is
+        # a contiguous run of pages
+        connection.execute(f'''
+            CREATE TABLE {partition} AS
+            SELECT * FROM {table_name}
+            WHERE {pickup} >= ? AND {pickup} < ?
+            ORDER BY {pickup}
+        ''', (start, end))
+        connection.execute(f'CREATE INDEX idx_{partition}_pickup ON {partition} ({pickup})')
+        rows = connection.execute(f'SELECT COUNT(*) FROM {partition}').fetchone()[0]
+        connection.execute(f'INSERT INTO {catalog_table_name} VALUES (?, ?, ?, ?, ?, ?)',
+                           (service, partition, start, end, rows, source_rowid))
+        print(f'{partition}: {rows} trips from {start} to {end}')
+    connection.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Partition the trip tables by pickup date.')
+    parser.add_argument('--db', default=db_path, help='SQLite database with the trip tables')
+    parser.add_argument('--granularity', choices=['month', 'day'], default='month', help='pickup range of one partition')
+    parser.add_argument('--service', choices=sorted(trip_tables), action='append', help='only partition this service (repeatable)')
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.db)
+    connection.execute(f'''
+        CREATE TABLE IF NOT EXISTS {catalog_table_name} (
+            service TEXT,
+            table_name TEXT PRIMARY KEY,
+            start_date TEXT,
+            end_date TEXT,
+            rows INTEGER,
+            source_rowid INTEGER
+        )
+    ''')
+    # Catalogs written before the source rowid was recorded are ignored until then
+    columns = {row[1] for row in connection.execute(f'PRAGMA table_info({catalog_table_name})')}
+    if 'source_rowid' not in columns:
+        connection.execute(f'ALTER TABLE {catalog_table_name} ADD COLUMN source_rowid INTEGER')
+    for service in args.service or sorted(trip_tables):
+        partition_service(connection, service, args.granularity)
+
+    # Commit the changes and close the connection
+    connection.commit()
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
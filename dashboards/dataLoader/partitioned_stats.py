@@ -0,0 +1,272 @@
+import datetime
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+# Partitioned version of the taxi_stats and taxi_pref aggregations. Each trip source
+# is split by pickup day (SQLite tables), by rowid range (the compact FHV view,
+# which cannot be indexed) or by row group (Parquet files). A process
+# pool computes partial sums and non-null counts per pickup zone for every partition,
+# and the partials are added up and divided only at the end, so the averages are the
+# same as the single SQL statement in create_taxi_stats_table.py.
+
+# Measures kept as (sum, count) pairs. AVG in SQLite skips NULLs, so every measure
+# carries its own count.
+MEASURES = ('fare', 'distance', 'time', 'time_per_distance')
+PARTIAL_COLUMNS = ['service', 'PULocationID', 'rides'] + [f'{m}_{kind}' for m in MEASURES for kind in ('sum', 'count')]
+
+FHV_FARE_COLUMNS = ['base_passenger_fare', 'tolls', 'tips', 'bcf', 'sales_tax', 'congestion_surcharge', 'airport_fee']
+
+SOURCES = {
+    'fhvhv': {
+        'table': 'fhvhv_tripdata',
+        'pickup': 'pickup_datetime',
+        'dropoff': 'dropoff_datetime',
+        'distance': 'trip_miles',
+    },
+    'yellow': {
+        'table': 'yellow_tripdata',
+        'pickup': 'tpep_pickup_datetime',
+        'dropoff': 'tpep_dropoff_datetime',
+        'distance': 'trip_distance',
+    },
+    'green': {
+        'table': 'green_tripdata',
+        'pickup': 'lpep_pickup_datetime',
+        'dropoff': 'lpep_dropoff_datetime',
+        'distance': 'trip_distance',
+    },
+}
+
+# Rowid range size for tables without a pickup column
+ROWS_PER_ID_PARTITION = 1_000_000
+
+# Service labels used by the two output tables, in the order of the SQL UNION ALLs
+STATS_SERVICES = {'fhvhv': 'FHV', 'yellow': 'Yellow Taxi', 'green': 'Green Taxi'}
+PREF_SERVICES = {'yellow': 'Yellow taxi', 'green': 'Green taxi'}
+PREF_ORDER = ('yellow', 'green', 'fhvhv')
+FHV_LICENSE_SERVICES = {'HV0002': 'Juno', 'HV0003': 'Uber', 'HV0004': 'Via', 'HV0005': 'Lyft'}
+
+
+def partition_query(source):
+    spec = SOURCES[source]
+    if source == 'fhvhv':
+        fare = ' + '.join(FHV_FARE_COLUMNS)
+        return f'''
+            SELECT
+                Hvfhs_license_num AS service,
+                PULocationID,
+                COUNT(*) AS rides,
+                SUM({fare}) AS fare_sum, COUNT({fare}) AS fare_count,
+                SUM(trip_miles) AS distance_sum, COUNT(trip_miles) AS distance_count,
+                SUM(trip_time) AS time_sum, COUNT(trip_time) AS time_count,
+                NULL AS time_per_distance_sum, 0 AS time_per_distance_count
+            FROM fhvhv_tripdata
+            WHERE {{predicate}}
+            GROUP BY Hvfhs_license_num, PULocationID
+        '''
+
+    duration = f"(strftime('%s', {spec['dropoff']}) - strftime('%s', {spec['pickup']}))"
+    return f'''
+        SELECT
+            '{source}' AS service,
+            PULocationID,
+            COUNT(*) AS rides,
+            SUM(total_amount) AS fare_sum, COUNT(total_amount) AS fare_count,
+            SUM(trip_distance) AS distance_sum, COUNT(trip_distance) AS distance_count,
+            SUM({duration}) AS time_sum, COUNT({duration}) AS time_count,
+            SUM({duration} / trip_distance) AS time_per_distance_sum,
+            COUNT({duration} / trip_distance) AS time_per_distance_count
+        FROM {spec['table']}
+        WHERE {{predicate}}
+        GROUP BY PULocationID
+    '''
+
+
+def create_pickup_index(connection, source):
+    # Day partitions are range scans on the pickup time, one index makes them cheap
+    spec = SOURCES[source]
+    connection.execute(f"CREATE INDEX IF NOT EXISTS idx_{spec['table']}_pickup ON {spec['table']} ({spec['pickup']})")
+    connection.commit()
+
+
+def sqlite_day_partitions(connection, source):
+    # One partition per pickup day that has trips, plus one for rows without a pickup
+    # time, so every row lands in exactly one partition. Days are found by jumping
+    # through the pickup index, so stray years in the data do not add empty partitions.
+    spec = SOURCES[source]
+    next_pickup = f"SELECT MIN({spec['pickup']}) FROM {spec['table']} WHERE {spec['pickup']} >= ?"
+    partitions = [(f"{spec['pickup']} IS NULL", ())]
+    pickup = connection.execute(f"SELECT MIN({spec['pickup']}) FROM {spec['table']}").fetchone()[0]
+    while pickup is not None:
+        day = datetime.date.fromisoformat(pickup[:10])
+        next_day = (day + datetime.timedelta(days=1)).isoformat()
+        partitions.append((f"{spec['pickup']} >= ? AND {spec['pickup']} < ?", (day.isoformat(), next_day)))
+        pickup = connection.execute(next_pickup, (next_day,)).fetchone()[0]
+    return partitions
+
+
+def sqlite_id_partitions(connection, source, rows_per_partition=ROWS_PER_ID_PARTITION):
+    # The view of a compact load (see load_dataset_fhv.py --profile compact) has no
+    # pickup index and computes its timestamps, but exposes the rowid as trip_id,
+    # so it is split into rowid ranges
+    spec = SOURCES[source]
+    first, last = connection.execute(f"SELECT MIN(trip_id), MAX(trip_id) FROM {spec['table']}").fetchone()
+    if first is None:
+        return []
+    return [('trip_id >= ? AND trip_id < ?', (start, start + rows_per_partition))
+            for start in range(first, last + 1, rows_per_partition)]
+
+
+def sqlite_partitions(connection, source):
+    spec = SOURCES[source]
+    columns = {row[1] for row in connection.execute(f"PRAGMA table_info({spec['table']})")}
+    if 'trip_id' in columns:
+        return sqlite_id_partitions(connection, source)
+    create_pickup_index(connection, source)
+    return sqlite_day_partitions(connection, source)
+
+
+def aggregate_sqlite_partition(db_path, source, predicate, params):
+    # Runs in a worker process with its own read-only connection
+    connection = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        query = partition_query(source).format(predicate=predicate)
+        return pd.read_sql_query(query, connection, params=params)
+    finally:
+        connection.close()
+
+
+def parquet_row_groups(filepath):
+    return list(range(pq.ParquetFile(filepath).num_row_groups))
+
+
+def aggregate_parquet_row_group(filepath, source, row_group):
+    # Same partial sums as partition_query, computed on one Parquet row group
+    spec = SOURCES[source]
+    if source == 'fhvhv':
+        columns = ['hvfhs_license_num', 'PULocationID', 'trip_miles', 'trip_time'] + FHV_FARE_COLUMNS
+    else:
+        columns = ['PULocationID', 'total_amount', 'trip_distance', spec['pickup'], spec['dropoff']]
+    df = pq.ParquetFile(filepath).read_row_group(row_group, columns=columns).to_pandas()
+
+    if source == 'fhvhv':
+        # A NULL component makes the whole SQL sum NULL
+        fare = df[FHV_FARE_COLUMNS].sum(axis=1, min_count=len(FHV_FARE_COLUMNS))
+        measures = pd.DataFrame({
+            'service': df['hvfhs_license_num'],
+            'PULocationID': df['PULocationID'],
+            'fare': fare,
+            'distance': df['trip_miles'],
+            'time': df['trip_time'],
+            'time_per_distance': np.nan,
+        })
+    else:
+        # strftime('%s') truncates to whole seconds before subtracting
+        pickup = df[spec['pickup']].astype('datetime64[s]').astype('int64')
+        dropoff = df[spec['dropoff']].astype('datetime64[s]').astype('int64')
+        duration = (dropoff - pickup).astype('float64')
+        duration[df[spec['pickup']].isna() | df[spec['dropoff']].isna()] = np.nan
+        distance = df['trip_distance']
+        measures = pd.DataFrame({
+            'service': source,
+            'PULocationID': df['PULocationID'],
+            'fare': df['total_amount'],
+            'distance': distance,
+            'time': duration,
+            # Division by zero is NULL in SQLite
+            'time_per_distance': (duration / distance).where(distance != 0),
+        })
+
+    grouped = measures.groupby(['service', 'PULocationID'], dropna=False)
+    partial = grouped.size().rename('rides').to_frame()
+    for measure in MEASURES:
+        partial[f'{measure}_sum'] = grouped[measure].sum(min_count=1)
+        partial[f'{measure}_count'] = grouped[measure].count()
+    return partial.reset_index()[PARTIAL_COLUMNS]
+
+
+def compute_partials(sources, workers=None, db_path=None, parquet_files=None):
+    # Fan every partition of every source out to the pool and collect the partials.
+    # Sources listed in parquet_files are read by row group, the rest from db_path by day.
+    parquet_files = parquet_files or {}
+    futures = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for source in sources:
+            if source in parquet_files:
+                for row_group in parquet_row_groups(parquet_files[source]):
+                    futures.append(executor.submit(aggregate_parquet_row_group, parquet_files[source], source, row_group))
+            else:
+                connection = sqlite3.connect(db_path)
+                partitions = sqlite_partitions(connection, source)
+                connection.close()
+                for predicate, params in partitions:
+                    futures.append(executor.submit(aggregate_sqlite_partition, db_path, source, predicate, params))
+        partials = [future.result() for future in futures]
+    return merge_partials(partials)
+
+
+def merge_partials(partials):
+    # Sums and counts are additive, so merging is a plain grouped sum
+    sums = [c for c in PARTIAL_COLUMNS if c not in ('service', 'PULocationID')]
+    partials = [p.astype(dict.fromkeys(sums, 'float64')) for p in partials if not p.empty]
+    partials = pd.concat(partials or [pd.DataFrame(columns=PARTIAL_COLUMNS)], ignore_index=True)
+    return partials.groupby(['service', 'PULocationID'], dropna=False)[sums].sum(min_count=1).reset_index()
+
+
+def source_of(service):
+    return service if service in PREF_SERVICES else 'fhvhv'
+
+
+def taxi_stats_from_partials(zone_totals, taxi_zone_df, sources):
+    # Equivalent of the taxi_stats query: inner join on the pickup zone, group by borough
+    df = zone_totals.merge(taxi_zone_df[['LocationID', 'Borough']], left_on='PULocationID', right_on='LocationID')
+    df['source'] = df['service'].map(source_of)
+    sums = [c for c in PARTIAL_COLUMNS if c not in ('service', 'PULocationID')]
+
+    frames = []
+    for source in sources:
+        totals = df[df['source'] == source].groupby('Borough', dropna=False)[sums].sum().reset_index()
+        stats = pd.DataFrame({'Borough': totals['Borough'], 'Service': STATS_SERVICES[source]})
+        stats['AvgTotalFare'] = totals['fare_sum'] / totals['fare_count']
+        stats['AvgTripDistance'] = totals['distance_sum'] / totals['distance_count']
+        stats['AvgFarePerUnitDistance'] = stats['AvgTotalFare'] / stats['AvgTripDistance']
+        stats['AvgTripTime'] = totals['time_sum'] / totals['time_count']
+        if source == 'fhvhv':
+            stats['AvgTripTimePerUnitDistance'] = stats['AvgTripTime'] / stats['AvgTripDistance']
+        else:
+            stats['AvgTripTimePerUnitDistance'] = totals['time_per_distance_sum'] / totals['time_per_distance_count']
+        frames.append(stats)
+    # AVG of nothing and division by zero are NULL in SQLite
+    return pd.concat(frames, ignore_index=True).replace([np.inf, -np.inf], np.nan)
+
+
+def taxi_pref_from_partials(zone_totals, taxi_zone_df, sources):
+    # Equivalent of the taxi_pref query: every zone LEFT JOINed with each source
+    zones = taxi_zone_df[['LocationID', 'Borough', 'Zone']]
+    frames = []
+    for source in [s for s in PREF_ORDER if s in sources]:
+        rides = zone_totals[zone_totals['service'].map(source_of) == source][['service', 'PULocationID', 'rides']].copy()
+        if source == 'fhvhv':
+            rides['Service'] = rides['service'].map(FHV_LICENSE_SERVICES)
+        else:
+            rides['Service'] = PREF_SERVICES[source]
+        rides = rides.groupby(['PULocationID', 'Service'], dropna=False)['rides'].sum().reset_index()
+
+        pref = zones.merge(rides, left_on='LocationID', right_on='PULocationID', how='left')
+        # Zones without trips still get one row with zero rides
+        no_trips = pref['rides'].isna()
+        pref.loc[no_trips, 'Service'] = PREF_SERVICES.get(source)
+        pref['NumberOfRides'] = pref['rides'].fillna(0).astype('int64')
+        # SQLite sorts NULL services first within a zone
+        pref = pref.sort_values(['LocationID', 'Service'], na_position='first', kind='stable')
+        frames.append(pref[['LocationID', 'Borough', 'Zone', 'Service', 'NumberOfRides']])
+    return pd.concat(frames, ignore_index=True)
+
+
+def available_sources(connection):
+    tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+    return [source for source, spec in SOURCES.items() if spec['table'] in tables]
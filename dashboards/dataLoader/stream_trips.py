@@ -0,0 +1,363 @@
+import argparse
+import glob
+import json
+import os
+import queue
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from build_demand_cube import cube_dir
+from build_od_matrix import matrix_dir
+from build_trips_table import insert_batch, trips_frame
+from partitioned_stats import FHV_FARE_COLUMNS, SOURCES
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataAccess.demand_cube import cube_available, update_cube
+from dataAccess.od_matrix import (MEASURES, accumulate, entry_version, has_measures, open_matrix, read_manifest,
+                                  source_version, write_manifest)
+from dataAccess.quality import CREATE_QUALITY_SQL
+from dataAccess.quantiles import UNKNOWN_HOUR, sketches_available, update_sketches
+from dataAccess.trips import (SECONDS_PER_HOUR, SERVICE_CODES, TAXI_CODES, create_trips_table, last_trip_rowid,
+                              record_batch, trips_available)
+from dataAccess.vendor_rollup import rollup_available, update_rollup
+
+# Streaming ingestion of trip records into the trips table (see build_trips_table.py)
+# and the rollups kept next to it. Records arrive as files dropped into a watched
+# directory (Parquet, CSV or JSON lines, named after their service like the TLC
+# files, e.g. yellow_2023-10-01T08.jsonl) and as JSON lines sent to a local TCP
+# socket, each with a "service" field. They are collected into micro-batches,
+# applied as soon as a batch is full or a few seconds old: the trips are appended
+# with their quality flags and logged as one batch, the quantile sketches and the
+# vendor rollup are updated, and the whole batch is committed at once. The
+# origin-destination matrices of the months already built and the demand cube,
+# kept in their own files, are then updated from the committed trips. Pages with
+# live updates on then refresh their rollups from the appended rows only, see
+# dataAccess/deltas.py. Files that cannot be read and records that cannot be
+# turned into trips are set aside in a quarantine directory instead.
+
+# Define the SQLite database path
+db_path = 'nyc_taxi_database.db'
+
+batch_rows = 5_000
+batch_seconds = 2.0
+watch_poll_seconds = 1.0
+
+# Columns of the TLC schema read from the records of each service, NULL when missing
+RECORD_COLUMNS = {
+    'yellow': ['tpep_pickup_datetime', 'tpep_dropoff_datetime', 'PULocationID', 'DOLocationID',
+               'passenger_count', 'payment_type', 'trip_distance', 'total_amount'],
+    'green': ['lpep_pickup_datetime', 'lpep_dropoff_datetime', 'PULocationID', 'DOLocationID',
+              'passenger_count', 'payment_type', 'trip_distance', 'total_amount'],
+    'fhvhv': ['hvfhs_license_num', 'pickup_datetime', 'dropoff_datetime', 'PULocationID', 'DOLocationID',
+              'trip_miles', 'trip_time'] + FHV_FARE_COLUMNS,
+}
+
+
+def record_frame(df, source):
+    # Trips of one service as the TLC columns trips_frame expects, and the mask of
+    # the records with a time or a number that does not parse
+    df = df.reindex(columns=RECORD_COLUMNS[source])
+    times = (SOURCES[source]['pickup'], SOURCES[source]['dropoff'])
+    malformed = pd.Series(False, index=df.index)
+    for column in RECORD_COLUMNS[source]:
+        if column in times:
+            parsed = pd.to_datetime(df[column], errors='coerce')
+        elif column != 'hvfhs_license_num':
+            parsed = pd.to_numeric(df[column], errors='coerce')
+        else:
+            continue
+        malformed |= parsed.isna() & df[column].notna()
+        df[column] = parsed
+    return df, malformed
+
+
+def file_source(filepath):
+    # Service named by the file, like yellow_tripdata_2023-09.parquet
+    source = os.path.basename(filepath).split('_')[0]
+    return source if source in RECORD_COLUMNS else None
+
+
+def read_file(filepath, source):
+    # Record frames of a dropped file, one per Parquet row group
+    if filepath.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(filepath)
+        return [parquet_file.read_row_group(row_group).to_pandas() for row_group in range(parquet_file.num_row_groups)]
+    if filepath.endswith('.csv'):
+        return [pd.read_csv(filepath)]
+    return [pd.read_json(filepath, lines=True)]
+
+
+def quarantine_file(filepath, quarantine, error):
+    os.makedirs(quarantine, exist_ok=True)
+    os.replace(filepath, os.path.join(quarantine, os.path.basename(filepath)))
+    print(f'Quarantined {os.path.basename(filepath)}: {error}', flush=True)
+
+
+def quarantine_records(frame, source, quarantine, error):
+    # Append records to a JSON lines file named after their service, which can be
+    # dropped into the watched directory again once fixed
+    os.makedirs(quarantine, exist_ok=True)
+    with open(os.path.join(quarantine, f'{source}_rejected.jsonl'), 'a') as f:
+        f.write(frame.to_json(orient='records', lines=True, date_format='iso', default_handler=str))
+    print(f'Quarantined {len(frame)} {source} records: {error}', flush=True)
+
+
+def watch_directory(directory, records, stop, quarantine, once=False):
+    # Queue the records of every file dropped into directory, then move the file
+    # to directory/done, or to quarantine when it cannot be read. Files still
+    # being written are picked up on a later poll.
+    done = os.path.join(directory, 'done')
+    os.makedirs(done, exist_ok=True)
+    sizes = {}
+    while not stop.is_set():
+        for filepath in sorted(glob.glob(os.path.join(directory, '*'))):
+            source = file_source(filepath)
+            if source is None or not filepath.endswith(('.parquet', '.csv', '.jsonl')):
+                continue
+            size = os.path.getsize(filepath)
+            if sizes.get(filepath) != size and not once:
+                sizes[filepath] = size
+                continue
+            sizes.pop(filepath, None)
+            try:
+                frames = read_file(filepath, source)
+            except (OSError, ValueError, TypeError) as e:
+                quarantine_file(filepath, quarantine, repr(e))
+                continue
+            for frame in frames:
+                records.put((source, frame))
+            os.replace(filepath, os.path.join(done, os.path.basename(filepath)))
+        if once:
+            stop.set()
+            return
+        stop.wait(watch_poll_seconds)
+
+
+class RecordHandler(socketserver.StreamRequestHandler):
+    # One JSON trip record per line, with its service in the "service" field
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                source = record.pop('service')
+            except (ValueError, KeyError, TypeError, AttributeError):
+                print(f'Skipped a malformed record from {self.client_address[0]}')
+                continue
+            if source in RECORD_COLUMNS:
+                self.server.records.put((source, [record]))
+
+
+def serve_socket(port, records):
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', port), RecordHandler)
+    server.daemon_threads = True
+    server.records = records
+    threading.Thread(target=server.serve_forever, name='stream-socket', daemon=True).start()
+    return server
+
+
+def matrix_cells(trips):
+    # Taxi trips with a pickup time as the cells accumulate expects, with their month
+    trips = trips[trips['service'].isin(list(TAXI_CODES.values())) & trips['pickup_time'].notna()]
+    pickup = trips['pickup_time'].to_numpy(dtype='int64')
+    return pd.DataFrame({
+        'month': pickup.astype('datetime64[s]').astype('datetime64[M]').astype(str),
+        'PULocationID': trips['PULocationID'],
+        'DOLocationID': trips['DOLocationID'],
+        'hour': pickup // SECONDS_PER_HOUR % 24,
+        'trips': 1,
+        'revenue': trips['total_fare'],
+        'distance': trips['distance'],
+        'duration': trips['duration'],
+        'clean_trips': (trips['quality'] == 0).astype('int64'),
+        'clean_revenue': trips['total_fare'].where(trips['quality'] == 0),
+    })
+
+
+def fold_matrices(trips, manifest, before, after):
+    # Add the trips to the matrices of the months already built. Months without a
+    # matrix are left to build_od_matrix.py, which would otherwise find a matrix
+    # holding only the streamed trips of a month. Every month that matched the
+    # database before the batch (source_version before) matches it after.
+    months = []
+    for month, cells in matrix_cells(trips).groupby('month'):
+        entry = manifest.get(month)
+        if entry is None:
+            continue
+        matrix = open_matrix(month, entry['hours'] > 1, matrix_dir)
+        if not has_measures(matrix):
+            continue
+        accumulate(matrix, cells)
+        matrix.flush()
+        entry['trips'] = int(matrix[MEASURES.index('trips')].sum())
+        if 'stream' not in entry['sources']:
+            entry['sources'].append('stream')
+        months.append(month)
+    current = [entry for entry in manifest.values()
+               if entry_version(entry) == before]
+    for entry in current:
+        entry.update(after)
+    if months or current:
+        write_manifest(manifest, matrix_dir)
+    return months
+
+
+def sketch_frame(trips):
+    # Trips as the service, zone, hour, fare and duration columns of update_sketches
+    names = {code: name for code, (_, name, _) in SERVICE_CODES.items()}
+    hour = trips['pickup_time'] // SECONDS_PER_HOUR % 24
+    return pd.DataFrame({
+        'service': trips['service'].map(names),
+        'PULocationID': trips['PULocationID'],
+        'hour': hour.fillna(UNKNOWN_HOUR).astype('int64'),
+        'fare': trips['total_fare'],
+        'duration': trips['duration'],
+    })
+
+
+def batch_frame(items):
+    # One frame of the file frames and socket records queued for a service
+    frames = [item for item in items if isinstance(item, pd.DataFrame)]
+    records = [record for item in items if not isinstance(item, pd.DataFrame) for record in item]
+    if records:
+        frames.append(pd.DataFrame.from_records(records))
+    return pd.concat(frames, ignore_index=True)
+
+
+def batch_trips(pending, quarantine):
+    # Trips of the queued records of every service, and the records they came
+    # from. Records that do not parse are quarantined, like the records of a
+    # service trips_frame fails on.
+    frames, accepted = [], {}
+    for source, items in pending.items():
+        records = batch_frame(items)
+        df, malformed = record_frame(records, source)
+        if malformed.any():
+            quarantine_records(records[malformed], source, quarantine, 'unreadable time or number')
+            if malformed.all():
+                continue
+        try:
+            frames.append(trips_frame(df[~malformed], source))
+        except (ValueError, TypeError, KeyError) as e:
+            quarantine_records(records[~malformed], source, quarantine, repr(e))
+            continue
+        accepted[source] = records[~malformed]
+    trips = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return trips, accepted
+
+
+def apply_batch(connection, trips, manifest):
+    # Append one micro-batch and update the rollups in the database, committed as
+    # one transaction, then the matrices and the cube kept in their own files
+    before = source_version(connection)
+    first_rowid = last_trip_rowid(connection) + 1
+    insert_batch(connection, trips)
+    rows = record_batch(connection, 'stream', first_rowid)
+    if sketches_available(connection):
+        update_sketches(connection, sketch_frame(trips))
+    if rollup_available(connection):
+        update_rollup(connection)
+    connection.commit()
+    # The rows are in, a failure from here on only leaves a file behind the
+    # database: months not folded stop matching it until they are rebuilt, and
+    # the cube reads the committed rows after its watermark, so a batch it misses
+    # is picked up by the next one
+    months = []
+    try:
+        months = fold_matrices(trips, manifest, before, source_version(connection))
+        if cube_available(cube_dir):
+            update_cube(connection, directory=cube_dir)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f'Matrices or cube not updated: {e!r}', flush=True)
+    return rows, months
+
+
+def apply_pending(connection, pending, manifest, quarantine):
+    start = time.perf_counter()
+    trips, accepted = batch_trips(pending, quarantine)
+    if trips.empty:
+        return
+    try:
+        rows, months = apply_batch(connection, trips, manifest)
+    except Exception as e:
+        # A locked or full database, or a rollup that failed: nothing of the batch
+        # went in, so its records are kept for another try
+        connection.rollback()
+        for source, records in accepted.items():
+            quarantine_records(records, source, quarantine, repr(e))
+        return
+    matrices = f", matrices of {', '.join(months)}" if months else ''
+    print(f'{rows} trips applied in {(time.perf_counter() - start) * 1000:.0f} ms{matrices}', flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest trip records in micro-batches as they arrive.')
+    parser.add_argument('--db', default=db_path, help='SQLite database with the trips table')
+    parser.add_argument('--watch', metavar='DIR', help='ingest the trip files dropped into this directory')
+    parser.add_argument('--port', type=int, help='also accept JSON line records on this local TCP port')
+    parser.add_argument('--batch-rows', type=int, default=batch_rows, help='apply a batch once it has this many trips')
+    parser.add_argument('--batch-seconds', type=float, default=batch_seconds, help='apply a batch once it is this old')
+    parser.add_argument('--once', action='store_true', help='ingest the files already in --watch, then exit')
+    parser.add_argument('--quarantine', metavar='DIR',
+                        help='where files and records that cannot be ingested go, by default quarantine/ in --watch')
+    args = parser.parse_args()
+    if not args.watch and not args.port:
+        parser.error('nothing to listen to, pass --watch and/or --port')
+    if args.once and (args.port or not args.watch):
+        parser.error('--once needs --watch and no --port')
+    quarantine = args.quarantine or os.path.join(args.watch or '.', 'quarantine')
+
+    connection = sqlite3.connect(args.db)
+    if not trips_available(connection):
+        parser.error(f'{args.db} has no trips table, build it first with build_trips_table.py --rebuild')
+    create_trips_table(connection)
+    connection.execute(CREATE_QUALITY_SQL)
+    connection.commit()
+    manifest = read_manifest(matrix_dir)
+
+    records = queue.Queue()
+    stop = threading.Event()
+    if args.watch:
+        threading.Thread(target=watch_directory, args=(args.watch, records, stop, quarantine, args.once),
+                         name='stream-watch', daemon=True).start()
+    if args.port:
+        serve_socket(args.port, records)
+        print(f'Listening on 127.0.0.1:{args.port}')
+
+    pending = {}
+    pending_rows = 0
+    oldest = None
+    try:
+        while True:
+            try:
+                source, items = records.get(timeout=0.2)
+                pending.setdefault(source, []).append(items)
+                pending_rows += len(items)
+                oldest = oldest or time.monotonic()
+            except queue.Empty:
+                if stop.is_set() and not pending:
+                    break
+            full = pending_rows >= args.batch_rows
+            due = oldest is not None and time.monotonic() - oldest >= args.batch_seconds
+            if pending and (full or due or (stop.is_set() and records.empty())):
+                apply_pending(connection, pending, manifest, quarantine)
+                pending, pending_rows, oldest = {}, 0, None
+    except KeyboardInterrupt:
+        stop.set()
+        if pending:
+            apply_pending(connection, pending, manifest, quarantine)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+import streamlit as st
+
+from dataAccess.approximate import sample_info
+
+# Sidebar choice between exact answers and estimates from the stratified samples,
+# from the most accurate to the fastest. Rates above the built maximum are hidden.
+SAMPLE_RATES = {"Exact": None, "20% sample": 0.2, "5% sample": 0.05, "1% sample": 0.01}
+
+
+def approximate_mode_control(connection):
+    # Sample rate picked in the sidebar, or None for exact answers
+    info = sample_info(connection)
+    if info is None:
+        return None
+
+    options = [label for label, rate in SAMPLE_RATES.items() if rate is None or rate <= info['max_rate']]
+    label = st.sidebar.select_slider(
+        "Accuracy vs. speed", options=options, value="Exact", key="sample_rate",
+        help="Smaller samples answer faster. Estimates are shown with 95% confidence intervals.",
+    )
+    return SAMPLE_RATES[label]
@@ -0,0 +1,29 @@
+import streamlit as st
+
+from dataAccess.trips import trips_available
+
+# Sidebar toggle for pages open while dataLoader/stream_trips.py is ingesting. When
+# it is on, the page's live sections rerun by themselves every few seconds. Their
+# loaders only read the trips appended since the previous run, see
+# dataAccess/deltas.py, so a refresh costs milliseconds instead of the full queries.
+LIVE_REFRESH_SECONDS = 5
+
+
+def live_updates_control(connection):
+    # Refresh interval in seconds, or None when live updates are off or the
+    # database has no trips table to stream into
+    if not trips_available(connection):
+        return None
+    enabled = st.sidebar.toggle(
+        "Live updates", False, key="live_updates",
+        help=f"Refresh the revenue trends every {LIVE_REFRESH_SECONDS} seconds with the newly ingested trips.",
+    )
+    return LIVE_REFRESH_SECONDS if enabled else None
+
+
+def live_section(render, run_every):
+    # render() as a fragment rerun every run_every seconds, or once when run_every is None
+    if run_every is None:
+        render()
+    else:
+        st.fragment(render, run_every=run_every)()
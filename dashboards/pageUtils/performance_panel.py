@@ -0,0 +1,69 @@
+import pandas as pd
+import streamlit as st
+
+from dataAccess import profiling, spans
+from dataAccess.memory import budget
+
+
+def performance_panel_toggle(page):
+    # Sidebar toggle, rendered before any query runs so this rerun is profiled
+    enabled = st.sidebar.checkbox("Show performance panel", False, key="performance_panel")
+    profiling.start_run(page, enabled)
+    spans.start_run()
+    return enabled
+
+
+def render_performance_panel():
+    if not st.session_state.get("performance_panel"):
+        return
+
+    render_query_timings(profiling.run_records())
+    render_section_timings(spans.run_spans())
+    render_memory_usage()
+
+
+def render_query_timings(records):
+    st.sidebar.subheader("Query performance")
+    if not records:
+        st.sidebar.write("No queries ran on this rerun.")
+        return
+
+    df = pd.DataFrame(records)
+    st.sidebar.metric("Total query time", f"{df['wall_ms'].sum():,.0f} ms", f"{len(df)} queries", delta_color="off")
+    table = df[['query', 'section', 'wall_ms', 'rows', 'bytes']].copy()
+    table['full scan'] = df['full_scans'].map(lambda scans: ', '.join(scans))
+    st.sidebar.dataframe(table.sort_values('wall_ms', ascending=False), hide_index=True)
+
+    for record in records:
+        label = f"{record['query']} ({record['wall_ms']:,.0f} ms)"
+        if record['full_scans']:
+            label += " - full scan"
+        with st.sidebar.expander(label):
+            st.code('\n'.join(record['plan']), language='text')
+
+
+def render_section_timings(records):
+    st.sidebar.subheader("Section timings")
+    if not records:
+        st.sidebar.write("No sections were timed on this rerun.")
+        return
+
+    df = pd.DataFrame(records)[['section', 'total_ms', 'data_ms', 'transform_ms', 'render_ms']]
+    st.sidebar.dataframe(df.sort_values('total_ms', ascending=False), hide_index=True)
+
+    with st.sidebar.expander("Slowest sections across sessions"):
+        try:
+            st.dataframe(spans.slow_section_report(), hide_index=True)
+        except (FileNotFoundError, ValueError):
+            st.write("The span log is empty.")
+
+
+def render_memory_usage():
+    st.sidebar.subheader("Cache memory")
+    used = budget.used_bytes()
+    limit = f"of {budget.budget_bytes / 2 ** 20:,.0f} MiB" if budget.budget_bytes else "no budget"
+    st.sidebar.metric("Cached data", f"{used / 2 ** 20:,.1f} MiB", limit, delta_color="off")
+    usage = budget.usage()
+    if not usage.empty:
+        usage['MiB'] = (usage.pop('bytes') / 2 ** 20).round(1)
+        st.sidebar.dataframe(usage, hide_index=True)
@@ -0,0 +1,19 @@
+import streamlit as st
+
+from dataAccess.quality import RULES
+
+# Sidebar toggle leaving the trips flagged by the data quality rules of
+# dataAccess/quality.py out of a page. The rollups behind the pages count the
+# clean trips separately, so switching it reads other columns of the same data.
+
+
+def quality_filter_control(available):
+    # True when the flagged trips are left out. Pages without the quality flags
+    # behind their data (available False) count every trip.
+    if not available:
+        return False
+    rules = ", ".join(description for _, _, description in RULES.values())
+    return st.sidebar.toggle(
+        "Exclude flagged trips", False, key="exclude_flagged",
+        help=f"Leave out the trips breaking a data quality rule: {rules}.",
+    )
@@ -0,0 +1,246 @@
+import argparse
+import datetime
+import glob
+import json
+import os
+import subprocess
+
+# Static snapshots of the dashboards. The export runs every page once, headless and
+# with the default widget values, and records what it draws: text, Plotly figures
+# (as JSON), tables (as Parquet), Matplotlib figures (as PNG) and Folium maps (as
+# HTML). Each export goes to its own versioned directory under snapshots/ with a
+# manifest, and snapshots/CURRENT names the latest one. With TAXI_SNAPSHOT set,
+# the pages replay the snapshot instead of running, so serving a visit needs no
+# database access. Widgets are not part of a snapshot; it shows the default view.
+#
+#     python -m pageUtils.snapshot --output snapshots
+#     TAXI_SNAPSHOT=snapshots streamlit run Home.py
+#
+# This module only imports the standard library at the top, so checking for a
+# snapshot costs a page nothing.
+
+# Snapshot to serve: a version directory, or a snapshots root whose CURRENT file names one
+SNAPSHOT_ENV = 'TAXI_SNAPSHOT'
+DEFAULT_SNAPSHOT_ROOT = 'snapshots'
+MANIFEST = 'manifest.json'
+CURRENT = 'CURRENT'
+
+# Streamlit calls that draw something worth keeping. Widgets are left out.
+TEXT_ELEMENTS = ('title', 'header', 'subheader', 'markdown', 'caption', 'info', 'warning', 'error', 'success')
+FRAME_ELEMENTS = ('dataframe', 'table')
+
+
+def active_snapshot():
+    # Version directory to serve, or None when the pages should run normally
+    path = os.environ.get(SNAPSHOT_ENV)
+    if not path:
+        return None
+    if not os.path.exists(os.path.join(path, MANIFEST)):
+        with open(os.path.join(path, CURRENT)) as f:
+            path = os.path.join(path, f.read().strip())
+    return path
+
+
+def page_key(page_file):
+    return os.path.splitext(os.path.basename(page_file))[0]
+
+
+# Replay
+
+
+def serve_snapshot(page_file):
+    # Draw the snapshot of the page and return True, or return False when no
+    # snapshot is configured and the page should run
+    snapshot = active_snapshot()
+    if snapshot is None:
+        return False
+
+    import streamlit as st
+
+    with open(os.path.join(snapshot, MANIFEST)) as f:
+        manifest = json.load(f)
+    elements = manifest['pages'].get(page_key(page_file))
+    if elements is None:
+        st.warning(f"The snapshot {manifest['version']} has no export of this page.")
+        return True
+
+    for element in elements:
+        replay_element(st, snapshot, element)
+    st.caption(f"Snapshot {manifest['version']} of data exported on {manifest['created']}.")
+    return True
+
+
+def replay_element(st, snapshot, element):
+    kind = element['kind']
+    path = os.path.join(snapshot, element['file']) if 'file' in element else None
+    if kind in TEXT_ELEMENTS:
+        getattr(st, kind)(element['body'], **element.get('options', {}))
+    elif kind == 'plotly_chart':
+        import plotly.io as pio
+
+        with open(path) as f:
+            st.plotly_chart(pio.from_json(f.read()))
+    elif kind in FRAME_ELEMENTS:
+        import pandas as pd
+
+        getattr(st, kind)(pd.read_parquet(path), **element.get('options', {}))
+    elif kind == 'image':
+        st.image(path)
+    elif kind == 'html':
+        import streamlit.components.v1 as components
+
+        with open(path) as f:
+            components.html(f.read(), width=element.get('width'), height=element.get('height'))
+
+
+# Recording
+
+
+class Recorder:
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.elements = []
+        self.drawing = False
+
+    def next_file(self, page, suffix):
+        return f'{page}/{len(self.elements):03d}{suffix}'
+
+    def path(self, name):
+        path = os.path.join(self.snapshot, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def record(self, page, kind, args, kwargs):
+        if kind in TEXT_ELEMENTS:
+            options = {k: v for k, v in kwargs.items() if k in ('unsafe_allow_html', 'help')}
+            self.elements.append({'kind': kind, 'body': str(args[0]), 'options': options})
+        elif kind == 'write':
+            # st.write of plain strings is markdown, of a frame a dataframe
+            for arg in args:
+                if isinstance(arg, str):
+                    self.record(page, 'markdown', (arg,), kwargs)
+                elif hasattr(arg, 'to_parquet'):
+                    self.record(page, 'dataframe', (arg,), {})
+        elif kind == 'plotly_chart':
+            name = self.next_file(page, '.json')
+            with open(self.path(name), 'w') as f:
+                f.write(args[0].to_json())
+            self.elements.append({'kind': kind, 'file': name})
+        elif kind in FRAME_ELEMENTS:
+            self.record_frame(page, kind, args[0], kwargs)
+        elif kind == 'pyplot':
+            import matplotlib.pyplot as plt
+
+            figure = args[0] if args else kwargs.get('fig') or plt.gcf()
+            name = self.next_file(page, '.png')
+            figure.savefig(self.path(name), bbox_inches='tight')
+            self.elements.append({'kind': 'image', 'file': name})
+        elif kind == 'folium_static':
+            name = self.next_file(page, '.html')
+            with open(self.path(name), 'w') as f:
+                f.write(args[0].get_root().render())
+            self.elements.append({'kind': 'html', 'file': name, 'width': kwargs.get('width', 700), 'height': kwargs.get('height', 500)})
+
+    def record_frame(self, page, kind, data, kwargs):
+        import pandas as pd
+
+        df = pd.DataFrame(data)
+        if 'geometry' in df.columns:
+            df = df.drop(columns='geometry')
+        # Parquet needs string column names, and the index is kept as a column
+        df.columns = [str(c) for c in df.columns]
+        name = self.next_file(page, '.parquet')
+        df.to_parquet(self.path(name))
+        options = {k: v for k, v in kwargs.items() if k == 'hide_index'}
+        self.elements.append({'kind': kind, 'file': name, 'options': options})
+
+
+def _patch(module, name, recorder, page, kind=None):
+    original = getattr(module, name)
+
+    def recording(*args, **kwargs):
+        # Streamlit calls made while drawing another element are not recorded again
+        if recorder.drawing:
+            return original(*args, **kwargs)
+        recorder.drawing = True
+        try:
+            recorder.record(page, kind or name, args, kwargs)
+            return original(*args, **kwargs)
+        finally:
+            recorder.drawing = False
+
+    setattr(module, name, recording)
+    return module, name, original
+
+
+def record_page(page_file, snapshot, timeout=600):
+    # Run the page headless and return the elements it drew
+    import streamlit as st
+    import streamlit_folium
+    from streamlit.testing.v1 import AppTest
+
+    page = page_key(page_file)
+    recorder = Recorder(snapshot)
+    patched = [_patch(st, name, recorder, page) for name in TEXT_ELEMENTS + FRAME_ELEMENTS + ('write', 'plotly_chart', 'pyplot')]
+    patched.append(_patch(streamlit_folium, 'folium_static', recorder, page))
+    try:
+        at = AppTest.from_file(os.path.abspath(page_file), default_timeout=timeout)
+        at.run()
+    finally:
+        for module, name, original in patched:
+            setattr(module, name, original)
+    if at.exception:
+        raise RuntimeError(f'{page_file} failed: {at.exception[0].value}')
+    return recorder.elements
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def export_snapshot(root=DEFAULT_SNAPSHOT_ROOT, pages=None, db_path='nyc_taxi_database.db'):
+    # Export every page into a new version directory and point CURRENT at it.
+    # The pages must run for real, not replay an earlier snapshot.
+    os.environ.pop(SNAPSHOT_ENV, None)
+    created = datetime.datetime.now()
+    version = created.strftime('%Y%m%d-%H%M%S')
+    snapshot = os.path.join(root, version)
+    os.makedirs(snapshot)
+
+    manifest = {
+        'version': version,
+        'created': created.isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'database': {'path': db_path, 'mtime': os.path.getmtime(db_path), 'size': os.path.getsize(db_path)},
+        'pages': {},
+    }
+    for page_file in pages or sorted(glob.glob('pages/*.py')):
+        manifest['pages'][page_key(page_file)] = record_page(page_file, snapshot)
+        print(f"{page_file}: {len(manifest['pages'][page_key(page_file)])} elements")
+    with open(os.path.join(snapshot, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Switch the served version in one rename
+    current = os.path.join(root, CURRENT)
+    with open(current + '.tmp', 'w') as f:
+        f.write(version)
+    os.replace(current + '.tmp', current)
+    return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a static snapshot of every dashboard page.')
+    parser.add_argument('--output', default=DEFAULT_SNAPSHOT_ROOT, help='snapshots root directory')
+    parser.add_argument('--page', action='append', help='only export this page file (repeatable)')
+    args = parser.parse_args()
+
+    snapshot = export_snapshot(args.output, args.page)
+    print(f'Wrote {snapshot}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,16 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
-import plotly.express as px
-import geopandas as gpd
-import folium
-import numpy as np
-from streamlit_folium import folium_static
+
+from dataAccess.cache import cached
+from dataAccess.connection import connect_to_database
+from dataAccess.geospatial_queries import (approximate_hourly_demand, cube_hourly_demand, hourly_demand, load_pickup_times,
+                                          load_top_taxi_locations)
+from dataAccess.partitions import day_range, month_range
+from dataAccess.spans import checkpoint, section
+from dataAccess.zones import load_geojson
+from pageUtils.approximate_mode import approximate_mode_control
+from pageUtils.performance_panel import performance_panel_toggle, render_performance_panel
+from pageUtils.snapshot import serve_snapshot
 
 # Apply custom CSS style for center-aligned titles
 st.markdown(
@@ -20,7 +25,10 @@ st.markdown(
 )
 
 
-def plot_taxi_demand(connection):
+@section("plot_taxi_demand")
+def plot_taxi_demand(connection, sample_rate=None):
+    import plotly.express as px
+
     st.markdown("<h2 class='title'>Peak and Off-Peak Hours Taxi Demand Analysis</h2>", unsafe_allow_html=True)
 
     # Checkbox for taxi type selection
@@ -30,37 +38,10 @@ def plot_taxi_demand(connection):
     # Radio buttons for date selection
     date_selection = st.radio("Select Date Range", ["Day", "Week", "Month"])
 
-    # Execute SQL query and load results into a DataFrame
-    query = '''
-        SELECT
-            tpep_pickup_datetime as pickup_datetime,
-            'yellow' as taxi_type
-        FROM
-            yellow_tripdata
-        UNION ALL
-        SELECT
-            lpep_pickup_datetime as pickup_datetime,
-            'green' as taxi_type
-        FROM
-            green_tripdata;
-    '''
-    df = pd.read_sql_query(query, connection)
-
-    # Ensure 'pickup_datetime' is in datetime format
-    df['pickup_datetime'] = pd.to_datetime(df['pickup_datetime'])
-
-    # Apply taxi type filter after running the query
-    selected_taxi_types = []
-    if selected_yellow:
-        selected_taxi_types.append('yellow')
-    if selected_green:
-        selected_taxi_types.append('green')
-
-    df_filtered = df[df['taxi_type'].isin(selected_taxi_types)]
-
+    # Only the pickups of the selected range are read from the database
     if date_selection == "Day":
         selected_date = st.date_input("Select a Date", pd.Timestamp("2023-09-30"))
-        df_filtered = df_filtered[df_filtered['pickup_datetime'].dt.date == selected_date]
+        start, end = day_range(selected_date)
 
     elif date_selection == "Week":
         # Set the default date range to the first week of September 2023
@@ -71,26 +52,49 @@ def plot_taxi_demand(connection):
         start_date = pd.to_datetime(start_date)
         end_date = pd.to_datetime(end_date)
 
-        # Filter the DataFrame based on the selected date range
-        df_filtered = df_filtered[(df_filtered['pickup_datetime'] >= start_date) & (df_filtered['pickup_datetime'] <= end_date)]
+        # Pickups from start_date up to and including end_date 00:00:00
+        start, end = start_date, end_date + pd.Timedelta(seconds=1)
 
     elif date_selection == "Month":
         # Create a dropdown (selectbox) for the user to choose a month
         selected_month = st.selectbox("Select a Month", range(1, 13), format_func=lambda x: pd.to_datetime(str(x), format='%m').strftime('%B'), index=8)
 
-        # Filter the DataFrame based on the selected month and year (assumed to be 2023)
-        df_filtered = df_filtered[(df_filtered['pickup_datetime'].dt.month == selected_month) & (df_filtered['pickup_datetime'].dt.year == 2023)]
+        # The selected month of 2023
+        start, end = month_range(f'2023-{selected_month:02d}')
 
-    # Create a column for the hour of the day
-    df_filtered['pickup_hour'] = df_filtered['pickup_datetime'].dt.hour
+    selected_taxi_types = []
+    if selected_yellow:
+        selected_taxi_types.append('yellow')
+    if selected_green:
+        selected_taxi_types.append('green')
+
+    if sample_rate:
+        # Estimated from the stratified samples, with 95% confidence intervals
+        demand = approximate_hourly_demand(connection, start, end, selected_taxi_types, sample_rate)
+        checkpoint('data')
+    else:
+        # Sliced from the demand cube when it is up to date and the range is whole days
+        demand = cube_hourly_demand(connection, start, end, selected_taxi_types)
+        checkpoint('data')
+
+        if demand is None:
+            # Execute SQL query and load results into a DataFrame, shared by every session
+            df = cached(load_pickup_times, start=start, end=end)(connection)
+            checkpoint('data')
+
+            # Apply taxi type filter after running the query
+            df_filtered = df[df['taxi_type'].isin(selected_taxi_types)]
 
-    # Group by hour and calculate the number of trips
-    hourly_demand = df_filtered.groupby(['pickup_hour', 'taxi_type']).size().reset_index(name='Number of Trips')
+            # Group by hour and calculate the number of trips
+            demand = hourly_demand(df_filtered)
+            checkpoint('transform')
 
     # Plotting peak and off-peak hours
-    fig = px.bar(hourly_demand, x='pickup_hour', y='Number of Trips', color='taxi_type',
+    fig = px.bar(demand, x='pickup_hour', y='Number of Trips', color='taxi_type',
                  labels={'pickup_hour': 'Hour of Day', 'Number of Trips': 'Number of Trips'},
-                 title=f"Taxi Demand Analysis - {date_selection} ({', '.join(selected_taxi_types)})",
+                 title=f"Taxi Demand Analysis - {date_selection} ({', '.join(selected_taxi_types)})"
+                       + (f" - estimated from a {sample_rate:.0%} sample" if sample_rate else ""),
+                 error_y='margin' if sample_rate else None,
                  color_discrete_map={'yellow': 'yellow', 'green': 'green'})
 
     # Display the radio buttons, checkbox, and the plot
@@ -110,37 +114,17 @@ def plot_taxi_demand(connection):
     late-night activities, the overall demand diminishes during these non-peak hours.""")
 
 
+@section("get_top_taxi_locations")
 def get_top_taxi_locations(connection):
-    # Execute SQL query and load results into a DataFrame
-    query = '''
-        SELECT
-            tz.LocationID,
-            tz.Borough,
-            tz.Zone,
-            COUNT(*) AS TripCount
-        FROM
-            taxi_zone_lookup tz
-        LEFT JOIN
-            (
-                SELECT PULocationID
-                FROM yellow_tripdata
-                UNION ALL
-                SELECT PULocationID
-                FROM green_tripdata
-            ) AS combined_taxi
-        ON
-            tz.LocationID = combined_taxi.PULocationID
-        GROUP BY
-            tz.LocationID, tz.Borough, tz.Zone
-        ORDER BY
-            TripCount DESC;
-    '''
-    df = pd.read_sql_query(query, connection)
+    import folium
+    from streamlit_folium import folium_static
 
-    # Load the GeoJSON data.
-    geojson_data = gpd.read_file("data/dataFiles/NYC_Taxi_Zones.geojson")
-    #geojson_data = gpd.read_file("/Users/chandanatj/streamlit-sales-dashboard/NYC Taxi Zones.geojson")
+    # Execute SQL query and load results into a DataFrame, shared by every session
+    df = cached(load_top_taxi_locations)(connection)
 
+    # Load the GeoJSON data.
+    geojson_data = load_geojson()
+    checkpoint('data')
 
     # NYC GeoJSON
     nyc_geo = geojson_data
@@ -208,20 +192,32 @@ def get_top_taxi_locations(connection):
 
 
 def main():
+    # Serve the exported snapshot without touching the database, when one is configured
+    if serve_snapshot(__file__):
+        return
+
+    # Sidebar toggle for the query performance panel
+    performance_panel_toggle("Geospatial Demand and Supply")
 
     st.markdown("<h1 class='title'>Geospatial Demand and Supply Dashboard</h1>", unsafe_allow_html=True)
 
     # Connect to the database
-    connection = sqlite3.connect('nyc_taxi_database.db')
+    connection = connect_to_database()
+
+    # Exact answers or estimates from the stratified samples
+    sample_rate = approximate_mode_control(connection)
 
     # Call the plot function with the database connection
-    plot_taxi_demand(connection)
+    plot_taxi_demand(connection, sample_rate)
 
     get_top_taxi_locations(connection)
 
     # Close the database connection
     connection.close()
 
+    # Query timings for this rerun
+    render_performance_panel()
+
 
 if __name__ == "__main__":
     main()
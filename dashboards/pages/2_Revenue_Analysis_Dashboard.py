@@ -1,9 +1,16 @@
 import streamlit as st
-import plotly.express as px
-import pandas as pd
-import sqlite3
-import geopandas as gpd
-import matplotlib.pyplot as plt
+
+from dataAccess.concurrent_queries import fetch_concurrently
+from dataAccess.connection import connect_to_database
+from dataAccess.revenue_queries import revenue_page_loaders
+from dataAccess.spans import checkpoint, section
+from dataAccess.trips import trips_available
+from dataAccess.warmup import start_warmup
+from pageUtils.approximate_mode import approximate_mode_control
+from pageUtils.live_updates import live_section, live_updates_control
+from pageUtils.performance_panel import performance_panel_toggle, render_performance_panel
+from pageUtils.quality_filter import quality_filter_control
+from pageUtils.snapshot import serve_snapshot
 
 
 # Apply custom CSS style for center-aligned titles
@@ -20,96 +27,20 @@ st.markdown(
 
 
 # Define the function to get taxi revenues
-def get_taxi_revenues(connection):
-    # Execute SQL query for daily revenue
-    daily_query = '''
-        SELECT
-            DATE(tpep_pickup_datetime) AS Date,
-            SUM(total_amount) AS DailyRevenue
-        FROM
-            (
-                SELECT
-                    tpep_pickup_datetime,
-                    total_amount
-                FROM
-                    yellow_tripdata
-                WHERE
-                    strftime('%Y-%m', tpep_pickup_datetime) = '2023-09'
-                UNION ALL
-                SELECT
-                    lpep_pickup_datetime,
-                    total_amount
-                FROM
-                    green_tripdata
-                WHERE
-                    strftime('%Y-%m', lpep_pickup_datetime) = '2023-09'
-            ) AS combined_taxi
-        GROUP BY
-            Date
-        ORDER BY
-            Date;
-    '''
-    daily = pd.read_sql_query(daily_query, connection)
-
-    # Execute SQL query for weekly revenue
-    weekly_query = '''
-        SELECT
-            strftime('%Y-%m-%d', tpep_pickup_datetime, 'weekday 0', '-6 days') AS WeekStart,
-            SUM(total_amount) AS WeeklyRevenue
-        FROM
-            (
-                SELECT
-                    tpep_pickup_datetime,
-                    total_amount
-                FROM
-                    yellow_tripdata
-                WHERE
-                    strftime('%Y-%m', tpep_pickup_datetime) = '2023-09'
-                UNION ALL
-                SELECT
-                    lpep_pickup_datetime,
-                    total_amount
-                FROM
-                    green_tripdata
-                WHERE
-                    strftime('%Y-%m', lpep_pickup_datetime) = '2023-09'
-            ) AS combined_taxi
-        GROUP BY
-            WeekStart
-        ORDER BY
-            WeekStart;
-    '''
-    weekly = pd.read_sql_query(weekly_query, connection)
-
-    # Execute SQL query for monthly revenue
-    monthly_query = '''
-        SELECT
-            strftime('%Y-%m', tpep_pickup_datetime) AS Month,
-            SUM(total_amount) AS MonthlyRevenue
-        FROM
-            (
-                SELECT
-                    tpep_pickup_datetime,
-                    total_amount
-                FROM
-                    yellow_tripdata
-                WHERE
-                    strftime('%Y-%m', tpep_pickup_datetime) = '2023-09'
-                UNION ALL
-                SELECT
-                    lpep_pickup_datetime,
-                    total_amount
-                FROM
-                    green_tripdata
-                WHERE
-                    strftime('%Y-%m', lpep_pickup_datetime) = '2023-09'
-            ) AS combined_taxi
-        GROUP BY
-            Month
-        ORDER BY
-            Month;
-    '''
-    monthly = pd.read_sql_query(monthly_query, connection)
+@section("fetch_revenue_data")
+def fetch_revenue_data(connection, sample_rate=None, clean_only=False):
+    # Every query of the page is independent, so they are all fetched up front
+    # and concurrently, each loader on its own read connection
+    data = fetch_concurrently(connection, revenue_page_loaders(sample_rate, clean_only))
+    checkpoint('data')
+    return data
+
+
+@section("get_taxi_revenues")
+def get_taxi_revenues(revenues):
+    import plotly.express as px
+
+    daily, weekly, monthly = revenues
 
     # Main page
     st.markdown("<h2 class='title'>Daily, Weekly, and Monthly Revenue Trends</h2>", unsafe_allow_html=True)
@@ -147,121 +78,15 @@ def get_taxi_revenues(connection):
     - The monthly revenue is a sum of daily revenues and reflects the overall financial performance of the taxi service for the entire month.
     """)
 
-def get_revenue_vary(connection):
-    revenue_by_location_query = '''
-        SELECT
-        tz.LocationID,
-        tz.Borough,
-        tz.Zone,
-        SUM(total_amount) AS TotalRevenue
-    FROM
-        taxi_zone_lookup tz
-    JOIN
-        (
-            SELECT
-                PULocationID AS LocationID,
-                total_amount
-            FROM
-                yellow_tripdata
-            WHERE
-                strftime('%Y-%m', tpep_pickup_datetime) = '2023-09'
-            UNION ALL
-            SELECT
-                DOLocationID AS LocationID,
-                total_amount
-            FROM
-                yellow_tripdata
-            WHERE
-                strftime('%Y-%m', tpep_pickup_datetime) = '2023-09'
-            UNION ALL
-            SELECT
-                PULocationID AS LocationID,
-                total_amount
-            FROM
-                green_tripdata
-            WHERE
-                strftime('%Y-%m', lpep_pickup_datetime) = '2023-09'
-            UNION ALL
-            SELECT
-                DOLocationID AS LocationID,
-                total_amount
-            FROM
-                green_tripdata
-            WHERE
-                strftime('%Y-%m', lpep_pickup_datetime) = '2023-09'
-        ) AS combined_taxi
-    ON
-        tz.LocationID = combined_taxi.LocationID
-    GROUP BY
-        tz.LocationID, tz.Borough, tz.Zone
-    ORDER BY
-        TotalRevenue DESC
-    LIMIT 30;
-    '''
-
-    R_location = pd.read_sql_query(revenue_by_location_query, connection)
-
-    revenue_by_time_query = '''
-        SELECT
-            strftime('%H', pickup_datetime) AS HourOfDay,
-            SUM(total_amount) AS TotalRevenue
-        FROM
-            (
-                SELECT
-                    tpep_pickup_datetime AS pickup_datetime,
-                    total_amount
-                FROM
-                    yellow_tripdata
-                WHERE
-                    strftime('%Y-%m', tpep_pickup_datetime) = '2023-09'
-                UNION ALL
-                SELECT
-                    lpep_pickup_datetime AS pickup_datetime,
-                    total_amount
-                FROM
-                    green_tripdata
-                WHERE
-                    strftime('%Y-%m', lpep_pickup_datetime) = '2023-09'
-            ) AS combined_taxi
-        GROUP BY
-            HourOfDay
-        ORDER BY
-            HourOfDay;
-    '''
-
-
-    R_time = pd.read_sql_query(revenue_by_time_query, connection)
-    
+@section("get_revenue_vary")
+def get_revenue_vary(revenue_vary, sample_rate=None):
+    import plotly.express as px
 
-    revenue_by_dayweek_query = '''
-        SELECT
-            strftime('%w', pickup_datetime) AS DayOfWeek,
-            SUM(total_amount) AS TotalRevenue
-        FROM
-            (
-                SELECT
-                    tpep_pickup_datetime AS pickup_datetime,
-                    total_amount
-                FROM
-                    yellow_tripdata
-                WHERE
-                    strftime('%Y-%m', tpep_pickup_datetime) = '2023-09'
-                UNION ALL
-                SELECT
-                    lpep_pickup_datetime AS pickup_datetime,
-                    total_amount
-                FROM
-                    green_tripdata
-                WHERE
-                    strftime('%Y-%m', lpep_pickup_datetime) = '2023-09'
-            ) AS combined_taxi
-        GROUP BY
-            DayOfWeek
-        ORDER BY
-            DayOfWeek;
-    '''
-
-    R_day = pd.read_sql_query(revenue_by_dayweek_query, connection)
+    R_location, R_time, R_day = revenue_vary
+    if sample_rate:
+        # Estimated from the stratified samples, with 95% confidence intervals
+        st.caption(f"Revenue by location, time of day and day of the week is estimated from a {sample_rate:.0%} sample.")
+    error = 'margin' if sample_rate else None
     
     st.markdown("<h2 class='title'>Revenue by Location, Time of day, and Day of the week</h2>", unsafe_allow_html=True)
 
@@ -285,7 +110,7 @@ def get_revenue_vary(connection):
 
 
     # Use the revenue_by_location DataFrame obtained from the function
-    fig_location = px.bar(R_location, x='TotalRevenue', y='Zone', orientation='h', title='Revenue by Location')
+    fig_location = px.bar(R_location, x='TotalRevenue', y='Zone', orientation='h', title='Revenue by Location', error_x=error)
     st.plotly_chart(fig_location)
 
     st.subheader("Revenue by Time of Day")
@@ -307,7 +132,7 @@ def get_revenue_vary(connection):
 
     
     # Revenue by Time of Day
-    fig_time = px.line(R_time, x='HourOfDay', y='TotalRevenue', title='Revenue by Time of Day')
+    fig_time = px.line(R_time, x='HourOfDay', y='TotalRevenue', title='Revenue by Time of Day', error_y=error)
     st.plotly_chart(fig_time)
 
     
@@ -327,7 +152,7 @@ def get_revenue_vary(connection):
     }
 
     R_day['DayOfWeek'] = R_day['DayOfWeek'].map(day_of_week_mapping)
-    fig_day_week = px.bar(R_day, x='TotalRevenue', y='DayOfWeek', orientation='h', title='Revenue by Day of the Week', labels={'DayOfWeek': 'Day'})
+    fig_day_week = px.bar(R_day, x='TotalRevenue', y='DayOfWeek', orientation='h', title='Revenue by Day of the Week', labels={'DayOfWeek': 'Day'}, error_x=error)
     st.plotly_chart(fig_day_week)
 
     st.write(
@@ -340,71 +165,9 @@ def get_revenue_vary(connection):
     f"reaching approximately '${R_day.loc[[0, 6], 'TotalRevenue'].sum():,.2f}'. The weekend demand appears to be strong."
     )
 
-def get_revenue_by_trip_type(connection):
-    # Execute SQL query for airport and non-airport trips with RatecodeID IN (2, 3)
-    revenue_by_trip_type_query =  '''
-    WITH CombinedRevenue AS (
-        SELECT
-            tz.LocationID,
-            tz.Borough,
-            tz.Zone,
-            SUM(total_amount) AS TotalRevenue
-        FROM
-            taxi_zone_lookup tz
-        JOIN
-            (
-                SELECT
-                    PULocationID AS LocationID,
-                    total_amount
-                FROM
-                    yellow_tripdata
-                WHERE
-                    strftime('%Y-%m', tpep_pickup_datetime) = '2023-09'
-                UNION ALL
-                SELECT
-                    DOLocationID AS LocationID,
-                    total_amount
-                FROM
-                    yellow_tripdata
-                WHERE
-                    strftime('%Y-%m', tpep_pickup_datetime) = '2023-09'
-                UNION ALL
-                SELECT
-                    PULocationID AS LocationID,
-                    total_amount
-                FROM
-                    green_tripdata
-                WHERE
-                    strftime('%Y-%m', lpep_pickup_datetime) = '2023-09'
-                UNION ALL
-                SELECT
-                    DOLocationID AS LocationID,
-                    total_amount
-                FROM
-                    green_tripdata
-                WHERE
-                    strftime('%Y-%m', lpep_pickup_datetime) = '2023-09'
-            ) AS combined_taxi
-        ON
-            tz.LocationID = combined_taxi.LocationID
-        GROUP BY
-            tz.LocationID, tz.Borough, tz.Zone
-    )
-
-    SELECT
-        CASE
-            WHEN LOWER(Zone) LIKE '%airport%' THEN 'Airport'
-            ELSE 'Non-Airport'
-        END AS TripType,
-        SUM(TotalRevenue) AS TotalRevenue
-    FROM
-        CombinedRevenue
-    GROUP BY
-        TripType;
-    '''
-
-    # Execute the query and load results into a DataFrame
-    revenue_by_trip_type = pd.read_sql_query(revenue_by_trip_type_query, connection)
+@section("get_revenue_by_trip_type")
+def get_revenue_by_trip_type(revenue_by_trip_type):
+    import plotly.express as px
 
     # Streamlit Pie Chart
     
@@ -437,22 +200,52 @@ def get_revenue_by_trip_type(connection):
 
 
 def main():
+    # Serve the exported snapshot without touching the database, when one is configured
+    if serve_snapshot(__file__):
+        return
+
+    # Sidebar toggle for the query performance panel
+    performance_panel_toggle("Revenue Analysis")
 
     st.markdown("<h1 class='title'>Revenue Analysis Dashboard</h1>", unsafe_allow_html=True)
 
+    # Warm the cache in the background if the app was opened on this page
+    start_warmup()
+
     # Connect to the database
-    connection = sqlite3.connect('nyc_taxi_database.db')
+    connection = connect_to_database()
 
-    # Call the plot function with the database connection
-    get_taxi_revenues(connection)
+    # Exact answers or estimates from the stratified samples
+    sample_rate = approximate_mode_control(connection)
 
-    get_revenue_vary(connection)
+    # Only the trips table has quality flags, the samples have none
+    clean_only = quality_filter_control(trips_available(connection) and sample_rate is None)
 
-    get_revenue_by_trip_type(connection)
+    # Refresh the revenue trends with the trips streamed in since the last run
+    live_refresh = live_updates_control(connection)
 
-    # Close the database connection
+    # Fetch the data of every chart, then close the database connection
+    data = fetch_revenue_data(connection, sample_rate, clean_only)
     connection.close()
 
+    def taxi_revenues():
+        revenues = data.pop('revenues', None)
+        if revenues is None:
+            # Fragment reruns only reload the revenue trends
+            live_connection = connect_to_database()
+            revenues = revenue_page_loaders(clean_only=clean_only)['revenues'](live_connection)
+            live_connection.close()
+        get_taxi_revenues(revenues)
+
+    live_section(taxi_revenues, live_refresh)
+
+    get_revenue_vary(data['vary'], sample_rate)
+
+    get_revenue_by_trip_type(data['trip_type'])
+
+    # Query timings for this rerun
+    render_performance_panel()
+
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,12 @@
 import streamlit as st
-import plotly.express as px
-import pandas as pd
-import sqlite3
-import geopandas as gpd
-import matplotlib.pyplot as plt
+
+from dataAccess.concurrent_queries import fetch_concurrently
+from dataAccess.connection import connect_to_database
+from dataAccess.customer_queries import customer_page_loaders, top_and_bottom_locations
+from dataAccess.spans import checkpoint, section
+from dataAccess.warmup import start_warmup
+from pageUtils.performance_panel import performance_panel_toggle, render_performance_panel
+from pageUtils.snapshot import serve_snapshot
 
 
 # Apply custom CSS style for center-aligned titles
@@ -18,18 +21,20 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-def connect_to_database():
-    # Connect to SQLite database
-    connection = sqlite3.connect('nyc_taxi_database.db')
-    return connection
-
+@section("fetch_customer_data")
+def fetch_customer_data(connection):
+    # Every query of the page is independent, so they are all fetched up front
+    # and concurrently, each loader on its own read connection
+    data = fetch_concurrently(connection, customer_page_loaders())
+    checkpoint('data')
+    return data
 
-def passenger_count_trends(connection):
-    st.markdown("<h2 class='title'>Trends in Passenger Count</h2>", unsafe_allow_html=True)
 
-    sql_query = "SELECT passenger_count, COUNT(*) as num_rides FROM yellow_tripdata WHERE passenger_count BETWEEN 1 AND 4 GROUP BY passenger_count"
+@section("passenger_count_trends")
+def passenger_count_trends(result):
+    import plotly.express as px
 
-    result = pd.read_sql_query(sql_query, connection)
+    st.markdown("<h2 class='title'>Trends in Passenger Count</h2>", unsafe_allow_html=True)
 
     fig = px.bar(result, x='passenger_count', y='num_rides', labels={'passenger_count': 'Passenger Count', 'num_rides': 'Number of Rides'},
                  title='Number of Rides vs Passenger Count')
@@ -37,52 +42,15 @@ def passenger_count_trends(connection):
     st.plotly_chart(fig)
 
 
-def ride_sharing_preference_map(connection):
-    st.markdown("<h2 class='title'>Ride Sharing Preference based on Location</h2>", unsafe_allow_html=True)
-
-    # Load the shapefile
-    shapefile_path = "data/dataFiles/taxi_zones/taxi_zones.shp"
-    gdf = gpd.read_file(shapefile_path)
-
-    # Execute SQL query and fetch data
-    query = """
-    SELECT
-        tz.LocationID,
-        tz.Borough,
-        tz.Zone,
-        COALESCE(COUNT(CASE WHEN yt.Passenger_count = 1 THEN 1 END), 0) AS IndividualRides,
-        COALESCE(COUNT(CASE WHEN yt.Passenger_count > 1 THEN 1 END), 0) AS SharedRides,
-        COALESCE(MAX(yt.Passenger_count), 0) AS MaxPassengerCount,
-        CASE
-            WHEN COALESCE(SUM(CASE WHEN yt.Passenger_count > 1 THEN 1 ELSE 0 END), 0) = 0 THEN 0
-            ELSE (COALESCE(SUM(CASE WHEN yt.Passenger_count > 1 THEN 1 ELSE 0 END), 0) * 100.0) / COALESCE(SUM(CASE WHEN yt.Passenger_count > 0 THEN 1 ELSE 0 END), 1)
-        END AS SharedPercentage
-    FROM
-        taxi_zone_lookup tz
-    LEFT JOIN
-        yellow_tripdata yt ON yt.PULocationID = tz.LocationID
-    GROUP BY
-        tz.LocationID, tz.Borough, tz.Zone
-    HAVING
-        SharedPercentage > 0 AND SharedPercentage < 100;
-    """
-
-    # Fetch data from the database
-    data = pd.read_sql_query(query, connection)
+@section("ride_sharing_preference_map")
+def ride_sharing_preference_map(merged_gdf):
+    import matplotlib.pyplot as plt
 
-    # Merge the data with the GeoDataFrame
-    merged_gdf = gdf.merge(data, how='left', left_on='LocationID', right_on='LocationID')
-
-    # Highlight top 5 locations with the highest ride-sharing in one color
-    top5_high = merged_gdf.nlargest(5, 'SharedPercentage')
-    top5_high['highlight_color'] = 'green'
-
-    # Highlight top 5 locations with the lowest ride-sharing in another color
-    top5_low = merged_gdf.nsmallest(5, 'SharedPercentage')
-    top5_low['highlight_color'] = 'red'
+    st.markdown("<h2 class='title'>Ride Sharing Preference based on Location</h2>", unsafe_allow_html=True)
 
-    # Combine the highlighted DataFrames
-    highlighted_gdf = pd.concat([top5_high, top5_low])
+    # Highlight top 5 locations with the highest and lowest ride-sharing
+    top5_high, top5_low, highlighted_gdf = top_and_bottom_locations(merged_gdf, 'SharedPercentage')
+    checkpoint('transform')
 
     # Dynamic colormap selection
     colormap = st.selectbox("Select Colormap:", ["viridis", "plasma", "inferno", "magma", "cividis", "coolwarm"])
@@ -130,22 +98,11 @@ def ride_sharing_preference_map(connection):
     """)
 
 
-def payment_type_distribution(connection):
+@section("payment_type_distribution")
+def payment_type_distribution(result):
+    import plotly.express as px
+
     st.markdown("<h2 class='title'>Customer Payment Type Preference Analysis</h2>", unsafe_allow_html=True)
-    # Execute SQL query and load results into a DataFrame
-    query = f"""
-        SELECT 
-            CASE 
-                WHEN payment_type = 1 THEN 'Credit Card'
-                WHEN payment_type = 2 THEN 'Cash'
-                ELSE 'Others'
-            END as PaymentCategory,
-            COUNT(*) as Count
-        FROM yellow_tripdata
-        GROUP BY PaymentCategory
-    """
-    # Execute the query and fetch results
-    result = pd.read_sql_query(query, connection)
 
     st.subheader("💳 Credit Card is the most preferred mode of payment among customers")
 
@@ -155,28 +112,11 @@ def payment_type_distribution(connection):
     st.plotly_chart(fig)
 
 
-def payment_type_by_location(connection):
-    st.markdown("<h2 class='title'>Customer Payment Type Preference by Pickup Location</h2>", unsafe_allow_html=True)
-
-    # Execute SQL query and load results into a DataFrame
-    query = """
-        SELECT 
-            tzl.Borough,
-            CASE 
-                WHEN ytd.Payment_type = 1 THEN 'Credit Card'
-                WHEN ytd.Payment_type = 2 THEN 'Cash'
-                ELSE 'Others (No charge, Dispute, Unknown, Voided trip)'
-            END as PaymentCategory,
-            COUNT(*) as Count
-        FROM yellow_tripdata ytd
-        JOIN taxi_zone_lookup tzl ON ytd.PULocationID = tzl.LocationID
-        GROUP BY tzl.Borough, PaymentCategory;
-    """
-    # Execute the query and fetch results
-    result = pd.read_sql_query(query, connection)
+@section("payment_type_by_location")
+def payment_type_by_location(result):
+    import plotly.express as px
 
-    # Calculate percentage for each payment category within each pickup location
-    result['Percentage'] = result.groupby('Borough')['Count'].transform(lambda x: x / x.sum() * 100)
+    st.markdown("<h2 class='title'>Customer Payment Type Preference by Pickup Location</h2>", unsafe_allow_html=True)
 
     # Plot using Plotly Express with a bigger size and logarithmic y-axis scale
     fig = px.bar(result, x='Borough', y='Count', color='PaymentCategory', barmode='group',
@@ -207,49 +147,37 @@ def payment_type_by_location(connection):
     """)
 
 
-def spending_patterns_map(connection):
-    st.markdown("<h2 class='title'>Customer Spending Patterns based on their Location</h2>", unsafe_allow_html=True)
+@section("spending_percentiles")
+def spending_percentiles(percentiles):
+    import plotly.express as px
 
-    # Load the shapefile
-    shapefile_path = "data/dataFiles/taxi_zones/taxi_zones.shp"
-    gdf = gpd.read_file(shapefile_path)
-
-    # Execute SQL query and fetch data
-    query = """
-    SELECT
-        tz.LocationID,
-        tz.Borough,
-        tz.Zone,
-        COALESCE(AVG(yt.total_amount), 0) AS AvgTotalSpendingAmount
-    FROM
-        taxi_zone_lookup tz
-    LEFT JOIN
-        yellow_tripdata yt ON yt.PULocationID = tz.LocationID
-    GROUP BY
-        tz.LocationID, tz.Borough, tz.Zone
-    HAVING
-        AvgTotalSpendingAmount > 0;  -- Exclude locations with AvgTotalSpendingAmount of 0
-    """
+    st.markdown("<h2 class='title'>Customer Spending Percentiles based on their Location</h2>", unsafe_allow_html=True)
+    if percentiles is None:
+        st.info("Percentiles need the quantile sketches, build them with dataLoader/build_quantile_sketches.py --rebuild.")
+        return
 
-    # Fetch data from the database
-    data = pd.read_sql_query(query, connection)
+    # Same trips as the spending map: yellow taxi total amounts by pickup zone
+    by_borough, by_zone = percentiles
 
-    # Close SQLite connection
-    connection.close()
+    fig = px.bar(by_borough.melt(id_vars='Borough', value_vars=['p50', 'p90', 'p95'], var_name='Percentile', value_name='TotalAmount'),
+                 x='Borough', y='TotalAmount', color='Percentile', barmode='group',
+                 title='Median and Tail Spending by Pickup Borough')
+    st.plotly_chart(fig)
 
-    # Merge the data with the GeoDataFrame
-    merged_gdf = gdf.merge(data, how='left', left_on='LocationID', right_on='LocationID')
+    # Medians are not pulled up by a handful of outlier fares, unlike the averages below
+    st.subheader('Top 5 Locations with Highest Median Spending:')
+    st.table(by_zone.nlargest(5, 'p50').rename(columns={'PULocationID': 'LocationID'}).reset_index(drop=True))
 
-    # Highlight top 5 locations with the highest average spending in one color
-    top5_high = merged_gdf.nlargest(5, 'AvgTotalSpendingAmount')
-    top5_high['highlight_color'] = 'green'
 
-    # Highlight top 5 locations with the lowest average spending in another color
-    top5_low = merged_gdf.nsmallest(5, 'AvgTotalSpendingAmount')
-    top5_low['highlight_color'] = 'red'
+@section("spending_patterns_map")
+def spending_patterns_map(merged_gdf):
+    import matplotlib.pyplot as plt
+
+    st.markdown("<h2 class='title'>Customer Spending Patterns based on their Location</h2>", unsafe_allow_html=True)
 
-    # Combine the highlighted DataFrames
-    highlighted_gdf = pd.concat([top5_high, top5_low])
+    # Highlight top 5 locations with the highest and lowest average spending
+    top5_high, top5_low, highlighted_gdf = top_and_bottom_locations(merged_gdf, 'AvgTotalSpendingAmount')
+    checkpoint('transform')
 
     # Dynamic colormap selection
     colormap_ = st.selectbox("Select Colormap:", ["inferno", "viridis", "plasma", "magma", "cividis", "coolwarm"])
@@ -300,20 +228,35 @@ def spending_patterns_map(connection):
 
 
 def main():
+    # Serve the exported snapshot without touching the database, when one is configured
+    if serve_snapshot(__file__):
+        return
+
+    # Sidebar toggle for the query performance panel
+    performance_panel_toggle("Customer Behavior")
+
+    # Warm the cache in the background if the app was opened on this page
+    start_warmup()
+
     connection = connect_to_database()
 
     st.markdown("<h1 class='title'>Customer Behavior Dashboard</h1>", unsafe_allow_html=True)
 
-    # Plotting each chart from the main function
-    passenger_count_trends(connection)
-    ride_sharing_preference_map(connection)
-    payment_type_distribution(connection)
-    payment_type_by_location(connection)
-    spending_patterns_map(connection)
-
-    # Close SQLite connection
+    # Fetch the data of every chart, then close the SQLite connection
+    data = fetch_customer_data(connection)
     connection.close()
 
+    # Plotting each chart from the main function
+    passenger_count_trends(data['passenger_count'])
+    ride_sharing_preference_map(data['ride_sharing'])
+    payment_type_distribution(data['payment_type'])
+    payment_type_by_location(data['payment_type_by_location'])
+    spending_percentiles(data['spending_percentiles'])
+    spending_patterns_map(data['spending_patterns'])
+
+    # Query timings for this rerun
+    render_performance_panel()
+
 
 if __name__ == "__main__":
     main()
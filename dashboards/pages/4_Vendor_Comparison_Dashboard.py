@@ -1,8 +1,18 @@
-import streamlit as st
 import pandas as pd
-import plotly.express as px
-import geopandas as gpd
-import matplotlib.pyplot as plt
+import streamlit as st
+
+from dataAccess.cache import cached
+from dataAccess.connection import connect_to_database
+from dataAccess.quantiles import load_percentiles, sketches_available
+from dataAccess.vendor_data import dominant_service, load_taxi_data, load_taxi_pref, rides_by_service_and_borough
+from dataAccess.vendor_rollup import (ALL_HOURS, ALL_WEEKDAYS, PREF_LABELS, dominant_services, load_dominance_cube,
+                                      load_vendor_rollup, rollup_available, rollup_days, rollup_has_quality, window_sums,
+                                      window_taxi_pref, window_taxi_stats)
+from dataAccess.spans import checkpoint, section
+from dataAccess.zones import load_shapefile, load_zone_lookup
+from pageUtils.performance_panel import performance_panel_toggle, render_performance_panel
+from pageUtils.quality_filter import quality_filter_control
+from pageUtils.snapshot import serve_snapshot
 
 # Apply custom CSS style for center-aligned titles
 st.markdown(
@@ -16,23 +26,58 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-def load_taxi_data(filepath):
-    return pd.read_csv(filepath)
-
-
-def load_shapefile(filepath):
-    return gpd.read_file(filepath)
-
-
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday", "Every day"]
+SERVICE_CATEGORIES = sorted(set(PREF_LABELS.values())) + ['NoService']
+
+@section("vendor_window")
+def vendor_tables(connection, clean_only=False):
+    # Statistics and rides per zone of the days and hours picked in the sidebar,
+    # from the vendor rollup, or the static snapshots when it has not been built,
+    # and whether they cover every day and hour of the rollup
+    if not rollup_available(connection):
+        st.info("Build the vendor rollup with dataLoader/build_vendor_rollup.py to compare services over any days and hours.")
+        return load_taxi_data(), load_taxi_pref(), False
+
+    rollup = cached(load_vendor_rollup)(connection)
+    lookup_df = load_zone_lookup()
+    checkpoint('data')
+    days = rollup_days(rollup)
+    if days is None:
+        st.info("The vendor rollup is empty, rebuild it after loading the trips table.")
+        return load_taxi_data(), load_taxi_pref(), False
+
+    st.sidebar.subheader("Trips compared")
+    selected = st.sidebar.date_input("Pickup days", days, min_value=days[0], max_value=days[1], key="vendor_days")
+    # The end of the range is missing while it is being picked
+    start, end = (selected[0], selected[-1]) if selected else days
+    hours = st.sidebar.slider("Pickup hours", 0, 23, (0, 23), key="vendor_hours")
+
+    # The whole period also counts the trips loaded without a pickup time
+    if (start, end) == days:
+        start, end = None, None
+    sums = window_sums(rollup, start, end, hours, clean_only)
+    checkpoint('transform')
+    whole = start is None and hours == (0, 23)
+    return window_taxi_stats(sums, lookup_df), window_taxi_pref(sums, lookup_df), whole
+
+
+@section("plot_avg_fare_per_distance")
 def plot_avg_fare_per_distance(df_combined):
+    import plotly.express as px
+
     df_combined = df_combined[df_combined['Borough'] != 'EWR']
+    checkpoint('transform')
     st.markdown("<h2 class='title'>Comparing Taxi Services based on Average Fare Per Unit Distance</h2>", unsafe_allow_html=True)
     fig = px.bar(df_combined, x='Borough', y='AvgFarePerUnitDistance', color='Service', barmode='group')
     st.plotly_chart(fig)
 
 
+@section("plot_avg_trip_time_per_distance")
 def plot_avg_trip_time_per_distance(df_combined):
+    import plotly.express as px
+
     df_combined = df_combined[df_combined['Borough'] != 'EWR']
+    checkpoint('transform')
     st.markdown("<h2 class='title'>Comparing Taxi Services based on Average Trip Time Per Unit Distance</h2>", unsafe_allow_html=True)
     fig = px.bar(df_combined, x='Borough', y='AvgTripTimePerUnitDistance', color='Service', barmode='group')
     st.plotly_chart(fig)
@@ -52,10 +97,61 @@ def plot_avg_trip_time_per_distance(df_combined):
     st.subheader("🚕 Uber and Lyft are considered to provide better services overall, as they offer a combination of comparable fares and lower trip times.")
 
 
-def plot_geolocation_chart(gdf, result_df_max):
+@section("plot_percentiles")
+def plot_percentiles(connection):
+    import plotly.express as px
+
+    st.markdown("<h2 class='title'>Comparing Taxi Services based on Fare and Trip Time Percentiles</h2>", unsafe_allow_html=True)
+    if not sketches_available(connection):
+        st.info("Percentiles need the quantile sketches, build them with dataLoader/build_quantile_sketches.py --rebuild.")
+        return
+
+    metrics = {"Total Fare": "fare", "Trip Time (seconds)": "duration"}
+    label = st.selectbox("Select Measure:", list(metrics))
+    df = cached(load_percentiles, metric=metrics[label], by=('Borough', 'service'), quantiles=(0.25, 0.5, 0.9))(connection)
+    checkpoint('data')
+
+    df = df[~df['Borough'].isin(['EWR', 'Unknown'])]
+    # Bars show the median, whiskers go down to p25 and up to p90
+    df['upper'] = df['p90'] - df['p50']
+    df['lower'] = df['p50'] - df['p25']
+    checkpoint('transform')
+
+    fig = px.bar(df, x='Borough', y='p50', color='service', barmode='group', error_y='upper', error_y_minus='lower',
+                 labels={'p50': f'Median {label}', 'service': 'Service'})
+    st.plotly_chart(fig)
+    st.dataframe(df[['Borough', 'service', 'trips', 'p25', 'p50', 'p90']], hide_index=True)
+
+
+@section("plot_geolocation_chart")
+def plot_geolocation_chart(gdf, result_df_max, cube=None):
     st.markdown("<h2 class='title'>Taxi Service Dominance based on the Location</h2>", unsafe_allow_html=True)
+    if cube is not None:
+        # Only the map reruns when the hour or the day changes
+        st.fragment(dominance_by_hour)(gdf, cube)
+        return
+
     gdf = gdf.merge(result_df_max[['LocationID', 'Service']], on='LocationID', how='left')
-    gdf['Service'] = gdf['Service'].fillna('NoService')
+    # Service is categorical, back to plain labels before adding 'NoService'
+    gdf['Service'] = gdf['Service'].astype(object).fillna('NoService')
+    checkpoint('transform')
+    render_dominance(gdf)
+
+
+def dominance_by_hour(gdf, cube):
+    # Dominant services read from the precomputed cube, no query per slider move
+    st.caption("Narrow the pickup days or hours in the sidebar to map the dominant services of those trips only.")
+    weekday = st.selectbox("Select Day:", range(len(WEEKDAYS)), format_func=WEEKDAYS.__getitem__, index=ALL_WEEKDAYS)
+    hour = st.select_slider("Select Hour of Day:", options=list(range(ALL_HOURS + 1)), value=ALL_HOURS,
+                            format_func=lambda h: "All hours" if h == ALL_HOURS else f"{h:02d}:00")
+    services = pd.Series(dominant_services(cube, gdf['LocationID'], weekday, hour), index=gdf.index)
+    # Fixed categories keep each service's colour when the hour changes
+    gdf = gdf.assign(Service=pd.Categorical(services.fillna('NoService'), categories=SERVICE_CATEGORIES))
+    render_dominance(gdf)
+
+
+def render_dominance(gdf):
+    import matplotlib.pyplot as plt
 
     colormap = st.selectbox("Select Colormap:", ["viridis", "plasma", "inferno", "magma", "cividis", "coolwarm"])
 
@@ -83,9 +179,13 @@ def plot_geolocation_chart(gdf, result_df_max):
     st.table(yellow_taxi_locations)  
 
 
+@section("plot_rides_by_service_and_borough")
 def plot_rides_by_service_and_borough(result_df):
+    import plotly.express as px
+
     st.markdown("<h2 class='title'>Number of Rides by Taxi Service and Borough</h2>", unsafe_allow_html=True)
-    grouped_df = result_df.groupby(['Borough', 'Service']).sum().reset_index()
+    grouped_df = rides_by_service_and_borough(result_df)
+    checkpoint('transform')
     fig = px.bar(grouped_df, x='Borough', y='NumberOfRides', color='Service', title='Number of Rides by Service and Borough')
     st.plotly_chart(fig)
 
@@ -107,15 +207,22 @@ def plot_rides_by_service_and_borough(result_df):
 
 
 def main():
+    # Serve the exported snapshot without touching the database, when one is configured
+    if serve_snapshot(__file__):
+        return
+
+    # Sidebar toggle for the performance panel
+    performance_panel_toggle("Vendor Comparison")
+
     st.markdown("<h1 class='title'>Vendor Comparison Dashboard</h1>", unsafe_allow_html=True)
 
-    # Load data
-    taxi_stats_filepath = 'data/dataFiles/taxi_stats.csv'
-    df_combined = load_taxi_data(taxi_stats_filepath)
+    # Load data of the selected days and hours
+    connection = connect_to_database()
+    clean_only = quality_filter_control(rollup_available(connection) and rollup_has_quality(connection))
+    df_combined, result_df, whole = vendor_tables(connection, clean_only)
 
     # Load shapefile
-    shapefile_path = "data/dataFiles/taxi_zones/taxi_zones.shp"
-    gdf = load_shapefile(shapefile_path)
+    gdf = load_shapefile()
 
     # Chart 1
     plot_avg_fare_per_distance(df_combined)
@@ -123,19 +230,26 @@ def main():
     # Chart 2
     plot_avg_trip_time_per_distance(df_combined)
 
-    # Load data for geolocation chart
-    taxi_pref_filepath = 'data/dataFiles/taxi_pref.csv'
-    result_df = pd.read_csv(taxi_pref_filepath)
+    # Percentiles from the quantile sketches
+    plot_percentiles(connection)
+
+    # Dominant service per zone, day of the week and hour over every loaded day.
+    # A narrower sidebar window maps the rides of that window instead.
+    cube = cached(load_dominance_cube, clean_only=clean_only)(connection) if whole else None
+    connection.close()
 
     # Find the service with the highest ride count for each location
-    result_df_max = result_df.loc[result_df.groupby('LocationID')['NumberOfRides'].idxmax()]
+    result_df_max = dominant_service(result_df)
 
     # Geolocation chart
-    plot_geolocation_chart(gdf, result_df_max)
+    plot_geolocation_chart(gdf, result_df_max, cube)
 
     # Rides by service and borough chart
     plot_rides_by_service_and_borough(result_df)
 
+    # Section timings for this rerun
+    render_performance_panel()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
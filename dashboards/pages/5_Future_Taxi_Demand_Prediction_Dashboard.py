@@ -1,10 +1,19 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import folium
-import geopandas as gpd
-from streamlit_folium import folium_static
-import sqlite3
+
+from dataAccess.cache import cached
+from dataAccess.connection import connect_to_database
+from dataAccess.prediction_data import (
+    HOURLY_PREDICTION_CSV,
+    LOCATION_PREDICTION_CSV,
+    hourly_demand_for_day,
+    join_location_predictions,
+    load_predicted_demand_by_borough,
+    load_predictions,
+)
+from dataAccess.spans import checkpoint, section
+from dataAccess.zones import load_geojson, load_zone_lookup
+from pageUtils.performance_panel import performance_panel_toggle, render_performance_panel
+from pageUtils.snapshot import serve_snapshot
 
 # Apply custom CSS style for center-aligned titles
 st.markdown(
@@ -18,14 +27,21 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+@section("predict_taxi_demand")
 def predict_taxi_demand():
+    import plotly.express as px
+    import folium
+    from streamlit_folium import folium_static
+
     # Load data from CSV
-    df_time_prediction = pd.read_csv('data/predictedData/hourly_pred.csv')
-    df_location_prediction = pd.read_csv('data/predictedData/location_pred.csv')
-    df_taxi_zone_lookup = pd.read_csv('data/dataFiles/taxi+_zone_lookup.csv')
+    df_time_prediction = load_predictions(HOURLY_PREDICTION_CSV)
+    df_location_prediction = load_predictions(LOCATION_PREDICTION_CSV)
+    df_taxi_zone_lookup = load_zone_lookup()
+    checkpoint('data')
 
     # Filter data for day_of_the_month = 28.0
-    filtered_data = df_time_prediction[df_time_prediction['day_of_the_month'] == 28.0]
+    filtered_data = hourly_demand_for_day(df_time_prediction, 28.0)
+    checkpoint('transform')
 
     # Streamlit app
     st.markdown("<h2 class='title'>Predicted Future Taxi Demand in Specific Areas and Times</h2>", unsafe_allow_html=True)
@@ -54,12 +70,15 @@ def predict_taxi_demand():
 
     # Show the plot
     st.plotly_chart(fig)
+    checkpoint('render')
 
     # Filtered data for location prediction
-    joined_data = pd.merge(df_location_prediction, df_taxi_zone_lookup, how='inner', left_on='PULocationID', right_on='LocationID')
+    joined_data = join_location_predictions(df_location_prediction, df_taxi_zone_lookup)
+    checkpoint('transform')
 
     # Load the GeoJSON data.
-    geojson_data = gpd.read_file("data/dataFiles/NYC_Taxi_Zones.geojson")
+    geojson_data = load_geojson()
+    checkpoint('data')
 
     # NYC GeoJSON
     nyc_geo = geojson_data
@@ -89,25 +108,14 @@ def predict_taxi_demand():
     else:
         st.warning("No valid data available for the specified query.")
     
+@section("plot_predicted_demand_by_borough")
 def plot_predicted_demand_by_borough(connection):
-    try:
-        # SQL query to join tables and filter data
-        borough_query = '''
-            SELECT
-                tz.Borough,
-                SUM(l.prediction) AS TotalPrediction
-            FROM
-                location_prediction l
-            JOIN
-                taxi_zone_lookup tz
-            ON
-                l.PULocationID = tz.LocationID
-            GROUP BY
-                tz.Borough;
-        '''
+    import plotly.express as px
 
+    try:
         # Execute the query and load results into a DataFrame
-        borough_query_data = pd.read_sql_query(borough_query, connection)
+        borough_query_data = cached(load_predicted_demand_by_borough)(connection)
+        checkpoint('data')
 
         # Custom colors for the bar chart
         custom_colors = ['#3498db', '#e74c3c', '#2ecc71', '#f39c12', '#9b59b6', '#34495e', '#1abc9c', '#d35400']
@@ -141,19 +149,28 @@ def plot_predicted_demand_by_borough(connection):
 
 
 def main():
+    # Serve the exported snapshot without touching the database, when one is configured
+    if serve_snapshot(__file__):
+        return
+
+    # Sidebar toggle for the query performance panel
+    performance_panel_toggle("Future Taxi Demand Prediction")
     st.markdown("<h1 class='title'>Future Taxi Demand Prediction Dashboard</h1>", unsafe_allow_html=True)
 
     # Call the plot function with the CSV path
     predict_taxi_demand()
 
     # Connect to the database
-    connection = sqlite3.connect('nyc_taxi_database.db')
+    connection = connect_to_database()
     
     plot_predicted_demand_by_borough(connection)
 
     # Close the database connection
     connection.close()
 
+    # Query timings for this rerun
+    render_performance_panel()
+
 
 if __name__ == "__main__":
     main()
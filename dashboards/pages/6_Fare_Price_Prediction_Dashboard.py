@@ -1,7 +1,16 @@
 import streamlit as st
-import pandas as pd
-import plotly.graph_objects as go
-import matplotlib.pyplot as plt
+
+from dataAccess.prediction_data import (
+    FARE_PREDICTION_CSV,
+    fare_heatmap,
+    load_predictions,
+    lookup_mean_prediction,
+    merge_zone_names,
+)
+from dataAccess.spans import checkpoint, section
+from dataAccess.zones import load_zone_lookup
+from pageUtils.performance_panel import performance_panel_toggle, render_performance_panel
+from pageUtils.snapshot import serve_snapshot
 
 # Define the trip distance threshold
 trip_distance_threshold = 0.2
@@ -18,22 +27,14 @@ st.markdown(
 )
 
 # Function to plot interactive heatmap
+@section("plot_heatmap")
 def plot_heatmap(df, lookup_df):
-    st.markdown("<h2 class='title'>Predicted Fare for Pickup and Dropoff Borough Location</h2>", unsafe_allow_html=True)
-    # Merge with lookup table to get Borough for PU and DO LocationID
-    df_merged = pd.merge(df, lookup_df[['LocationID', 'Borough']], left_on='PULocationID', right_on='LocationID', how='left')
-    df_merged.rename(columns={'Borough': 'PUBorough'}, inplace=True)
-    df_merged = pd.merge(df_merged, lookup_df[['LocationID', 'Borough']], left_on='DOLocationID', right_on='LocationID', how='left')
-    df_merged.rename(columns={'Borough': 'DOBorough'}, inplace=True)
+    import plotly.graph_objects as go
 
-    # Filter out rows with small trip distances and specific days
-    df_filtered = df_merged[
-        (df_merged['trip_distance'] > trip_distance_threshold) &
-        ((df_merged['day_of_the_month'] == 29) | (df_merged['day_of_the_month'] == 30))
-    ]
-
-    # Group by PU and DO Borough and calculate mean of fare prediction
-    grouped_df = df_filtered.groupby(['PUBorough', 'DOBorough']).mean().reset_index()
+    st.markdown("<h2 class='title'>Predicted Fare for Pickup and Dropoff Borough Location</h2>", unsafe_allow_html=True)
+    # Merge with the lookup table, keep the selected days and average the fare prediction per borough pair
+    grouped_df = fare_heatmap(df, lookup_df, trip_distance_threshold)
+    checkpoint('transform')
 
     # Create a heatmap using Plotly
     fig = go.Figure(go.Heatmap(
@@ -57,8 +58,12 @@ def plot_heatmap(df, lookup_df):
 
 
 # Function to plot scatter plot
+@section("plot_scatter")
 def plot_scatter(df):
+    import matplotlib.pyplot as plt
+
     filtered_df = df[(df['day_of_the_month'].isin([29, 30])) & (df['trip_distance'] > trip_distance_threshold) & (df['trip_distance'] <= 1000)]
+    checkpoint('transform')
 
     st.markdown("<h2 class='title'>Taxi Predicted Fare vs Trip Distance</h2>", unsafe_allow_html=True)
 
@@ -72,10 +77,11 @@ def plot_scatter(df):
 
 
 # Function for the Taxi Fare Prediction App
+@section("taxi_fare_prediction_app")
 def taxi_fare_prediction_app(df, lookup_df):
     st.markdown("<h2 class='title'>Taxi Fare Price Prediction App</h2>", unsafe_allow_html=True)
-    merged_data = df.merge(lookup_df, left_on='PULocationID', right_on='LocationID', how='left', suffixes=('_PU', '_DO'))
-    merged_data = merged_data.merge(lookup_df, left_on='DOLocationID', right_on='LocationID', how='left', suffixes=('_PU', '_DO'))
+    merged_data = merge_zone_names(df, lookup_df)
+    checkpoint('transform')
 
     default_pu_location = 'Bay Ridge'
     default_do_location = 'JFK Airport'
@@ -94,28 +100,35 @@ def taxi_fare_prediction_app(df, lookup_df):
     if pu_location == do_location:
         st.warning('Please select different pickup and drop-off locations.')
     else:
-        filtered_data = merged_data[(merged_data['Zone_PU'] == pu_location) & (merged_data['Zone_DO'] == do_location) & (
-                    merged_data['hour_of_day'] == selected_hour)]
+        predicted_fare_mean = lookup_mean_prediction(merged_data, pu_location, do_location, selected_hour)
+        checkpoint('transform')
 
-        if not filtered_data.empty:
-            predicted_fare_mean = filtered_data['prediction'].mean()
+        if predicted_fare_mean is not None:
             st.success(f'Predicted Fare: ${predicted_fare_mean:.2f}')
         else:
             st.warning('No prediction available for the selected criteria.')
 
 
 def main():
+    # Serve the exported snapshot without touching the database, when one is configured
+    if serve_snapshot(__file__):
+        return
+
+    # Sidebar toggle for the performance panel
+    performance_panel_toggle("Fare Price Prediction")
+
     st.markdown("<h1 class='title'>Fare Price Prediction Dashboard</h1>", unsafe_allow_html=True)
 
-    taxi_fare_prediction = 'data/predictedData/fare_predictions.csv'
-    lookup_table = 'data/dataFiles/taxi+_zone_lookup.csv'
-    df = pd.read_csv(taxi_fare_prediction)
-    lookup_df = pd.read_csv(lookup_table)
+    df = load_predictions(FARE_PREDICTION_CSV)
+    lookup_df = load_zone_lookup()
 
     taxi_fare_prediction_app(df, lookup_df)
     plot_heatmap(df, lookup_df)
     plot_scatter(df)
 
+    # Section timings for this rerun
+    render_performance_panel()
+
 
 if __name__ == "__main__":
     main()
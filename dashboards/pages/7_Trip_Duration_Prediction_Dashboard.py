@@ -1,7 +1,16 @@
 import streamlit as st
-import pandas as pd
-import plotly.graph_objects as go
-import matplotlib.pyplot as plt
+
+from dataAccess.prediction_data import (
+    TRIP_DURATION_PREDICTION_CSV,
+    load_predictions,
+    lookup_mean_prediction,
+    merge_zone_names,
+    trip_duration_heatmap,
+)
+from dataAccess.spans import checkpoint, section
+from dataAccess.zones import load_zone_lookup
+from pageUtils.performance_panel import performance_panel_toggle, render_performance_panel
+from pageUtils.snapshot import serve_snapshot
 
 st.markdown(
     """
@@ -18,21 +27,14 @@ st.markdown(
 trip_duration_threshold = 5
 
 # Function to plot interactive heatmap for trip duration
+@section("plot_heatmap_duration")
 def plot_heatmap_duration(df, lookup_df):
-    st.markdown("<h2 class='title'>Predicted Trip Duration for Pickup and Dropoff Borough Location</h2>", unsafe_allow_html=True)
-    # Merge with lookup table to get Borough for PU and DO LocationID
-    df_merged = pd.merge(df, lookup_df[['LocationID', 'Borough']], left_on='PULocationID', right_on='LocationID', how='left')
-    df_merged.rename(columns={'Borough': 'PUBorough'}, inplace=True)
-    df_merged = pd.merge(df_merged, lookup_df[['LocationID', 'Borough']], left_on='DOLocationID', right_on='LocationID', how='left')
-    df_merged.rename(columns={'Borough': 'DOBorough'}, inplace=True)
+    import plotly.graph_objects as go
 
-    # Filter out rows with small trip durations and specific days
-    df_filtered = df_merged[
-        (df_merged['prediction'] > trip_duration_threshold)
-    ]
-
-    # Group by PU and DO Borough and calculate mean of duration prediction
-    grouped_df = df_filtered.groupby(['PUBorough', 'DOBorough']).mean().reset_index()
+    st.markdown("<h2 class='title'>Predicted Trip Duration for Pickup and Dropoff Borough Location</h2>", unsafe_allow_html=True)
+    # Merge with the lookup table, drop short trips and average the duration prediction per borough pair
+    grouped_df = trip_duration_heatmap(df, lookup_df, trip_duration_threshold)
+    checkpoint('transform')
 
     # Create a heatmap using Plotly
     fig = go.Figure(go.Heatmap(
@@ -55,8 +57,12 @@ def plot_heatmap_duration(df, lookup_df):
     st.write("Darker heatmap color represents a longer trip duration")
 
 # Function to plot scatter plot for trip duration
+@section("plot_scatter_duration")
 def plot_scatter_duration(df):
+    import matplotlib.pyplot as plt
+
     filtered_df = df[(df['prediction'] > trip_duration_threshold)  & (df['trip_distance'] <= 40)]
+    checkpoint('transform')
 
     st.markdown("<h2 class='title'>Taxi Predicted Trip Duration vs Trip Distance</h2>", unsafe_allow_html=True)
 
@@ -69,10 +75,11 @@ def plot_scatter_duration(df):
     st.pyplot(fig)
 
 # Function for the Taxi Trip Duration Prediction App
+@section("taxi_trip_duration_prediction_app")
 def taxi_trip_duration_prediction_app(df, lookup_df):
     st.markdown("<h2 class='title'>Taxi Trip Duration Prediction App</h2>", unsafe_allow_html=True)
-    merged_data = df.merge(lookup_df, left_on='PULocationID', right_on='LocationID', how='left', suffixes=('_PU', '_DO'))
-    merged_data = merged_data.merge(lookup_df, left_on='DOLocationID', right_on='LocationID', how='left', suffixes=('_PU', '_DO'))
+    merged_data = merge_zone_names(df, lookup_df)
+    checkpoint('transform')
 
     default_pu_location = 'Bay Ridge'
     default_do_location = 'JFK Airport'
@@ -88,26 +95,35 @@ def taxi_trip_duration_prediction_app(df, lookup_df):
     if pu_location == do_location:
         st.warning('Please select different pickup and drop-off locations.')
     else:
-        filtered_data = merged_data[(merged_data['Zone_PU'] == pu_location) & (merged_data['Zone_DO'] == do_location)]
+        predicted_duration_mean = lookup_mean_prediction(merged_data, pu_location, do_location)
+        checkpoint('transform')
 
-        if not filtered_data.empty:
-            predicted_duration_mean = filtered_data['prediction'].mean()
+        if predicted_duration_mean is not None:
             st.success(f'Predicted Trip Duration: {predicted_duration_mean:.2f} minutes')
         else:
             st.warning('No prediction available for the selected criteria.')
 
 # Main function
 def main():
+    # Serve the exported snapshot without touching the database, when one is configured
+    if serve_snapshot(__file__):
+        return
+
+    # Sidebar toggle for the performance panel
+    performance_panel_toggle("Trip Duration Prediction")
+
     st.markdown("<h1 class='title'>Trip Duration Prediction Dashboard</h1>", unsafe_allow_html=True)
 
-    trip_duration_prediction_file = 'data/predictedData/trip_duration_pred.csv'  # Update with the correct file path
-    lookup_table = 'data/dataFiles/taxi+_zone_lookup.csv'
-    df_trip_duration = pd.read_csv(trip_duration_prediction_file)
-    lookup_df = pd.read_csv(lookup_table)
+    df_trip_duration = load_predictions(TRIP_DURATION_PREDICTION_CSV)
+    lookup_df = load_zone_lookup()
 
     taxi_trip_duration_prediction_app(df_trip_duration, lookup_df)
     plot_heatmap_duration(df_trip_duration, lookup_df)
     plot_scatter_duration(df_trip_duration)
 
+    # Section timings for this rerun
+    render_performance_panel()
+
+
 if __name__ == "__main__":
     main()